@@ -71,6 +71,9 @@ NOTE: see here for some ANSI art fun:
       https://en.wikipedia.org/wiki/ANSI_art
 """
 
+import functools
+import os
+
 
 # === Exceptions ===
 class OutOfRangeError(Exception):
@@ -84,8 +87,12 @@ class ArgParseError(Exception):
 
 
 def check_num_range(num, lower=0, upper=0, return_as_str=False):
+    # fast path: the common case of an int already in range
+    if type(num) == int and lower <= num <= upper:
+        return str(num) if return_as_str else num
+
     assert type(upper) == int, f"upper must be int, is {type(upper)}"
-    assert type(lower) == int, f"lower must be int, is {type(lowwer)}"
+    assert type(lower) == int, f"lower must be int, is {type(lower)}"
 
     if type(num) == str and num.isdigit():
         num = int(num)
@@ -93,7 +100,7 @@ def check_num_range(num, lower=0, upper=0, return_as_str=False):
         raise InvalidTypeError("Must be an integer or castable as such")
 
     if num < lower or num > upper:
-        raise OutOfRangeError(f"{len(upper-lower+1)} parameters supportable, indexed [{lower}-{upper}]")
+        raise OutOfRangeError(f"{upper-lower+1} parameters supportable, indexed [{lower}-{upper}]")
 
     return str(num) if return_as_str else num
 
@@ -160,7 +167,7 @@ HIDE_OFF = "28"
 STRIKE_OFF = "29"
 # 30-37; set foreground color to one of the 8 primary/standard colors (3-bit)
 # can use one of the 8 primary color constants defined below
-FG_3BIT_FN = FG_PRIMARY_FN = lambda num: str(30 + check_num_range(num, 0, 7))
+FG_3BIT_FN = FG_PRIMARY_FN = lambda num: FG_16[check_num_range(num, 0, 7)]
 # bold varients of 30-37, ie 1;30 - 1;37
 # these were the original "bright" FG values before 90-97 were introduced
 # and now are differentiated (look different), at least in iTerm2 and Terminal.app
@@ -171,7 +178,7 @@ FG_BOLD_3BIT_FN = FG_BOLD_PRIMARY_FN = lambda num: ';'.join((BOLD, FG_3BIT_FN(nu
 #   [8-15]: high intensity colors (as in [90-97])
 #   [16-231]: 6 x 6 x 6 cube (216 colors): 16 + 36 x r + 6 x g + b (0 <= r, g, b <= 5)
 #   [232-255]: grayscale from dark to light in 24 steps
-FG_8BIT_FN = lambda num: f"38;5;{check_num_range(num, 0, 255)}"
+FG_8BIT_FN = lambda num: FG_8BIT[check_num_range(num, 0, 255)]
 # another way to set foreground to one of the 8 primary colors
 # note: identical inputs to and color result of FT_3BIT_FN / FT_PRIMARY_FN
 FG_8BIT_PRIMARY_FN = lambda num: FG_8BIT_FN(check_num_range(num, 0, 7))
@@ -193,12 +200,14 @@ FG_8BIT_GREY_FN = lambda num: FG_8BIT_FN(check_num_range(num+232, 232, 255))
 # for 24 bit (16,777,216 colors) selection
 # or for older terminals, more limited 16 bit (65,536 colors)
 # Xterm, KDE's Konsole, iTerm, libvte family like GNOME Terminal all suport 24
-FG_24BIT_FN = lambda r,g,b: f"38;2;{check_num_range(r, 0, 255)};{check_num_range(g, 0, 255)};{check_num_range(b, 0, 255)}"
+# note: brought down to the nearest 8-bit (or 3/4-bit) color instead when
+#       COLORS is set lower, see set_colors
+FG_24BIT_FN = lambda r,g,b: __rgb_attr(r, g, b)
 # default foreground color
 FG_OFF = "39"
 # 40-47; set background color to one of the 8 primary/standard colors (3-bit)
 # can use one of the 8 primary color constants defined below
-BG_3BIT_FN = BG_PRIMARY_FN = lambda num: str(40 + check_num_range(num, 0, 7))
+BG_3BIT_FN = BG_PRIMARY_FN = lambda num: BG_16[check_num_range(num, 0, 7)]
 # bold varients of 40-47; ie 1;40 - 1;47
 # these were the original "bright" BG values before 100-107 were introduced
 # and now are differentiated (look different), at least in iTerm2 and Terminal.app
@@ -209,7 +218,7 @@ BG_BOLD_3BIT_FN = BG_BOLD_PRIMARY_FN = lambda num: ';'.join((BOLD, BG_3BIT_FN(nu
 #   [8-15]: high intensity colors (as in [100-107])
 #   [16-231]: 6 x 6 x 6 cube (216 colors): 16 + 36 x r + 6 x g + b (0 <= r, g, b <= 5)
 #   [232-255]: grayscale from dark to light in 24 steps
-BG_8BIT_FN = lambda num: f"48;5;{check_num_range(num, 0, 255)}"
+BG_8BIT_FN = lambda num: BG_8BIT[check_num_range(num, 0, 255)]
 # another way to set foreground to one of the 8 primary colors
 # note: identical inputs to and color result of FT_3BIT_FN / FT_PRIMARY_FN
 BG_8BIT_PRIMARY_FN = lambda num: BG_8BIT_FN(check_num_range(num, 0, 7))
@@ -231,7 +240,9 @@ BG_8BIT_GREY_FN = lambda num: BG_8BIT_FN(check_num_range(num+232, 232, 255))
 # for 24 bit (16,777,216 colors) selection
 # or for older terminals, more limited 16 bit (65,536 colors)
 # Xterm, KDE's Konsole, iTerm, libvte family like GNOME Terminal all suport 24
-BG_24BIT_FN = lambda r,g,b: f"48;2;{check_num_range(r, 0, 255)};{check_num_range(g, 0, 255)};{check_num_range(b, 0, 255)}"
+# note: brought down to the nearest 8-bit (or 3/4-bit) color instead when
+#       COLORS is set lower, see set_colors
+BG_24BIT_FN = lambda r,g,b: __rgb_attr(r, g, b, background=True)
 # default background color
 BG_OFF = "49"
 # complements 26, which is rarely supported
@@ -254,11 +265,11 @@ UNDERLINE_COLOR_OFF = "59"
 # 90-97; set foreground color to the bright version of one of the
 # 8 primary/standard colors (3-bit)
 # can use one of the 8 primary color constants defined below
-FG_BRIGHT_3BIT_FN = FG_BRIGHT_PRIMARY_FN = lambda num: str(90 + check_num_range(num, 0, 7))
+FG_BRIGHT_3BIT_FN = FG_BRIGHT_PRIMARY_FN = lambda num: FG_16[8 + check_num_range(num, 0, 7)]
 # 100-107; set background color to the bright (high intensity) version of one of the
 # 8 primary/standard colors (3-bit)
 # can use one of the 8 primary color constants defined below
-BG_BRIGHT_3BIT_FN = BG_BRIGHT_PRIMARY_FN = lambda num: str(100 + check_num_range(num, 0, 7))
+BG_BRIGHT_3BIT_FN = BG_BRIGHT_PRIMARY_FN = lambda num: BG_16[8 + check_num_range(num, 0, 7)]
 
 # == SGR COLORS ==
 
@@ -284,6 +295,20 @@ PRIMARIES = {
     "WHITE": 7,
 }
 
+# -- interned color attributes --
+
+# every 3-bit/8-bit color attribute built once; the *_FN builders above index
+# into these, and Style uses them directly
+
+# 30-37, then their bright versions 90-97; index as in 38;5;<n> for [0-15]
+FG_16 = tuple(str(n) for n in (*range(30, 38), *range(90, 98)))
+# 40-47, then their bright versions 100-107; index as in 48;5;<n> for [0-15]
+BG_16 = tuple(str(n) for n in (*range(40, 48), *range(100, 108)))
+# 38;5;0 - 38;5;255
+FG_8BIT = tuple(f"38;5;{n}" for n in range(256))
+# 48;5;0 - 48;5;255
+BG_8BIT = tuple(f"48;5;{n}" for n in range(256))
+
 # -- SGR helpers ---
 
 def SGR(n, reset_first=True):
@@ -386,19 +411,15 @@ def RGB_CONTENT(
     return __RGB_CONTENT(nlist)
 
 
-def __RGB_HEX_CONTENT(rgb_hex, nlist=[], content=None, literal=False, include_reset=True):
+def HEX_TO_RGB(rgb_hex):
     '''
-    Return 24bit color escape sequence
+    Split an rgb hex string into its r, g, b values
 
     rgb_hex: a single hex string containing the hex values for red, green, blue
        may be prefixed with '#' or not
        r,g,b hex values must have 2 characters each, between 00 and FF
        upper or lower case both fine
-    content: any content to style with the r,g,b color; or None
-    literal: return the escape sequence such that it is literally printable
-    include_reset: terminate sequence and content with normal style reversion
     '''
-
     assert type(rgb_hex) == str, "expected rgb_hex to be a string"
     assert (len(rgb_hex) == 7 and rgb_hex[0] == '#') or len(rgb_hex) == 6, \
         "rgb hex may optionally start with '#'" + \
@@ -407,10 +428,21 @@ def __RGB_HEX_CONTENT(rgb_hex, nlist=[], content=None, literal=False, include_re
     if len(rgb_hex) == 7:
         rgb_hex = rgb_hex[1:]
 
-    r = int(rgb_hex[0:2], 16)
-    g = int(rgb_hex[2:4], 16)
-    b = int(rgb_hex[4:6], 16)
+    return int(rgb_hex[0:2], 16), int(rgb_hex[2:4], 16), int(rgb_hex[4:6], 16)
 
+def __RGB_HEX_CONTENT(rgb_hex, nlist=[], content=None, literal=False, include_reset=True):
+    '''
+    Return 24bit color escape sequence
+
+    rgb_hex: a single hex string containing the hex values for red, green, blue
+       may be prefixed with '#' or not
+       r,g,b hex values must have 2 characters each, between 00 and FF
+       upper or lower case both fine
+    content: any content to style with the r,g,b color; or None
+    literal: return the escape sequence such that it is literally printable
+    include_reset: terminate sequence and content with normal style reversion
+    '''
+    r, g, b = HEX_TO_RGB(rgb_hex)
     return __RGB_CONTENT(r, g, b, nlist, content, literal, include_reset)
 
 def RGB_HEX_CONTENT(
@@ -432,6 +464,932 @@ def RGB_HEX_CONTENT(
     nlist = __optdict_to_nlist(locals())
     return __RGB_HEX_CONTENT(nlist)
 
+# -- SGR styles --
+
+# the n styling options by name, as used by the RGB_* and print_* functions
+STYLE_OPTIONS = {
+    "bold": BOLD,
+    "faint": FAINT,
+    "italics": ITALICS,
+    "underline": UNDERLINE,
+    "dunderline": DUNDERLINE,
+    "slow_blink": SLOW_BLINK,
+    "fast_blink": FAST_BLINK,
+    "invert": INVERT,
+    "hide": HIDE,
+    "strike": STRIKE,
+}
+# number of distinct styles STYLE keeps compiled
+STYLE_CACHE_SIZE = 1024
+
+def COLOR_ATTR(color, background=False):
+    '''
+    Return the display attribute setting the foreground (or background) color;
+    8-bit colors come from the interned tables
+
+    color - an 8-bit color number [0-255], an (r, g, b) tuple, or an rgb hex
+       string (see HEX_TO_RGB)
+    background: set the background color instead of the foreground
+    '''
+    if type(color) == int:
+        return (BG_8BIT if background else FG_8BIT)[check_num_range(color, 0, 255)]
+    elif type(color) == str:
+        color = HEX_TO_RGB(color)
+    elif (type(color) != tuple and type(color) != list) or len(color) != 3:
+        raise InvalidTypeError("color must be an 8-bit number, (r, g, b) or rgb hex string")
+    return (BG_24BIT_FN if background else FG_24BIT_FN)(*color)
+
+class Style:
+    '''
+    A compiled set of display attributes: validated and joined into escape
+    sequences once, so styling content afterwards is just string concatenation
+
+    attrs - display attribute strings, eg BOLD, FG_3BIT_FN(RED), FG_16[9]
+    fg, bg: foreground/background color (see COLOR_ATTR), or None
+    options: n styling options by name (see STYLE_OPTIONS), eg bold=True
+
+      style = Style(fg=202, bold=True)
+      style.seq         "<esc>[0;1;38;5;202m" resets first (see SGR)
+      style.inc_seq     "<esc>[1;38;5;202m" adds onto the current attributes
+      style(content)    seq, content, then reset
+      style.seq_bytes, style.inc_bytes for writing to binary streams
+    '''
+
+    __slots__ = ("attrs", "seq", "inc_seq", "seq_bytes", "inc_bytes")
+
+    def __init__(self, *attrs, fg=None, bg=None, **options):
+        for a in attrs:
+            if type(a) != str or not a.replace(";", "").isdigit():
+                raise InvalidTypeError(f"display attribute must be a numeric string, not {a!r}")
+        nlist = list(attrs)
+        for name, enabled in options.items():
+            if name not in STYLE_OPTIONS:
+                raise InvalidTypeError(f"unknown style option {name!r}")
+            if enabled:
+                nlist.append(STYLE_OPTIONS[name])
+        if fg is not None:
+            nlist.append(COLOR_ATTR(fg))
+        if bg is not None:
+            nlist.append(COLOR_ATTR(bg, background=True))
+
+        self.attrs = tuple(nlist)
+        # no attributes is a plain reset either way
+        self.seq = SGR(self.attrs) if nlist else RESET
+        self.inc_seq = SGR(self.attrs, reset_first=False) if nlist else RESET
+        self.seq_bytes = self.seq.encode()
+        self.inc_bytes = self.inc_seq.encode()
+
+    def __call__(self, content):
+        return self.seq + content + RESET
+
+    def __eq__(self, other):
+        return type(other) == Style and self.attrs == other.attrs
+
+    def __hash__(self):
+        return hash(self.attrs)
+
+    def __repr__(self):
+        return f"Style({', '.join(map(repr, self.attrs))})"
+
+# Style, interned: the same arguments hand back the same compiled Style
+# (colors must be hashable here, ie (r, g, b) tuples rather than lists)
+STYLE = functools.lru_cache(maxsize=STYLE_CACHE_SIZE)(Style)
+
+# bytes of the reset sequence, to pair with Style.seq_bytes
+RESET_BYTES = RESET.encode()
+
+# -- SGR frames --
+
+# upper half block: its fg color paints the upper pixel and its bg color the
+# lower one, so each character cell shows two pixel rows
+HALF_BLOCK = "\u2580"
+# number of distinct colors kept formatted for frames
+FRAME_COLOR_CACHE_SIZE = 65536
+
+@functools.lru_cache(maxsize=FRAME_COLOR_CACHE_SIZE)
+def __frame_attrs(color):
+    # fg and bg attributes for an (r, g, b) color; None is the default color,
+    # used below the last row of an image with an odd number of rows
+    if color is None:
+        return FG_OFF, BG_OFF
+    return COLOR_ATTR(color), COLOR_ATTR(color, background=True)
+
+def __frame_lines(rows):
+    # plain python: walk each pair of pixel rows, sending a color only when it
+    # differs from the cell to the left
+    lines = []
+    for y in range(0, len(rows), 2):
+        upper = rows[y]
+        lower = rows[y + 1] if y + 1 < len(rows) else [None] * len(upper)
+        if len(lower) != len(upper):
+            raise InvalidTypeError("all pixel rows must have the same width")
+        line = []
+        fg = bg = False
+        for top, bottom in zip(upper, lower):
+            if type(top) != tuple:
+                top = tuple(top)
+            if bottom is not None and type(bottom) != tuple:
+                bottom = tuple(bottom)
+            if top != fg and bottom != bg:
+                line.append(f"{SS}{__frame_attrs(top)[0]};{__frame_attrs(bottom)[1]}{SE}")
+            elif top != fg:
+                line.append(f"{SS}{__frame_attrs(top)[0]}{SE}")
+            elif bottom != bg:
+                line.append(f"{SS}{__frame_attrs(bottom)[1]}{SE}")
+            line.append(HALF_BLOCK)
+            fg, bg = top, bottom
+        line.append(RESET)
+        lines.append("".join(line))
+    return lines
+
+def __frame_table(attrs):
+    # numpy: attribute strings as rows of bytes, padded to the longest, and
+    # which bytes of each row are used
+    import numpy
+
+    encoded = numpy.array([a.encode() for a in attrs])
+    table = encoded.view(numpy.uint8).reshape(len(attrs), encoded.dtype.itemsize)
+    used = numpy.arange(table.shape[1]) < numpy.char.str_len(encoded)[:, None]
+    return table, used
+
+@functools.lru_cache(maxsize=2)
+def __frame_channels(prefix):
+    # numpy: tables of prefix + "r;", "g;" and "b" by channel value
+    return (__frame_table([f"{prefix}{n};" for n in range(256)]),
+            __frame_table([f"{n};" for n in range(256)]),
+            __frame_table([str(n) for n in range(256)]))
+
+def __frame_rgb(keys, prefix, off):
+    # numpy: the parts of prefix + "r;g;b" for each cell's 24-bit color, or of
+    # off where it's -1
+    import numpy
+
+    default = keys[..., None] < 0
+    parts = []
+    for (table, used), shift in zip(__frame_channels(prefix), (16, 8, 0)):
+        channel = keys >> shift & 0xFF
+        parts.append((table[channel], used[channel] & ~default))
+    parts.append((numpy.frombuffer(off.encode(), numpy.uint8), default))
+    return parts
+
+def __frame_numpy(pixels):
+    # numpy: every cell is a fixed width run of bytes (SS, fg, ";", bg, SE,
+    # the half block, and reset and newline after the last column) with a
+    # mask of the bytes it sends, so the frame is built with whole array
+    # operations and one decode, no python string per cell
+    import numpy
+
+    pixels = numpy.asarray(pixels)
+    if pixels.ndim != 3 or pixels.shape[2] != 3:
+        raise InvalidTypeError(f"expected an H x W x 3 array, got shape {pixels.shape}")
+    if pixels.dtype != numpy.uint8:
+        if pixels.size and (pixels.min() < 0 or pixels.max() > 255):
+            raise OutOfRangeError("rgb values must be within [0-255]")
+        pixels = pixels.astype(numpy.uint8)
+    height, width = pixels.shape[:2]
+    if not (width and height):
+        return "\n".join([RESET] * ((height + 1) // 2))
+
+    keys = pixels.astype(numpy.int32)
+    keys = keys[..., 0] << 16 | keys[..., 1] << 8 | keys[..., 2]
+    if height % 2:
+        # -1 is the default color, below the last row
+        keys = numpy.vstack([keys, numpy.full((1, width), -1, numpy.int32)])
+    upper, lower = keys[0::2], keys[1::2]
+
+    if COLORS == TRUECOLOR:
+        # digit by digit, straight from the channels
+        fg_parts = __frame_rgb(upper, "38;2;", FG_OFF)
+        bg_parts = __frame_rgb(lower, "48;2;", BG_OFF)
+    else:
+        # quantized, each distinct color once as in __frame_attrs
+        colors, index = numpy.unique(keys, return_inverse=True)
+        index = index.reshape(keys.shape)
+        attrs = [__frame_attrs(None if c < 0 else (c >> 16, c >> 8 & 0xFF, c & 0xFF))
+                 for c in colors.tolist()]
+        fg_table, fg_used = __frame_table([fg for fg, _ in attrs])
+        bg_table, bg_used = __frame_table([bg for _, bg in attrs])
+        fg_parts = [(fg_table[index[0::2]], fg_used[index[0::2]])]
+        bg_parts = [(bg_table[index[1::2]], bg_used[index[1::2]])]
+
+    fg_changed = numpy.ones(upper.shape, dtype=bool)
+    fg_changed[:, 1:] = upper[:, 1:] != upper[:, :-1]
+    bg_changed = numpy.ones(lower.shape, dtype=bool)
+    bg_changed[:, 1:] = lower[:, 1:] != lower[:, :-1]
+    changed = fg_changed | bg_changed
+    last = numpy.zeros(upper.shape, dtype=bool)
+    last[:, -1] = True
+
+    # the bytes of each part of a cell, and when they're sent
+    def constant(s, sent):
+        return numpy.frombuffer(s.encode(), numpy.uint8), sent[..., None]
+    parts = ([constant(SS, changed)]
+             + [(part, used & fg_changed[..., None]) for part, used in fg_parts]
+             + [constant(";", fg_changed & bg_changed)]
+             + [(part, used & bg_changed[..., None]) for part, used in bg_parts]
+             + [constant(SE, changed), constant(HALF_BLOCK, numpy.ones(upper.shape, bool)),
+                constant(f"{RESET}\n", last)])
+    cells = [numpy.broadcast_to(part, upper.shape + part.shape[-1:]) for part, _ in parts]
+    sent = [numpy.broadcast_to(used, cell.shape) for cell, (_, used) in zip(cells, parts)]
+    cells = numpy.concatenate(cells, axis=2).ravel()
+    sent = numpy.concatenate(sent, axis=2).ravel()
+    # compress, as boolean indexing is several times slower with a mask this
+    # irregular; and without the last newline
+    return numpy.compress(sent, cells).tobytes()[:-1].decode()
+
+def RGB_FRAME(pixels):
+    '''
+    Return an image as lines of true color half block cells, two pixel rows per
+    line; a color is only sent when it changes from the cell to its left, and
+    each line ends with reset/normal
+
+    pixels - a numpy array of H x W x 3 (uint8 preferred), or a sequence of
+       rows of (r, g, b) values; numpy arrays are rendered with array
+       operations, some 6 ms for a 200 x 120 image (3 ms for 200 x 60)
+       whatever its colors; below TRUECOLOR every distinct color is
+       quantized exactly, which takes a photo to 20-30 ms
+    '''
+    if hasattr(pixels, "shape") and hasattr(pixels, "dtype"):
+        return __frame_numpy(pixels)
+    return "\n".join(__frame_lines(pixels))
+
+def RGB_GRADIENT(start, end, width, height=1):
+    '''
+    Return the pixel rows of a horizontal linear gradient, for RGB_FRAME
+
+    start, end: the colors at the left and right, (r, g, b) or rgb hex strings
+    width: the number of pixels across
+    height: the number of (identical) pixel rows
+    '''
+    if type(start) == str:
+        start = HEX_TO_RGB(start)
+    if type(end) == str:
+        end = HEX_TO_RGB(end)
+    steps = max(width - 1, 1)
+    row = [tuple(round(s + (e - s) * x / steps) for s, e in zip(start, end))
+           for x in range(width)]
+    return [row] * height
+
+# -- SGR quantization --
+
+# the palette sizes colors can be quantized to: the 8 primaries (3-bit),
+# primaries and their bright versions (4-bit), and the full 8-bit palette
+QUANTIZE_COLORS = (8, 16, 256)
+# number of exact colors QUANTIZE remembers
+QUANTIZE_CACHE_SIZE = 4096
+# bits per channel kept by the bulk lookup table, ie 32 x 32 x 32 entries
+QUANTIZE_LUT_BITS = 5
+
+# the 16 primary colors, in the xterm defaults; terminals theme these, so
+# they're a best guess, unlike the cube and greyscale below
+__PRIMARY_RGB = (
+    (0, 0, 0), (205, 0, 0), (0, 205, 0), (205, 205, 0),
+    (0, 0, 238), (205, 0, 205), (0, 205, 205), (229, 229, 229),
+    (127, 127, 127), (255, 0, 0), (0, 255, 0), (255, 255, 0),
+    (92, 92, 255), (255, 0, 255), (0, 255, 255), (255, 255, 255),
+)
+# channel levels of the 6 x 6 x 6 cube
+__CUBE_LEVELS = (0, 95, 135, 175, 215, 255)
+# the rgb value of every 8-bit color number; the first 8 and 16 entries are
+# also the 3-bit and 4-bit palettes
+PALETTE_8BIT = (
+    __PRIMARY_RGB
+    + tuple((r, g, b) for r in __CUBE_LEVELS for g in __CUBE_LEVELS for b in __CUBE_LEVELS)
+    + tuple((v, v, v) for v in range(8, 248, 10))
+)
+
+def __srgb_to_linear(c):
+    c /= 255
+    return c / 12.92 if c <= 0.04045 else ((c + 0.055) / 1.055) ** 2.4
+
+def __lab_f(t):
+    return t ** (1 / 3) if t > 216 / 24389 else (24389 / 27 * t + 16) / 116
+
+def RGB_TO_LAB(r, g, b):
+    '''
+    Convert an sRGB color to CIELAB (D65 white), where euclidean distance is
+    close to perceived difference
+
+    r,g,b: the values for red, green, blue; each between [0,255]
+    '''
+    r, g, b = __srgb_to_linear(r), __srgb_to_linear(g), __srgb_to_linear(b)
+    # to XYZ, scaled by the D65 white point
+    x = (0.4124564 * r + 0.3575761 * g + 0.1804375 * b) / 0.95047
+    y = 0.2126729 * r + 0.7151522 * g + 0.0721750 * b
+    z = (0.0193339 * r + 0.1191920 * g + 0.9503041 * b) / 1.08883
+    fx, fy, fz = __lab_f(x), __lab_f(y), __lab_f(z)
+    return 116 * fy - 16, 500 * (fx - fy), 200 * (fy - fz)
+
+@functools.lru_cache(maxsize=1)
+def __palette_lab():
+    return tuple(RGB_TO_LAB(*rgb) for rgb in PALETTE_8BIT)
+
+def __nearest(color, colors):
+    # the number of the palette color closest to color, searched in CIELAB
+    l, a, b = RGB_TO_LAB(*color)
+    nearest, nearest_dist = 0, float("inf")
+    for i, (pl, pa, pb) in enumerate(__palette_lab()[:colors]):
+        dist = (l - pl) ** 2 + (a - pa) ** 2 + (b - pb) ** 2
+        if dist < nearest_dist:
+            nearest, nearest_dist = i, dist
+    return nearest
+
+@functools.lru_cache(maxsize=QUANTIZE_CACHE_SIZE)
+def __quantize(color, colors):
+    for c in color:
+        check_num_range(c, 0, 255)
+    return __nearest(color, colors)
+
+def QUANTIZE(color, colors=256):
+    '''
+    Return the color number, 8-bit (as in 38;5;<n>) or 3-bit/4-bit, of the
+    palette color perceptually closest to color
+
+    color - an (r, g, b) tuple or an rgb hex string (see HEX_TO_RGB)
+    colors: the palette size to pick from, one of QUANTIZE_COLORS
+    '''
+    if colors not in QUANTIZE_COLORS:
+        raise OutOfRangeError(f"can quantize to {QUANTIZE_COLORS} colors, not {colors}")
+    if type(color) == str:
+        color = HEX_TO_RGB(color)
+    elif type(color) != tuple:
+        color = tuple(color)
+    if len(color) != 3:
+        raise InvalidTypeError("color must be (r, g, b) or rgb hex string")
+    return __quantize(color, colors)
+
+def QUANTIZE_ATTR(color, colors=256, background=False):
+    '''
+    Return the display attribute setting the foreground (or background) to the
+    palette color closest to color; see QUANTIZE
+    '''
+    n = QUANTIZE(color, colors)
+    if colors == 256:
+        return (BG_8BIT if background else FG_8BIT)[n]
+    return (BG_16 if background else FG_16)[n]
+
+# -- bulk quantization --
+
+# the bulk quantizers round every pixel down to QUANTIZE_LUT_BITS per channel
+# and look its color number up in a table, computed for the centre of each
+# of those buckets; this can pick a neighbour of the exact nearest color, so
+# the palette's own colors (black above all) are looked up exactly first
+
+# lookup tables by palette size: color number per bucket, -1 until needed
+__QUANTIZE_LUTS = {}
+
+@functools.lru_cache(maxsize=len(QUANTIZE_COLORS))
+def __palette_numbers(colors):
+    # 24-bit value -> color number of the palette's colors, the first of them
+    # where the palette repeats a color, as QUANTIZE picks
+    numbers = {}
+    for i, (r, g, b) in enumerate(PALETTE_8BIT[:colors]):
+        numbers.setdefault(r << 16 | g << 8 | b, i)
+    return numbers
+
+def __bucket_center(bucket):
+    shift = 8 - QUANTIZE_LUT_BITS
+    mask = (1 << QUANTIZE_LUT_BITS) - 1
+    half = 1 << shift >> 1
+    return tuple(((bucket >> (QUANTIZE_LUT_BITS * i) & mask) << shift) + half
+                 for i in (2, 1, 0))
+
+@functools.lru_cache(maxsize=len(QUANTIZE_COLORS))
+def __quantize_lut_numpy(colors):
+    # the whole table at once: each palette color against every bucket centre
+    import numpy
+
+    shift = 8 - QUANTIZE_LUT_BITS
+    levels = (numpy.arange(1 << QUANTIZE_LUT_BITS) << shift) + (1 << shift >> 1)
+    rgb = numpy.stack(numpy.meshgrid(levels, levels, levels, indexing="ij"), axis=-1)
+    rgb = rgb.reshape(-1, 3) / 255
+    linear = numpy.where(rgb <= 0.04045, rgb / 12.92, ((rgb + 0.055) / 1.055) ** 2.4)
+    xyz = linear @ numpy.array([
+        [0.4124564, 0.2126729, 0.0193339],
+        [0.3575761, 0.7151522, 0.1191920],
+        [0.1804375, 0.0721750, 0.9503041],
+    ]) / numpy.array([0.95047, 1.0, 1.08883])
+    f = numpy.where(xyz > 216 / 24389, numpy.cbrt(xyz), (24389 / 27 * xyz + 16) / 116)
+    lab = numpy.stack([116 * f[:, 1] - 16, 500 * (f[:, 0] - f[:, 1]), 200 * (f[:, 1] - f[:, 2])], axis=-1)
+
+    # |lab - p|^2 ordered as |p|^2 - 2 lab.p, as |lab|^2 is the same for all p;
+    # a chunk of buckets at a time keeps the distance matrix small
+    palette = numpy.array(__palette_lab()[:colors])
+    palette_norm = (palette ** 2).sum(axis=1)
+    nearest = numpy.empty(len(lab), dtype=numpy.uint8)
+    for i in range(0, len(lab), 4096):
+        dist = palette_norm - 2 * lab[i:i + 4096] @ palette.T
+        nearest[i:i + 4096] = dist.argmin(axis=1)
+    return nearest
+
+@functools.lru_cache(maxsize=len(QUANTIZE_COLORS))
+def __palette_buckets_numpy(colors):
+    # [(24-bit value, color number)] tables of the palette colors by bucket,
+    # -1 where there's none; a bucket can hold a couple (eg greys 88 and 95),
+    # so there's a table for each of them
+    import numpy
+
+    shift = 8 - QUANTIZE_LUT_BITS
+    tables = []
+    for key, number in __palette_numbers(colors).items():
+        r, g, b = key >> 16, key >> 8 & 0xFF, key & 0xFF
+        bucket = ((r >> shift) << QUANTIZE_LUT_BITS | g >> shift) << QUANTIZE_LUT_BITS | b >> shift
+        for keys, numbers in tables:
+            if keys[bucket] < 0:
+                break
+        else:
+            keys = numpy.full(1 << 3 * QUANTIZE_LUT_BITS, -1, dtype=numpy.int32)
+            numbers = numpy.zeros(1 << 3 * QUANTIZE_LUT_BITS, dtype=numpy.uint8)
+            tables.append((keys, numbers))
+        keys[bucket] = key
+        numbers[bucket] = number
+    return tables
+
+def __quantize_array_numpy(pixels, colors):
+    import numpy
+
+    pixels = numpy.asarray(pixels)
+    if pixels.shape[-1:] != (3,):
+        raise InvalidTypeError(f"expected an ... x 3 array, got shape {pixels.shape}")
+    if pixels.dtype != numpy.uint8:
+        if pixels.size and (pixels.min() < 0 or pixels.max() > 255):
+            raise OutOfRangeError("rgb values must be within [0-255]")
+        pixels = pixels.astype(numpy.uint8)
+    shift = 8 - QUANTIZE_LUT_BITS
+    buckets = pixels >> shift
+    buckets = buckets.astype(numpy.intp)
+    buckets = (buckets[..., 0] << QUANTIZE_LUT_BITS | buckets[..., 1]) << QUANTIZE_LUT_BITS | buckets[..., 2]
+    quantized = __quantize_lut_numpy(colors)[buckets]
+
+    # the palette's own colors, checked against those in the pixel's bucket
+    keys = pixels.astype(numpy.int32)
+    keys = keys[..., 0] << 16 | keys[..., 1] << 8 | keys[..., 2]
+    for palette_keys, palette_numbers in __palette_buckets_numpy(colors):
+        exact = palette_keys[buckets] == keys
+        quantized[exact] = palette_numbers[buckets[exact]]
+    return quantized
+
+def __quantize_rows(rows, colors):
+    # plain python: fill the table in as buckets turn up
+    import array
+
+    lut = __QUANTIZE_LUTS.get(colors)
+    if lut is None:
+        lut = __QUANTIZE_LUTS[colors] = array.array("h", [-1]) * (1 << 3 * QUANTIZE_LUT_BITS)
+    numbers = __palette_numbers(colors)
+    shift = 8 - QUANTIZE_LUT_BITS
+    quantized = []
+    for row in rows:
+        line = []
+        for r, g, b in row:
+            check_num_range(r, 0, 255)
+            check_num_range(g, 0, 255)
+            check_num_range(b, 0, 255)
+            n = numbers.get(r << 16 | g << 8 | b)
+            if n is None:
+                bucket = ((r >> shift) << QUANTIZE_LUT_BITS | g >> shift) << QUANTIZE_LUT_BITS | b >> shift
+                n = lut[bucket]
+                if n < 0:
+                    n = lut[bucket] = __nearest(__bucket_center(bucket), colors)
+            line.append(n)
+        quantized.append(line)
+    return quantized
+
+def QUANTIZE_ARRAY(pixels, colors=256):
+    '''
+    Quantize many colors at once through a lookup table; see QUANTIZE
+
+    pixels - a numpy array of ... x 3 (uint8 preferred), giving a uint8 array
+       of color numbers in its shape less the last axis; or a sequence of rows
+       of (r, g, b) values, giving a list of rows of color numbers
+    colors: the palette size to pick from, one of QUANTIZE_COLORS
+    '''
+    if colors not in QUANTIZE_COLORS:
+        raise OutOfRangeError(f"can quantize to {QUANTIZE_COLORS} colors, not {colors}")
+    if hasattr(pixels, "shape") and hasattr(pixels, "dtype"):
+        return __quantize_array_numpy(pixels, colors)
+    return __quantize_rows(pixels, colors)
+
+# === TERMINAL ===
+
+# -- color depth --
+
+# the number of colors shown by a true color (24-bit) terminal
+TRUECOLOR = 1 << 24
+# the color depths a terminal can be taken to have, as numbers of colors
+COLOR_DEPTHS = QUANTIZE_COLORS + (TRUECOLOR,)
+# names for those on the command line and in $PYCOLORS_COLORS
+COLOR_DEPTH_NAMES = {"8": 8, "16": 16, "256": 256, "truecolor": TRUECOLOR, "24bit": TRUECOLOR}
+# the color depth 24-bit colors are sent in; anything lower and FG_24BIT_FN /
+# BG_24BIT_FN quantize to the nearest color of that many, see set_colors
+COLORS = TRUECOLOR
+
+# $TERM values (besides *-direct) of terminals known to do true color, for
+# when $COLORTERM doesn't make it through (eg over ssh or sudo)
+TRUECOLOR_TERMS = ("xterm-kitty", "xterm-ghostty", "alacritty", "foot", "wezterm")
+# $TERM prefixes of terminals with only the 8 primary colors
+PRIMARY_TERMS = ("linux", "vt100", "vt220", "ansi", "cons25")
+
+# how long to wait for the terminal to answer a query, in seconds
+TERMINAL_PROBE_TIMEOUT = 0.1
+# answers to queries are remembered per terminal in TERMINAL_CACHE_PATH, for
+# TERMINAL_CACHE_TIME seconds, for at most TERMINAL_CACHE_ENTRIES terminals
+TERMINAL_CACHE_PATH = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"),
+    "pycolors", "terminals.json")
+TERMINAL_CACHE_TIME = 7 * 24 * 3600
+TERMINAL_CACHE_ENTRIES = 64
+
+def __rgb_attr(r, g, b, background=False):
+    r = check_num_range(r, 0, 255)
+    g = check_num_range(g, 0, 255)
+    b = check_num_range(b, 0, 255)
+    if COLORS == TRUECOLOR:
+        return f"{48 if background else 38};2;{r};{g};{b}"
+    return QUANTIZE_ATTR((r, g, b), COLORS, background)
+
+def set_colors(colors):
+    '''
+    Set the color depth 24-bit colors are sent in; below TRUECOLOR, they're
+    brought down to the nearest of that many colors (see QUANTIZE)
+
+    colors: one of COLOR_DEPTHS, eg the result of terminal_colors()
+    '''
+    global COLORS
+    if colors not in COLOR_DEPTHS:
+        raise OutOfRangeError(f"color depth must be one of {COLOR_DEPTHS}, not {colors}")
+    COLORS = colors
+    # compiled styles and frame colors hold sequences for the old depth
+    STYLE.cache_clear()
+    __frame_attrs.cache_clear()
+
+def parse_colors(name):
+    '''
+    Return the number of colors for a color depth name, see COLOR_DEPTH_NAMES
+    '''
+    try:
+        return COLOR_DEPTH_NAMES[name.strip().lower()]
+    except KeyError:
+        raise ArgParseError(f"color depth must be one of {', '.join(COLOR_DEPTH_NAMES)}, not {name!r}")
+
+def env_colors(env=os.environ):
+    '''
+    Return the color depth a terminal advertises through its environment:
+    $PYCOLORS_COLORS if set, then $COLORTERM, then $TERM
+    '''
+    if env.get("PYCOLORS_COLORS"):
+        return parse_colors(env["PYCOLORS_COLORS"])
+    if env.get("COLORTERM", "").lower() in ("truecolor", "24bit"):
+        return TRUECOLOR
+    term = env.get("TERM", "").lower()
+    if term.endswith("-direct") or term in TRUECOLOR_TERMS:
+        return TRUECOLOR
+    if "256color" in term:
+        return 256
+    if term in ("", "dumb") or term.startswith(PRIMARY_TERMS):
+        return 8
+    return 16
+
+def __terminal_fd():
+    # a descriptor of the controlling terminal, or None without one
+    try:
+        return os.open("/dev/tty", os.O_RDWR | os.O_NOCTTY)
+    except OSError:
+        return None
+
+def __terminal_key(fd, env):
+    # what tells terminals apart: the tty device and session, and what the
+    # environment says the terminal is
+    for std in (0, 1, 2):
+        if os.isatty(std):
+            tty = os.ttyname(std)
+            break
+    else:
+        tty = os.ttyname(fd)
+    return "|".join([
+        tty,
+        str(os.getsid(0)),
+        *(env.get(k, "") for k in ("TERM", "COLORTERM", "TERM_PROGRAM", "TERM_PROGRAM_VERSION")),
+    ])
+
+def __probe_truecolor(fd, timeout):
+    # set an unlikely true color, then ask the terminal for its current SGR
+    # (DECRQSS, "<esc>P$qm<esc>\\"); true color terminals answer with the same
+    # r:g:b, others with a palette color or not at all (None)
+    import time
+    import fcntl
+    import select
+    import termios
+
+    old = termios.tcgetattr(fd)
+    new = termios.tcgetattr(fd)
+    new[3] &= ~(termios.ICANON | termios.ECHO)
+    termios.tcsetattr(fd, termios.TCSANOW, new)
+    typed = b""
+    reply = b""
+    try:
+        os.write(fd, f"{SS}38;2;1;2;3{SE}{ESC}P$q{SE}{ESC}\\{RESET}".encode())
+        deadline = time.monotonic() + timeout
+        # read a byte at a time and stop right at the end of the reply, so
+        # whatever the user types after it stays for the shell to read
+        while not reply.endswith(f"{ESC}\\".encode()):
+            left = deadline - time.monotonic()
+            if left <= 0 or not select.select([fd], [], [], left)[0]:
+                break
+            byte = os.read(fd, 1)
+            if not byte:
+                break
+            if reply or byte == ESC.encode():
+                reply += byte
+            else:
+                typed += byte
+    finally:
+        # not TCSAFLUSH, that would throw away the user's typeahead too
+        termios.tcsetattr(fd, termios.TCSANOW, old)
+    # hand back what was typed ahead of the reply, where the terminal lets us,
+    # followed by whatever came after it so the order is kept
+    while typed and select.select([fd], [], [], 0)[0]:
+        more = os.read(fd, 256)
+        if not more:
+            break
+        typed += more
+    for byte in typed:
+        try:
+            fcntl.ioctl(fd, termios.TIOCSTI, bytes([byte]))
+        except OSError:
+            break
+    if not reply:
+        return None
+    return b"1:2:3" in reply or b"1;2;3" in reply
+
+def __read_terminal_cache():
+    import json
+    try:
+        with open(TERMINAL_CACHE_PATH) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if type(cache) != dict:
+        return {}
+    # keep only well formed [colors, time] entries, someone may have edited it
+    return {key: entry for key, entry in cache.items()
+            if type(entry) == list and len(entry) == 2 and entry[0] in COLOR_DEPTHS
+            and type(entry[0]) == int and type(entry[1]) in (int, float)}
+
+def __write_terminal_cache(cache):
+    import json
+    import time
+
+    # forget the stale, then the oldest past TERMINAL_CACHE_ENTRIES
+    now = time.time()
+    entries = sorted(((k, v) for k, v in cache.items() if now - v[1] < TERMINAL_CACHE_TIME),
+                     key=lambda item: item[1][1])
+    cache = dict(entries[-TERMINAL_CACHE_ENTRIES:])
+    try:
+        os.makedirs(os.path.dirname(TERMINAL_CACHE_PATH), exist_ok=True)
+        # write to a temporary name first, so no other process sees half a cache
+        tmp_path = f"{TERMINAL_CACHE_PATH}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(cache, f)
+        os.replace(tmp_path, TERMINAL_CACHE_PATH)
+    except OSError:
+        pass
+
+def terminal_colors(probe=False, timeout=TERMINAL_PROBE_TIMEOUT, use_cache=True, env=os.environ):
+    '''
+    Return the color depth of the terminal, one of COLOR_DEPTHS
+
+    probe: when the environment doesn't claim true color, ask the terminal
+       itself, waiting at most timeout seconds for an answer
+    use_cache: remember the answer for this terminal in TERMINAL_CACHE_PATH,
+       so later runs in the same terminal don't have to ask again
+    '''
+    colors = env_colors(env)
+    if colors == TRUECOLOR or not probe or env.get("PYCOLORS_COLORS"):
+        return colors
+    fd = __terminal_fd()
+    if fd is None:
+        return colors
+    try:
+        key = __terminal_key(fd, env)
+        cache = __read_terminal_cache() if use_cache else {}
+        if key in cache:
+            import time
+            cached_colors, cached_time = cache[key]
+            if time.time() - cached_time < TERMINAL_CACHE_TIME and cached_colors in COLOR_DEPTHS:
+                return cached_colors
+
+        truecolor = __probe_truecolor(fd, timeout)
+        # a terminal that answers the query at all does at least 256 colors
+        if truecolor:
+            colors = TRUECOLOR
+        elif truecolor is not None:
+            colors = max(colors, 256)
+        if use_cache:
+            import time
+            cache[key] = [colors, time.time()]
+            __write_terminal_cache(cache)
+        return colors
+    except OSError:
+        return colors
+    finally:
+        os.close(fd)
+
+# === STREAMS ===
+
+# how much of a stream colorize_stream reads (and writes) at once
+STREAM_CHUNK_SIZE = 1 << 20
+# longest line colorize_stream holds on to waiting for its end; longer lines
+# are sent on in pieces
+STREAM_LINE_MAX = 1 << 20
+
+def parse_style(spec):
+    '''
+    Return the Style for a spec of comma separated styling options (see
+    STYLE_OPTIONS) and fg=/bg= colors, eg "bold,fg=red,bg=#202020"
+
+    spec - the spec string; colors are primary color names (see PRIMARIES),
+       8-bit color numbers or rgb hex strings
+    '''
+    options = {}
+    for token in filter(None, (t.strip() for t in spec.split(","))):
+        name, _, value = token.partition("=")
+        name = name.lower()
+        if name in STYLE_OPTIONS and not value:
+            options[name] = True
+        elif name in ("fg", "bg") and value:
+            if value.upper() in PRIMARIES:
+                value = (FG_16 if name == "fg" else BG_16)[PRIMARIES[value.upper()]]
+                options.setdefault("attrs", []).append(value)
+                continue
+            options[name] = int(value) if value.isdigit() else value
+        else:
+            raise ArgParseError(f"unknown style {token!r}, expected one of "
+                                f"{', '.join(STYLE_OPTIONS)}, fg=<color>, bg=<color>")
+    attrs = options.pop("attrs", [])
+    try:
+        return Style(*attrs, **options)
+    except (AssertionError, ValueError, InvalidTypeError, OutOfRangeError) as e:
+        raise ArgParseError(f"bad color in style {spec!r}: {e}")
+
+def compile_rules(patterns):
+    '''
+    Return the rule patterns (str, bytes or compiled regexes) compiled the way
+    colorize_stream searches them, with re.MULTILINE so ^ and $ match at every
+    line; raises re.error for a bad one
+
+    str patterns are searched on the text, so [äö], . and \\w mean characters
+    rather than UTF-8 bytes; bytes ones on the bytes, unless they are mixed
+    with str ones, when they are taken as UTF-8 text too
+    '''
+    import re
+
+    sources = [(p.pattern, p.flags) if isinstance(p, re.Pattern) else (p, 0) for p in patterns]
+    text = any(type(source) == str for source, _ in sources)
+    compiled = []
+    for source, flags in sources:
+        if text and type(source) != str:
+            # undecodable bytes come out as the same surrogates the chunks do
+            source = source.decode("utf-8", "surrogateescape")
+        compiled.append(re.compile(source, flags | re.MULTILINE))
+    return compiled
+
+def colorize_stream(infile, outfile, style=None, rules=(),
+                    chunk_size=STREAM_CHUNK_SIZE, line_max=STREAM_LINE_MAX):
+    '''
+    Copy a stream a chunk of whole lines at a time, wrapping each line in a
+    style and each match of a rule's pattern in the rule's style; the styles'
+    sequences are built once, so a chunk costs a few bytes replaces
+
+    infile, outfile - binary files; whatever infile has ready is handled and
+       written (and flushed) straight away, so `tail -F` output keeps flowing
+    style: the Style for every line, or None
+    rules: (pattern, Style) pairs, patterns as for compile_rules; where
+       matches overlap the leftmost wins, then the earliest rule, and a match
+       spanning a newline loses its color at the line break
+    '''
+    import re
+
+    patterns = compile_rules([rule for rule, _ in rules])
+    # str rules see the chunks decoded, and the output encoded back, with
+    # surrogateescape so bytes that aren't UTF-8 pass through as they were
+    text = any(type(pattern.pattern) == str for pattern in patterns)
+    if text:
+        seqs = [rule_style.seq for _, rule_style in rules]
+        prefix = style.seq if style else ""
+        reset, nl, empty = RESET, "\n", ""
+    else:
+        seqs = [rule_style.seq_bytes for _, rule_style in rules]
+        prefix = style.seq_bytes if style else b""
+        reset, nl, empty = RESET_BYTES, b"\n", b""
+    # after a match, back to the line's style
+    restore = prefix or reset
+    newline = reset + nl + prefix
+
+    # where one split can find every rule's matches it's used, as it hands
+    # back the text between the matches and the matches without a python step
+    # for each (a log rule matching every line otherwise spends most of its
+    # time in them): for a single rule, or rules that re has to try at every
+    # position (eg "^\S+") as an alternation of groups, which matches leftmost
+    # first, then earliest rule; rules re skips ahead to in C by a literal
+    # first character (eg "ERROR") would lose that as an alternation, so those
+    # (and rules with groups or flags of their own) are searched each on its
+    # own and the matches merged
+    def skips_ahead(pattern):
+        source = pattern.pattern
+        if type(source) != str:
+            source = source.decode("latin-1")
+        return (source != "" and source[0] not in ".^$*+?{}[]\\|()"
+                and source[1:2] not in ("*", "?", "{") and "|" not in source)
+
+    splitter = None
+    base_flags = re.compile(empty, re.MULTILINE).flags
+    if (all(p.groups == 0 and p.flags == base_flags for p in patterns)
+            and (len(patterns) == 1 or not any(map(skips_ahead, patterns)))):
+        lp, bar, rp = ("(", "|", ")") if text else (b"(", b"|", b")")
+        splitter = re.compile(bar.join(lp + p.pattern + rp for p in patterns), base_flags)
+
+    def split(block):
+        # a gap, the rule's sequence, the match and restore a match
+        pieces = splitter.split(block)
+        stride = len(patterns) + 1
+        matched = pieces[1::stride]
+        n = len(matched)
+        parts = [restore] * (4 * n + 1)
+        parts[0::4] = pieces[0::stride]
+        if len(patterns) == 1:
+            parts[1::4] = [seqs[0]] * n
+        else:
+            # exactly one group of each match is set, the rule's that matched
+            befores = [seqs[0]] * n
+            for i in range(1, len(patterns)):
+                befores = [seq if m is not None else seqs[i] for seq, m in zip(befores, matched)]
+                matched = [m if m is not None else other for m, other in zip(matched, pieces[1 + i::stride])]
+            parts[1::4] = befores
+        parts[2::4] = matched
+        return parts
+
+    def merge(block):
+        spans = []
+        for i, pattern in enumerate(patterns):
+            spans.extend((m.start(), i, m.end()) for m in pattern.finditer(block) if m.end() > m.start())
+        spans.sort()
+        parts = []
+        pos = 0
+        for start, i, end in spans:
+            if start < pos:
+                continue
+            parts += (block[pos:start], seqs[i], block[start:end], restore)
+            pos = end
+        parts.append(block[pos:])
+        return parts
+
+    def colorize(block):
+        if patterns:
+            if text:
+                block = block.decode("utf-8", "surrogateescape")
+            parts = split(block) if splitter else merge(block)
+            # an empty match gets no color, and a match's color stops at the
+            # end of its line; checked on all the matches at once, as few ever
+            # are either
+            matched = parts[2::4]
+            if empty in matched or nl in empty.join(matched):
+                for j in range(2, len(parts), 4):
+                    m = parts[j]
+                    cut = m.find(nl)
+                    if cut == 0 or not m:
+                        parts[j - 1] = parts[j + 1] = empty
+                    elif cut > 0:
+                        parts[j], parts[j + 1] = m[:cut], restore + m[cut:]
+            block = empty.join(parts)
+        if style is not None:
+            end = nl if block.endswith(nl) else empty
+            block = prefix + block[:len(block) - len(end)].replace(nl, newline) + reset + end
+        if text:
+            block = block.encode("utf-8", "surrogateescape")
+        return block
+
+    read = getattr(infile, "read1", infile.read)
+    pending = b""
+    while True:
+        data = read(chunk_size)
+        if not data:
+            break
+        data = pending + data
+        # hold back a partial last line, unless it's grown too long
+        end = data.rfind(b"\n") + 1
+        if end == 0 and len(data) < line_max:
+            pending = data
+            continue
+        if end == 0:
+            end = len(data)
+        pending = data[end:]
+        outfile.write(colorize(data[:end]))
+        outfile.flush()
+    if pending:
+        outfile.write(colorize(pending))
+        outfile.flush()
+
 # -- SGR printers --
 
 def __print_3bit_fg(nlist):
@@ -553,6 +1511,7 @@ def cli_dispatch(args, printopts, content=None):
         print("specify a color print option.")
 
 if __name__ == "__main__":
+    import re
     import sys
     import select
     import argparse
@@ -590,8 +1549,25 @@ if __name__ == "__main__":
     parser.add_argument('-n', '--normal', action="store_true", help="For usage with --print-hex or \
             --print-rgb; when --literal flag set, terminate with reset/normal escape sequence")
     parser.add_argument('-i', '--interactive', action="store_true", help="Interactive mode")
+    parser.add_argument('--colors', default="auto", choices=["auto", *COLOR_DEPTH_NAMES], help="Color depth \
+            of the terminal; 24-bit colors are brought down to the nearest color it has. auto (default) \
+            goes by $PYCOLORS_COLORS, $COLORTERM and $TERM when writing to a terminal")
+    parser.add_argument('--rule', nargs=2, action="append", default=[], metavar=("PATTERN", "STYLE"),
+            help="Color matches of the regex PATTERN in lines from stdin with STYLE, comma separated \
+            style options and colors, eg 'bold,fg=red' or 'fg=#ff8800,bg=236'; may be repeated. \
+            ^ and $ match at every line; where matches overlap the leftmost wins, then the \
+            earlier rule; a match spanning a newline loses its color at the line break")
+    parser.add_argument('--probe', action="store_true", help="With --colors auto, ask the terminal \
+            whether it does true color when its environment doesn't say; the answer is cached per terminal")
 
     args = parser.parse_args()
+
+    # leave output to pipes and files in true color, unless told otherwise
+    if args.colors != "auto":
+        set_colors(COLOR_DEPTH_NAMES[args.colors])
+    elif sys.stdout.isatty():
+        set_colors(terminal_colors(probe=args.probe))
+
     # put args in dictionary instead of "namespace" object
     argsdict = vars(args)
 
@@ -606,12 +1582,36 @@ if __name__ == "__main__":
     # this method is preferable to sys.stdin.isatty becaus it works even in the
     # case of remote invocation (eg ssh)
     r,_,_ = select.select([sys.stdin],[],[],0)
-    if r:
+
+    # coloring lines of stdin with one style (and/or rules) is streamed: the
+    # style is built once, and whole chunks of lines are styled and written
+    streaming = args.rule or ((args.print_rgb or args.print_hex) and not args.literal)
+    if streaming:
+        try:
+            compile_rules([pattern for pattern, _ in args.rule])
+            rules = [(pattern, parse_style(spec)) for pattern, spec in args.rule]
+            fg = args.print_rgb or (args.print_hex and args.print_hex[0]) or None
+            style = Style(fg=fg, **printopts) if (fg or any(printopts.values())) else None
+        except re.error as e:
+            parser.error(f"bad --rule pattern: {e}")
+        except (ArgParseError, InvalidTypeError, OutOfRangeError, AssertionError) as e:
+            parser.error(str(e))
+
+    # rules only make sense on stdin, so wait on a pipe for them, eg `tail -F`
+    if streaming and (r or (args.rule and not sys.stdin.isatty())):
+        try:
+            colorize_stream(sys.stdin.buffer, sys.stdout.buffer, style, rules)
+        except KeyboardInterrupt:
+            exit(0)
+        except BrokenPipeError:
+            # the reader went away (eg head); don't complain about it at exit
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+            exit(0)
+    elif r:
         # stdin is available for reading
         # ie sys.stdin.isatty() -> False
         stdin = r[0]
-        lines = stdin.readlines()
-        for l in lines:
+        for l in stdin:
             cli_dispatch(args, printopts, content=l.rstrip())
     elif args.interactive and (args.print_rgb or args.print_hex):
         # stdin is not available for reading
@@ -35,9 +35,21 @@ As a consequence the code is kept intentionally simple
 (and hopefully understandable).
 """
 
+import os
 import sys
 import io
+import mmap
+import array
+import functools
+import contextlib
+import itertools
+import collections
+import codecs
+import re
+import struct
 import time
+import asyncio
+import threading
 from enum import Enum
 
 r"""
@@ -117,6 +129,15 @@ BLACK_TO_DEFAULT = True
 RESET_ON_NL = True
 # if sauce not found on auto width, fail
 AUTO_WIDTH_FAIL = False
+# keep the rendered output of screen saver art in FRAME_CACHE_DIR
+CACHE_FRAMES = True
+# cap on the total size of the frame cache, least recently used frames are
+# evicted past it
+FRAME_CACHE_SIZE = 256 * 1024 * 1024
+# number of screen saver art files read and rendered ahead of the one playing
+SSAVER_PREFETCH = 4
+# cap on the total size of the frames rendered ahead
+SSAVER_PREFETCH_SIZE = 64 * 1024 * 1024
 
 CP437_CODEPOINTS = [
     # 0 - 127
@@ -191,9 +212,23 @@ CP437_CODEPOINTS = [
 # baud rate / characters per second
 DEFAULT_SPEED = 800
 DEFAULT_WIDTH = 80
+# rows a ScreenBuffer goes down to at most, the most SAUCE can describe; a
+# cursor move past it is garbage (a corrupt file), not a reason to allocate
+# gigabytes of cells
+SCREEN_MAX_ROWS = 0xFFFF
+# number of bytes read at a time when rendering with no slowdown (speed 0)
+CHUNK_SIZE = 64 * 1024
+# when slowed down, output is written in batches, one every tick (in seconds)
+THROTTLE_TICK = 1/60
+# bits sent over the line per byte, for --baud: 8 data bits, 1 start, 1 stop
+BITS_PER_BYTE = 10
+# number of entries kept by each memo keyed on sequences out of the art itself
+# (cursor positions, SGR lists, ...), so a long running screen saver doesn't
+# grow them without end
+SEQUENCE_CACHE_SIZE = 4096
 
 # list of accepted extensions if FILTER_EXT is True
-EXTS = ['.ASC', '.ANS']
+EXTS = ['.ASC', '.ANS', '.BIN', '.XB']
 def valid_ext(ext):
     if ext is None or len(ext) == 0:
         return False
@@ -226,7 +261,20 @@ RESET_N = b"\x1B\x5B\x30\x6D\x0A" # ESC[0m\n
 maybe_reset = lambda: RESET if RESET_ON_NL else b""
 maybe_reset_n = lambda: RESET_N if RESET_ON_NL else b"\n"
 
+# a run of bytes which, in the CONTINUE state, are all printed to screen as is
+# (or converted to unicode) i.e. anything other than the start of an escape
+# sequence, ^Z, or a newline character
+PLAIN_RUN = re.compile(rb"[^\x1b\x1a\r\n]+")
+
 write = sys.stdout.buffer.write
+flush = sys.stdout.buffer.flush
+# what the Throttle sleeps with, swapped out along with write and flush to time
+# them with --stats (see collect_stats)
+sleep = time.sleep
+
+# states of the FSM in AnsiParser
+State = Enum("State",
+             ["CONTINUE", "GET_NEXT_CHAR", "CHECK_IF_CSI", "PARSE_CSI_SEQ"])
 
 class EncodeError(Exception):
     pass
@@ -302,6 +350,110 @@ def utf8_encode(codepoint, res_type="bytes"):
         # big endian
         return int(utf_binary, 2).to_bytes(num_bytes, "big")
 
+# name under which the translation below is registered as a python codec, e.g.
+#   open(fname, "rb").read().decode("fansi-cp437")
+CODEC_NAME = "fansi-cp437"
+
+def build_cp437_table(no_convert_ascii=NO_CONVERT_ASCII, null_to_space=NULL_TO_SPACE):
+    """
+    build the decoding table: a string of 256 characters where the character at
+    index i is what stream_ansi prints for the (printable) input byte i
+
+    bytes above 0x7f which are not converted (no_convert_ascii is False) are
+    mapped to lone surrogates, the same way the "surrogateescape" error handler
+    does, so that encoding with "surrogateescape" gives back the raw byte
+    """
+    table = []
+    for i in range(256):
+        if (no_convert_ascii and i > 0x7f):
+            table.append(CP437_CODEPOINTS[i])
+        elif (null_to_space and i == 0x00):
+            table.append(" ")
+        elif (i > 0x7f):
+            table.append(chr(0xDC00 + i))
+        else:
+            table.append(chr(i))
+    return "".join(table)
+
+# built once, these make it possible to translate whole buffers with a single
+# C-level call instead of going through utf8_encode for every character:
+#   codecs.charmap_decode(buf, "strict", CP437_DECODING_TABLE)[0]
+CP437_DECODING_TABLE = build_cp437_table()
+CP437_ENCODING_MAP = codecs.charmap_build(CP437_DECODING_TABLE)
+# the UTF-8 bytes written out for each of the 256 possible input bytes
+CP437_UTF8 = tuple(c.encode("utf-8", "surrogateescape") for c in CP437_DECODING_TABLE)
+
+class FansiCP437Codec(codecs.Codec):
+    def encode(self, input, errors="strict"):
+        return codecs.charmap_encode(input, errors, CP437_ENCODING_MAP)
+
+    def decode(self, input, errors="strict"):
+        return codecs.charmap_decode(input, errors, CP437_DECODING_TABLE)
+
+class FansiCP437IncrementalEncoder(codecs.IncrementalEncoder):
+    def encode(self, input, final=False):
+        return codecs.charmap_encode(input, self.errors, CP437_ENCODING_MAP)[0]
+
+class FansiCP437IncrementalDecoder(codecs.IncrementalDecoder):
+    def decode(self, input, final=False):
+        return codecs.charmap_decode(input, self.errors, CP437_DECODING_TABLE)[0]
+
+class FansiCP437StreamWriter(FansiCP437Codec, codecs.StreamWriter):
+    pass
+
+class FansiCP437StreamReader(FansiCP437Codec, codecs.StreamReader):
+    pass
+
+def search_codec(name):
+    # depending on python version, the name may come normalized with "_"
+    if name.replace("_", "-") != CODEC_NAME:
+        return None
+    return codecs.CodecInfo(
+        name=CODEC_NAME,
+        encode=FansiCP437Codec().encode,
+        decode=FansiCP437Codec().decode,
+        incrementalencoder=FansiCP437IncrementalEncoder,
+        incrementaldecoder=FansiCP437IncrementalDecoder,
+        streamwriter=FansiCP437StreamWriter,
+        streamreader=FansiCP437StreamReader,
+    )
+
+codecs.register(search_codec)
+
+def verify_cp437_table():
+    """
+    check, for all 256 input bytes, that CP437_UTF8 and the fansi-cp437 codec
+    give byte for byte what printing a single character in stream_ansi gives
+    when going the long way around through utf8_encode
+
+    returns a list of the mismatches found, empty if all is well
+    (compared explicitly rather than asserted, so it still checks under -O)
+    """
+    mismatches = []
+    for i in range(256):
+        artwork_c = bytes([i])
+        if (NO_CONVERT_ASCII and artwork_c > b"\x7f"):
+            expected = utf8_encode(CP437_CODEPOINTS[i])
+        elif (NULL_TO_SPACE and artwork_c == b"\x00"):
+            expected = b" "
+        else:
+            expected = artwork_c
+        if (CP437_UTF8[i] != expected):
+            mismatches.append(f"table mismatch for {hex(i)}: {CP437_UTF8[i]} != {expected}")
+        decoded = artwork_c.decode(CODEC_NAME).encode("utf-8", "surrogateescape")
+        if (decoded != expected):
+            mismatches.append(f"codec mismatch for {hex(i)}: {decoded} != {expected}")
+
+    # and all at once, in both directions
+    all_bytes = bytes(range(256))
+    decoded = all_bytes.decode(CODEC_NAME)
+    if (decoded.encode("utf-8", "surrogateescape") != b"".join(CP437_UTF8)):
+        mismatches.append("codec mismatch decoding all 256 bytes at once")
+    # NUL comes back as a space if NULL_TO_SPACE
+    if (decoded.encode(CODEC_NAME)[1:] != all_bytes[1:]):
+        mismatches.append("codec mismatch encoding all 256 characters back")
+    return mismatches
+
 def print_codepoint_names():
     """
     display information on all cp437 characters, including character names
@@ -343,159 +495,500 @@ def print_cp437():
             print("\u000A", end="")
             y = 0;
 
-def parse_sauce_record(fs):
-    r"""
-    fs: filestream is a raw I/O stream
-        e.g. open(fname, "rb") or open(fname, "rb", encoding="utf-8").buffer
-             or sys.stdin.buffer, etc
+# the SAUCE record is exactly 128 bytes, and usually the last 128 bytes of a file
+# it starts with the 5 byte id "SAUCE" and the 2 byte version "00"
+# I don't think there is a version past 00, so we treat "SAUCE00" as start
+SAUCE_ID = b"SAUCE00"
+SAUCE_SIZE = 128
+# the optional comment block right before the record starts with this 5 byte id
+# followed by the comment lines, each 64 chars wide
+COMNT_ID = b"COMNT"
+COMNT_LINE_SIZE = 64
+
+def find_sauce(buf):
+    """
+    buf: bytes-like, supporting rfind, e.g. bytes or mmap
 
-    more reliable (I think, e.g. says FileSize is unsined LE long):
-        https://www.acid.org/info/sauce/sauce.htm
-    less reliable (I think, e.g. says FileSize is signed long)
-        http://www.retroarchive.org/swag/DATATYPE/0036.PAS.html
-    
-    """
-    # sizes (in bytes), for each field
-    # sauce record is exactly 128 bytes
-    sauce_record_sizes = {
-        "id": 5, # char*
-        "version": 2, # char*
-        "title": 35, # char*
-        "author": 20, # char*
-        "group": 20, # char*
-        "date": 8, # char*
-        "file_size": 4, # long (uint32, LE)
-        "data_type": 1, # unsigned char (uint8)
-        "file_type": 1, # unsigned char (uint8)
-        "t_info_1": 2, # word (uint16)
-        "t_info_2": 2, # word (uint16)
-        "t_info_3": 2, # word (uint16)
-        "t_info_4": 2, # word (uint16)
-        "comments": 1, # uint8, how many lines of comments, (each is 64 chars wide)
-        "t_flags": 1, # uint8
-        "t_info_s": 22, # char * (null terminated, c-style string)
-    }
-    data_types = {
-        0: "none",
-        1: "char", # character based file
-        2: "bitmap", # bitmap and animation
-        3: "vector", # vector graphic file
-        4: "audio", # audio file
-        5: "bin", # binary text
-        6: "xbin", # eXtended BIN file
-        7: "archive", # archive file
-        8: "exec", # executable file
-    }
-
-    no_sauce = False
-
-    while True:
-        ch = fs.read(1)
-        if (ch == b""):
-            no_sauce = True
-            break
-        if (ch == EOF):
-            break
+    returns the offset of the SAUCE record in buf, or -1 if there is none
 
-    if no_sauce:
-        exit_err("No sauce found, end of text reached")
-
-    # between ^Z and start of sauce comes some arbitrary length comment block
-    # then usually you see something like SAUCE00
-    # "SAUCE" is the 5 byte id
-    # "00" is the 2 byte version
-    # I don't think there is a version past 00, so we treat "SAUCE00" as start
-    SAUCE = [b"S",b"A",b"U",b"C",b"E",b"0",b"0"]
-    match_idx = 0
-    while True:
-        ch = fs.read(1)
-        if (ch == b""):
-            no_sauce = True
-            break
+    the record is normally the last 128 bytes, so look there first, then fall
+    back to the last "SAUCE00" in buf which leaves room for a whole record
+    (some files have things like an extra comment block or junk appended)
+    """
+    size = len(buf)
+    offset = size - SAUCE_SIZE
+    if (offset >= 0 and buf[offset:offset+len(SAUCE_ID)] == SAUCE_ID):
+        return offset
+    offset = buf.rfind(SAUCE_ID, 0, max(size - SAUCE_SIZE + len(SAUCE_ID), 0))
+    return offset
+
+def find_art_end(buf, sauce_offset):
+    """
+    returns the offset in buf where the art ends, ie where the ^Z preceding the
+    SAUCE comment block / record is, or the size of buf if there is no SAUCE
+    """
+    if (sauce_offset < 0):
+        return len(buf)
+    end = sauce_offset
+    # comments (num lines) is 104 bytes into the record
+    num_comments = buf[sauce_offset + 104]
+    comnt_offset = sauce_offset - len(COMNT_ID) - num_comments*COMNT_LINE_SIZE
+    if (num_comments > 0 and comnt_offset >= 0 and
+        buf[comnt_offset:comnt_offset+len(COMNT_ID)] == COMNT_ID):
+        end = comnt_offset
+    if (end > 0 and buf[end-1:end] == EOF):
+        end -= 1
+    return end
+
+# art packs are usually zip (or tar) archives, art in them can be used without
+# extracting it, as "<archive>::<member>", e.g. "acid-0596.zip::AC-TRIP.ANS"
+ARCHIVE_SEP = "::"
+ARCHIVE_EXTS = [".ZIP", ".TAR", ".TAR.GZ", ".TGZ", ".TAR.XZ", ".TXZ", ".TAR.BZ2", ".TBZ2"]
+
+# archives stay open between reads (see open_archive), and neither a ZipFile
+# nor a TarStream can be read from by more than one thread at a time
+ARCHIVE_LOCK = threading.Lock()
+
+def is_archive(path):
+    return path.upper().endswith(tuple(ARCHIVE_EXTS))
+
+def split_member(path):
+    """(archive, member) if path is an archive member, otherwise (path, None)"""
+    archive, sep, member = path.partition(ARCHIVE_SEP)
+    if sep and member and is_archive(archive):
+        return archive, member
+    return path, None
+
+def is_art_file(path):
+    """whether path is a file, or the member of an archive that exists"""
+    archive, member = split_member(path)
+    if member is None:
+        return os.path.isfile(path)
+    try:
+        with ARCHIVE_LOCK:
+            archive = open_archive(archive)
+            if hasattr(archive, "getinfo"):
+                archive.getinfo(member)
+            else:
+                # kept for the read that follows (see TarStream)
+                archive.read(path)
+    except (OSError, EOFError, KeyError, ValueError):
+        return False
+    return True
+
+def open_archive(archive):
+    """the open ZipFile or TarStream of archive, kept open (see open_archive_at)"""
+    st = os.stat(archive)
+    return open_archive_at(archive, st.st_mtime_ns, st.st_size)
+
+@functools.lru_cache(maxsize=8)
+def open_archive_at(archive, mtime_ns, size):
+    # mtime and size are part of the key so that a changed archive is reopened
+    import zipfile
+    import tarfile
 
-        if (ch == SAUCE[match_idx]):
-            match_idx += 1
+    if archive.upper().endswith(".ZIP"):
+        return zipfile.ZipFile(archive)
+    return TarStream(archive)
+
+class TarStream:
+    """
+    a tar archive, read front to back (see iter_members): a compressed tar
+    can't be seeked around in, each member looked up on its own would have it
+    decompressed from the start again, so reading members in the order they're
+    stored (see shuffle_files) decompresses the archive just once; asking for
+    a member behind the current position starts over
+
+    the last member read is kept, so reading it again right away is free
+    """
+    def __init__(self, archive):
+        self.archive = archive
+        self.members = None
+        self.last = (None, None)
+
+    def read(self, path):
+        """returns the contents of the member path ("<archive>::<member>")"""
+        if (self.last[0] == path):
+            return self.last[1]
+        # the rest of the current pass, then if need be one from the start
+        for restart in ([True] if self.members is None else [False, True]):
+            if (restart):
+                self.close()
+                self.members = iter_members(self.archive)
+            for member, buf in self.members:
+                if (member == path):
+                    self.last = (member, buf)
+                    return buf
+        self.close()
+        raise KeyError(f"There is no item named {split_member(path)[1]!r} in the archive")
+
+    def close(self):
+        if self.members is not None:
+            self.members.close()
+            self.members = None
+
+def open_member(path):
+    """
+    returns a binary file object of the archive member path (see
+    split_member), streaming it as it's decompressed where the archive allows
+    """
+    archive, member = split_member(path)
+    with ARCHIVE_LOCK:
+        archive = open_archive(archive)
+        if hasattr(archive, "getinfo"):
+            return archive.open(archive.getinfo(member))
+        return io.BytesIO(archive.read(path))
+
+def read_member(path):
+    """returns the contents of the archive member path (see split_member)"""
+    archive, member = split_member(path)
+    with ARCHIVE_LOCK:
+        archive = open_archive(archive)
+        if hasattr(archive, "getinfo"):
+            return archive.read(archive.getinfo(member))
+        return archive.read(path)
+
+def open_art(path):
+    """returns a binary file object of the art file (or archive member) path"""
+    if split_member(path)[1] is not None:
+        return open_member(path)
+    return open(path, "rb")
+
+def iter_members(archive):
+    """
+    generates (member path, contents) for the art files in archive (passing the
+    extension filter), in a single pass, so that a compressed tar is only ever
+    decompressed once
+    """
+    import zipfile
+    import tarfile
+
+    if archive.upper().endswith(".ZIP"):
+        with zipfile.ZipFile(archive) as zf:
+            for info in zf.infolist():
+                if (not info.is_dir() and
+                        (not FILTER_EXT or valid_ext(os.path.splitext(info.filename)[-1]))):
+                    yield f"{archive}{ARCHIVE_SEP}{info.filename}", zf.read(info)
+        return
+    # stream mode: members are read in order, without seeking back
+    with tarfile.open(archive, "r|*") as tf:
+        for info in tf:
+            if (info.isfile() and
+                    (not FILTER_EXT or valid_ext(os.path.splitext(info.name)[-1]))):
+                yield f"{archive}{ARCHIVE_SEP}{info.name}", tf.extractfile(info).read()
+
+class ArtMap:
+    """
+    an art file, memory mapped for reading, so that it can be rendered and its
+    SAUCE read without copying the whole file into python bytes objects
+
+        with ArtMap(fname) as art:
+            art.sauce_offset # offset of the SAUCE record, or -1 if there is none
+            art.art          # zero-copy memoryview of the art region only
+            art.format       # "ansi", "bin" or "xbin" (see art_format)
+
+    an archive member (see split_member) can't be mapped, it's decompressed
+    into memory instead
+    """
+    def __init__(self, fname):
+        self.fname = fname
+
+    def __enter__(self):
+        self.fs = None
+        if split_member(self.fname)[1] is not None:
+            self.mm = read_member(self.fname)
         else:
-            match_idx = 0
+            self.fs = open(self.fname, "rb")
+            # empty files can't be mapped
+            if os.fstat(self.fs.fileno()).st_size > 0:
+                self.mm = mmap.mmap(self.fs.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self.mm = b""
+        self.sauce_offset = find_sauce(self.mm)
+        self.art = memoryview(self.mm)[:find_art_end(self.mm, self.sauce_offset)]
+        self.format = art_format(self.fname, self.mm, self.sauce_offset)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.art.release()
+        if type(self.mm) == mmap.mmap:
+            try:
+                self.mm.close()
+            except BufferError:
+                # a view is still held on to, e.g. by the traceback of an
+                # exception; the map is closed once it's garbage collected
+                pass
+        if self.fs is not None:
+            self.fs.close()
+
+    def width(self):
+        """
+        the width of the art, as per its SAUCE, or its own for binary text,
+        which is always rendered at it (see art_format)
+        """
+        return art_width(self.mm, self.sauce_offset, self.format)
+
+    def flags(self):
+        return sauce_flags(self.mm, self.sauce_offset)
+
+    def ice(self, ice=None):
+        """
+        ice, unless it's None (auto), in which case whether the SAUCE says iCE
+        (or for XBin, its header)
+        """
+        if ice is not None:
+            return ice
+        if (self.format == "xbin"):
+            return bool(xbin_header(self.art)[3] & XBIN_NON_BLINK)
+        return self.flags()[0]
+
+def sauce_width(buf, sauce_offset):
+    """same as find_width, but for a buffer, without any seeking"""
+    if (sauce_offset < 0 and AUTO_WIDTH_FAIL):
+        raise ParseError("Could not find SAUCE")
+    elif (sauce_offset < 0):
+        return 80
+    # TInfo1 is 96 bytes into the record (32 bytes from its end)
+    t_info_1 = buf[sauce_offset+96:sauce_offset+98]
+    width = int.from_bytes(t_info_1, "little", signed=False)
+    if (width == 0 and AUTO_WIDTH_FAIL):
+        raise ParseError("Could not find width")
+    elif (width == 0):
+        width = 80
+    return width
 
-        if (match_idx == len(SAUCE)):
-            break
+def bin_width(buf, sauce_offset):
+    """
+    the width of the binary text in buf: for binary text (DataType 5) the
+    SAUCE has it, halved, as FileType; BIN_WIDTH if it has no SAUCE
+    """
+    if (sauce_offset >= 0 and buf[sauce_offset+94] == 5 and buf[sauce_offset+95] > 0):
+        return buf[sauce_offset+95] * 2
+    return BIN_WIDTH
+
+def art_width(buf, sauce_offset, art_format="ansi"):
+    """the width of the art in buf, of art_format (see art_format)"""
+    if (art_format == "xbin"):
+        return xbin_header(buf)[0]
+    if (art_format == "bin"):
+        return bin_width(buf, sauce_offset)
+    return sauce_width(buf, sauce_offset)
+
+def art_format(fname, buf, sauce_offset):
+    """
+    the format of the art in buf: "xbin" if it starts with the XBin header,
+    "bin" if it's binary text (see BIN_WIDTH) as per its SAUCE DataType, or
+    its extension if it has no SAUCE, otherwise "ansi" (a character stream)
+    """
+    if (bytes(buf[:len(XBIN_ID)]) == XBIN_ID):
+        return "xbin"
+    if (sauce_offset >= 0):
+        return "bin" if buf[sauce_offset+94] == 5 else "ansi"
+    ext = os.path.splitext(split_member(fname)[1] or fname)[1]
+    return "bin" if ext.upper() == ".BIN" else "ansi"
+
+# TFlags (SAUCE, ANSi/ASCII files) is a bit field:
+#   bit 0: iCE colors, blink makes the background bright instead
+#   bits 1-2: letter spacing, 0: legacy, 1: 8 pixel font, 2: 9 pixel font
+#   bits 3-4: aspect ratio, 0: legacy, 1: stretched (as on a CRT), 2: square
+SAUCE_ICE = 0x01
+LETTER_SPACING = {0: None, 1: 8, 2: 9}
+ASPECT_RATIO = {0: None, 1: "stretch", 2: "square"}
+
+def sauce_flags(buf, sauce_offset):
+    """
+    the (iCE colors, letter spacing, aspect ratio) of the art in buf, from the
+    TFlags of its SAUCE; (False, None, None) if there is no SAUCE
+    """
+    if (sauce_offset < 0):
+        return False, None, None
+    # TFlags is 105 bytes into the record
+    t_flags = buf[sauce_offset+105]
+    return (bool(t_flags & SAUCE_ICE),
+            LETTER_SPACING.get((t_flags >> 1) & 0x3),
+            ASPECT_RATIO.get((t_flags >> 3) & 0x3))
+
+# the SAUCE record, field by field (sizes in bytes, sauce record is exactly 128)
+#   id (5 char), version (2 char), title (35 char), author (20 char),
+#   group (20 char), date (8 char, CCYYMMDD), file size (uint32 LE, see below),
+#   data type (uint8), file type (uint8), t info 1-4 (uint16 LE each),
+#   comments (uint8, how many lines of comments, each 64 chars wide),
+#   t flags (uint8), t info s (22 char, null terminated, c-style string)
+# more reliable (I think, e.g. says FileSize is unsined LE long):
+#     https://www.acid.org/info/sauce/sauce.htm
+# less reliable (I think, e.g. says FileSize is signed long)
+#     http://www.retroarchive.org/swag/DATATYPE/0036.PAS.html
+SAUCE_STRUCT = struct.Struct("<5s2s35s20s20s8sIBBHHHHBB22s")
+# SAUCE text is plain CP437 (ascii as ascii), decoded straight through the
+# table, which is a good deal faster than going through the codec by name
+SAUCE_DECODING_TABLE = "".join(
+    chr(i) if i < 0x80 else c for i, c in enumerate(CP437_CODEPOINTS))
+
+SAUCE_DATA_TYPES = {
+    0: "none",
+    1: "char", # character based file
+    2: "bitmap", # bitmap and animation
+    3: "vector", # vector graphic file
+    4: "audio", # audio file
+    5: "bin", # binary text
+    6: "xbin", # eXtended BIN file
+    7: "archive", # archive file
+    8: "exec", # executable file
+}
+
+# what TInfo1-4 hold, for the kinds of files which use them
+CHAR_T_INFO = ("width", "lines", None, None)
+BITMAP_T_INFO = ("pixel width", "pixel height", "pixel depth", None)
+SAMPLE_T_INFO = ("sample rate", None, None, None)
+NO_T_INFO = (None, None, None, None)
+
+# the kind of file for each (data type, file type), and what its TInfo1-4 hold;
+# binary text is missing, its file type is its width (halved, see bin_width)
+SAUCE_FILE_TYPES = {
+    (0, 0): ("none", NO_T_INFO),
+    (1, 0): ("ascii", CHAR_T_INFO),
+    (1, 1): ("ansi", CHAR_T_INFO),
+    (1, 2): ("ansimation", CHAR_T_INFO),
+    (1, 3): ("rip", ("pixel width", "pixel height", "colors", None)),
+    (1, 4): ("pcboard", CHAR_T_INFO),
+    (1, 5): ("avatar", CHAR_T_INFO),
+    (1, 6): ("html", NO_T_INFO),
+    (1, 7): ("source", NO_T_INFO),
+    (1, 8): ("tundradraw", CHAR_T_INFO),
+    (6, 0): ("xbin", CHAR_T_INFO),
+    (8, 0): ("exec", NO_T_INFO),
+}
+SAUCE_FILE_TYPES.update(
+    ((2, i), (name, BITMAP_T_INFO)) for i, name in enumerate(
+        ["gif", "pcx", "lbm/iff", "tga", "fli", "flc", "bmp", "gl", "dl", "wpg", "png", "jpg", "mpg", "avi"]))
+SAUCE_FILE_TYPES.update(
+    ((3, i), (name, NO_T_INFO)) for i, name in enumerate(["dxf", "dwg", "wpg", "3ds"]))
+SAUCE_FILE_TYPES.update(
+    ((4, i), (name, SAMPLE_T_INFO if name.startswith("smp") else NO_T_INFO)) for i, name in enumerate(
+        ["mod", "669", "stm", "s3m", "mtm", "far", "ult", "amf", "dmf", "okt", "rol", "cmf", "mid", "sadt",
+         "voc", "wav", "smp8", "smp8s", "smp16", "smp16s", "patch8", "patch16", "xm", "hsc", "it"]))
+SAUCE_FILE_TYPES.update(
+    ((7, i), (name, NO_T_INFO)) for i, name in enumerate(
+        ["zip", "arj", "lzh", "arc", "tar", "zoo", "rar", "uc2", "pak", "sqz"]))
+# the kinds of files whose TFlags (see sauce_flags) and TInfoS (the font) mean
+# something
+SAUCE_FONT_TYPES = {(1, 0), (1, 1), (1, 2)}
+
+class SauceRecord(collections.namedtuple("SauceRecord", [
+        "version", "title", "author", "group", "date", "file_size", "data_type", "file_type",
+        "t_info_1", "t_info_2", "t_info_3", "t_info_4", "num_comments", "t_flags", "t_info_s",
+        "comments"])):
+    """
+    a SAUCE record (see parse_sauce_record), the fields as they are in it
+    (numbers as numbers), but for text which is decoded (CP437) and stripped,
+    and comments, the lines of the comment block (a tuple, empty if it has none)
+    """
+    __slots__ = ()
+
+    @property
+    def data_type_name(self):
+        """the data type (see SAUCE_DATA_TYPES), or its number if unknown"""
+        return SAUCE_DATA_TYPES.get(self.data_type, str(self.data_type))
+
+    @property
+    def file_type_name(self):
+        """the kind of file (see SAUCE_FILE_TYPES), or its number if unknown"""
+        if (self.data_type == 5):
+            return "bin"
+        return SAUCE_FILE_TYPES.get((self.data_type, self.file_type), (str(self.file_type),))[0]
+
+    @property
+    def t_info(self):
+        """{what TInfoN holds: its value} for the TInfo1-4 which mean something"""
+        if (self.data_type == 5):
+            return {"width": self.file_type * 2}
+        names = SAUCE_FILE_TYPES.get((self.data_type, self.file_type), (None, NO_T_INFO))[1]
+        values = (self.t_info_1, self.t_info_2, self.t_info_3, self.t_info_4)
+        return {name: value for name, value in zip(names, values) if name is not None}
+
+    @property
+    def font(self):
+        """the font the art is meant to be shown in (TInfoS), None if it doesn't say"""
+        if (self.data_type == 5 or (self.data_type, self.file_type) in SAUCE_FONT_TYPES):
+            return self.t_info_s or None
+        return None
+
+    @property
+    def ymd(self):
+        """the date as (year, month, day) strings"""
+        return self.date[0:4], self.date[4:6], self.date[6:8]
+
+def parse_sauce_record(buf, sauce_offset=None):
+    """
+    buf: bytes-like, e.g. bytes or mmap (see ArtMap)
+    sauce_offset: offset of the SAUCE record in buf, if already known
 
-    if no_sauce:
-        exit_err("No sauce found, end of text reached")
-
-    sauce_record = {
-        "Id": "SAUCE",
-        "Version": "00",
-    }
-
-    sauce_record["Title"] = fs.\
-            read(sauce_record_sizes["title"]).decode("cp437").strip()
-    sauce_record["Author"] = fs.\
-            read(sauce_record_sizes["author"]).decode("cp437").strip()
-    sauce_record["Group"] = fs.\
-            read(sauce_record_sizes["group"]).decode("cp437").strip()
-    date = fs.\
-            read(sauce_record_sizes["date"]).decode("cp437")
-    sauce_record["Date (y)"] = date[0:4]
-    sauce_record["Date (m)"] = date[5:6]
-    sauce_record["Date (d)"] = date[6:8]
-    file_size = fs.\
-            read(sauce_record_sizes["file_size"])
-    sauce_record["File Size"] = int.from_bytes(file_size, 'little', signed=False)
-    data_type = fs.\
-            read(sauce_record_sizes["data_type"])
-    data_type = int.from_bytes(data_type, "little", signed=False)
-    sauce_record["Data Type"] = data_types[data_type]
-    file_type = fs.\
-            read(sauce_record_sizes["file_type"])
-    file_type = int.from_bytes(file_type, "little", signed=False)
-    # file type + data type determine kind of file
-    # and also what TInfo[1-4] mean
-    # table is huge, maybe implement it in the future
-    # for now just print numbers
-    sauce_record["File Type"] = str(file_type)
-    t_info_1 = fs.\
-            read(sauce_record_sizes["t_info_1"])
-    t_info_1 = int.from_bytes(t_info_1, "little", signed=False)
-    sauce_record["T Info 1"] = str(t_info_1)
-    t_info_2 = fs.\
-            read(sauce_record_sizes["t_info_2"])
-    t_info_2 = int.from_bytes(t_info_2, "little", signed=False)
-    sauce_record["T Info 2"] = str(t_info_2)
-    t_info_3 = fs.\
-            read(sauce_record_sizes["t_info_3"])
-    t_info_3 = int.from_bytes(t_info_3, "little", signed=False)
-    sauce_record["T Info 3"] = str(t_info_3)
-    t_info_4 = fs.\
-            read(sauce_record_sizes["t_info_4"])
-    t_info_4 = int.from_bytes(t_info_4, "little", signed=False)
-    sauce_record["T Info 4"] = str(t_info_4)
-    comments = fs.\
-            read(sauce_record_sizes["comments"])
-    comments = int.from_bytes(comments, "little", signed=False)
-    sauce_record["Comments (num lines, 64 char each)"] = comments
-    t_flags = fs.\
-            read(sauce_record_sizes["t_flags"])
-    t_flags = int.from_bytes(t_flags, "little", signed=False)
-    sauce_record["TFlags"] = str(t_flags)
-    t_info_s = fs.\
-            read(sauce_record_sizes["t_info_s"]).decode("cp437").strip()
-    # c-style string is up until vector terminal
-    sauce_record["TInfoS"] = t_info_s[:t_info_s.find("\x00")]
-
-    return sauce_record
-
-def print_sauce(fs):
-    sauce_record = parse_sauce_record(fs)
-    for k,v in sauce_record.items():
-        print(f"{k}: {v}")
-    if ((sauce_record["File Type"] == "0" or sauce_record["File Type"] == "1") and
-        sauce_record["Data Type"] == "char"):
-        char_width = sauce_record["T Info 1"]
-        num_lines = sauce_record["T Info 2"]
-        print(f"Char Width: {char_width}")
-        print(f"Num Lines: {num_lines}")
+    returns the SauceRecord, read in one go with SAUCE_STRUCT, along with the
+    comment block before it, if there is one
+    """
+    if sauce_offset is None:
+        sauce_offset = find_sauce(buf)
+    if sauce_offset < 0:
+        raise ParseError("No sauce found, end of text reached")
+    if sauce_offset + SAUCE_SIZE > len(buf):
+        raise ParseError("SAUCE record is cut short")
+
+    (_, version, title, author, group, date, file_size, data_type, file_type,
+     t_info_1, t_info_2, t_info_3, t_info_4, num_comments, t_flags, t_info_s
+     ) = SAUCE_STRUCT.unpack_from(buf, sauce_offset)
+
+    charmap_decode = codecs.charmap_decode
+    decode = lambda field: charmap_decode(field, "strict", SAUCE_DECODING_TABLE)[0]
+
+    comments = ()
+    comnt_offset = sauce_offset - len(COMNT_ID) - num_comments*COMNT_LINE_SIZE
+    if (num_comments > 0 and comnt_offset >= 0 and
+        buf[comnt_offset:comnt_offset+len(COMNT_ID)] == COMNT_ID):
+        block = decode(buf[comnt_offset+len(COMNT_ID):sauce_offset])
+        comments = tuple(block[i:i+COMNT_LINE_SIZE].rstrip(" \x00")
+                         for i in range(0, len(block), COMNT_LINE_SIZE))
+
+    return SauceRecord(
+        decode(version),
+        decode(title).strip(" \x00"),
+        decode(author).strip(" \x00"),
+        decode(group).strip(" \x00"),
+        decode(date),
+        file_size, data_type, file_type,
+        t_info_1, t_info_2, t_info_3, t_info_4,
+        num_comments, t_flags,
+        # c-style string is up until null terminator
+        decode(t_info_s.split(b"\x00", 1)[0]).strip(),
+        comments)
+
+def print_sauce(buf):
+    sauce_record = parse_sauce_record(buf)
+    year, month, day = sauce_record.ymd
+    print("Id: SAUCE")
+    print(f"Version: {sauce_record.version}")
+    print(f"Title: {sauce_record.title}")
+    print(f"Author: {sauce_record.author}")
+    print(f"Group: {sauce_record.group}")
+    print(f"Date (y): {year}")
+    print(f"Date (m): {month}")
+    print(f"Date (d): {day}")
+    print(f"File Size: {sauce_record.file_size}")
+    print(f"Data Type: {sauce_record.data_type_name}")
+    print(f"File Type: {sauce_record.file_type_name}")
+    print(f"T Info 1: {sauce_record.t_info_1}")
+    print(f"T Info 2: {sauce_record.t_info_2}")
+    print(f"T Info 3: {sauce_record.t_info_3}")
+    print(f"T Info 4: {sauce_record.t_info_4}")
+    print(f"Comments (num lines, 64 char each): {sauce_record.num_comments}")
+    print(f"TFlags: {sauce_record.t_flags}")
+    print(f"TInfoS: {sauce_record.t_info_s}")
+    # what the TInfo fields mean for this kind of file
+    for name, value in sauce_record.t_info.items():
+        print(f"{name.capitalize()}: {value}")
+    if sauce_record.font is not None:
+        print(f"Font: {sauce_record.font}")
+    for line in sauce_record.comments:
+        print(f"Comment: {line}")
 
 def find_width(fs, check_sauce=True):
     if (check_sauce):
@@ -518,160 +1011,802 @@ def find_width(fs, check_sauce=True):
     fs.seek(0)
     return width
 
-def stream_ansi(fs, speed=DEFAULT_SPEED, width=DEFAULT_WIDTH):
+# the screen saver keeps an index of the art files (and their SAUCE) under each
+# directory it's pointed at, so that it doesn't have to re-discover and re-read
+# everything on every launch; it's a sqlite database in the XDG cache directory
+INDEX_PATH = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"),
+    "pyfansi", "index.sqlite")
+# rendered screen saver art, see cached_frame
+FRAME_CACHE_DIR = os.path.join(os.path.dirname(INDEX_PATH), "frames")
+# fields that can be used in --ssaver-filter, and the column (expression) each
+# is matched against; a width of 0 or none at all means 80 when rendering
+INDEX_FILTER_FIELDS = {
+    "title": "title",
+    "author": "author",
+    "group": "grp",
+    "date": "date",
+    "width": "COALESCE(NULLIF(width, 0), 80)",
+    "lines": "lines",
+    "data_type": "data_type",
+}
+INDEX_NUMERIC_FIELDS = ["width", "lines"]
+INDEX_FILTER_OPS = ["<=", ">=", "!=", "=", "<", ">"]
+
+def open_index(path=INDEX_PATH):
+    import sqlite3
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    db = sqlite3.connect(path)
+    db.executescript("""
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT);
+        CREATE TABLE IF NOT EXISTS dirs (
+            path TEXT PRIMARY KEY,
+            mtime_ns INTEGER,
+            subdirs TEXT);
+        CREATE TABLE IF NOT EXISTS files (
+            path TEXT PRIMARY KEY,
+            dir TEXT,
+            mtime_ns INTEGER,
+            size INTEGER,
+            title TEXT,
+            author TEXT,
+            grp TEXT,
+            date TEXT,
+            width INTEGER,
+            lines INTEGER,
+            data_type TEXT);
+        CREATE INDEX IF NOT EXISTS files_dir ON files (dir);
+    """)
+    return db
+
+def index_record(fname):
     """
-    fs: filestream is a raw I/O stream
-        e.g. open(fname, "rb") or open(fname, "rb", encoding="utf-8").buffer
-             or sys.stdin.buffer, etc
+    the SAUCE fields kept in the index for fname:
+        (title, author, group, date, width, lines, data type)
+    all None if it has no (readable) SAUCE
     """
-    if (width == 0):
-        width = find_width(fs)
+    with ArtMap(fname) as art:
+        return buf_index_record(art.mm, art.sauce_offset, fname)
 
-    # could just do .encode("utf8") instead of utf8_encode
-    b_to_ch = lambda abyte: \
-            utf8_encode(
-                CP437_CODEPOINTS[
-                    # or could just do abyte[0] since we know its 1 byte
-                    int(artwork_c.hex(), 16)])
-
-    # FSM
-    State = Enum("State",
-                 ["CONTINUE", "GET_NEXT_CHAR", "CHECK_IF_CSI", "PARSE_CSI_SEQ"])
-
-    state = State.CONTINUE
-    EOF_reached = False # continue parsing
-    # not the same as fs.tell() (byte position in file)
-    # cursor_pos is with respect to column position within a row
-    cursor_pos = 0 # set intiial cursor position
-    saved_cursor = 0 # saved cursor position
-    # "did_newline" serves as a flag which is enabled when we write out a
-    # newline character because "cursor_pos" is at max width
-    #
-    # the flag is needed because the next character to write out from the input
-    # stream might itself be a newline character (in which case we'd double
-    # newline)
-    # however, it might not be the *immediate* next character because
-    # some ANSI escape sequence(s) might also precede it
-    #
-    # we also can't rely on cursor_pos == 0 alone because the input stream may
-    # purposely have several newlines at pos 0 for artistic effect
-    #
-    # "did_newline" should be disabled after cursor moves past position 0
-    did_newline = False
-    # "first_r" and "first_n" are flags for the situation when the input stream
-    # purposefully has multiple newlines in a row
-    # when we write a newline because width is reached we want to ignore the
-    # immediate next printable character if it is also "\r" or "\n",
-    # but any subsequent ones should be let through
-    #
-    # these should be disabled alongside disabling of "did_newline"
-    first_r = False
-    first_n = False
-
-    cmd = None # store the last seen CSI command
-    cmd_arg_buffer = [] # buffer to store the CSI command argument
-    cmd_args = [] # the list of full arguments
-
-    while(not EOF_reached):
-        # don't read while wei're in cmd argument parsing
-        # we have to parse the cmd arguments and output them
-        # only then do we output the cmd itself
-        # fnally we can continue reading
-        if (state != State.PARSE_CSI_SEQ):
-            artwork_c = fs.read(1)
-
-        if artwork_c == b"":
+def buf_index_record(buf, sauce_offset, fname):
+    """
+    same as index_record, but for the art in buf; binary text (see art_format)
+    always has its width, SAUCE or not
+    """
+    fmt = art_format(fname, buf, sauce_offset)
+    width = None
+    if (fmt != "ansi"):
+        try:
+            width = art_width(buf, sauce_offset, fmt)
+        except ParseError:
+            # a broken XBin, which is reported when it's rendered
+            pass
+    if (sauce_offset < 0):
+        return (None,)*4 + (width,) + (None,)*2
+    sauce_record = parse_sauce_record(buf, sauce_offset)
+    if (fmt == "ansi"):
+        width = sauce_record.t_info_1
+    return (sauce_record.title,
+            sauce_record.author,
+            sauce_record.group,
+            sauce_record.date,
+            width,
+            sauce_record.t_info_2,
+            sauce_record.data_type_name)
+
+def under_dir(column, root):
+    """sql condition (and its params) for column being root or a path under it"""
+    # every path under root sorts between "root/" and "root0" ("0" follows "/")
+    return (f"({column} = ? OR ({column} >= ? AND {column} < ?))",
+            [root, root + os.sep, root + chr(ord(os.sep) + 1)])
+
+def update_index(db, root, full=False):
+    """
+    bring the index up to date with the art files under root, returns the
+    number of files (re)read
+
+    only directories whose mtime changed (ie files/dirs were added, removed or
+    renamed in them) are listed again, and within those, only files whose mtime
+    or size changed are read again; files edited in place don't change the mtime
+    of their directory, so use full to re-check every file
+
+    the art in archives (see ARCHIVE_EXTS) is indexed too, each member as a file
+    of its own ("<archive>::<member>") with the mtime and size of the archive,
+    and all of them are read again, in one pass, when the archive changes
+    """
+    root = os.path.abspath(root)
+
+    # the index only holds files which pass the extension filter
+    # so if that changes, everything has to be looked at again
+    exts = f"{FILTER_EXT}:{','.join(EXTS)}:{','.join(ARCHIVE_EXTS)}"
+    row = db.execute("SELECT value FROM meta WHERE key = 'exts'").fetchone()
+    if row is None or row[0] != exts:
+        full = True
+        db.execute("INSERT OR REPLACE INTO meta VALUES ('exts', ?)", (exts,))
+
+    num_read = 0
+    seen_dirs = set()
+    stack = [root]
+    while stack:
+        d = stack.pop()
+        seen_dirs.add(d)
+        mtime_ns = os.stat(d).st_mtime_ns
+        row = db.execute("SELECT mtime_ns, subdirs FROM dirs WHERE path = ?", (d,)).fetchone()
+        if not full and row is not None and row[0] == mtime_ns:
+            stack.extend(sd for sd in row[1].split("\n") if sd)
+            continue
+
+        subdirs = []
+        files = {}
+        archives = {}
+        with os.scandir(d) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                elif (entry.is_file() and is_archive(entry.name)):
+                    st = entry.stat()
+                    archives[entry.path] = (st.st_mtime_ns, st.st_size)
+                elif (entry.is_file() and "." in entry.name and
+                      (not FILTER_EXT or valid_ext(os.path.splitext(entry.name)[-1]))):
+                    st = entry.stat()
+                    files[entry.path] = (st.st_mtime_ns, st.st_size)
+
+        indexed = {path: (m, size) for path, m, size in
+                   db.execute("SELECT path, mtime_ns, size FROM files WHERE dir = ?", (d,))}
+        # members are kept (or dropped) along with their archive
+        indexed_archives = {}
+        for path, stat in indexed.items():
+            archive, member = split_member(path)
+            if member is not None:
+                indexed_archives.setdefault(archive, set()).add(stat)
+        for path in indexed.keys() - files.keys():
+            archive, member = split_member(path)
+            if member is None or archives.get(archive) not in indexed_archives[archive]:
+                db.execute("DELETE FROM files WHERE path = ?", (path,))
+        for path, (m, size) in files.items():
+            if indexed.get(path) == (m, size):
+                continue
+            db.execute("INSERT OR REPLACE INTO files VALUES (?,?,?,?,?,?,?,?,?,?,?)",
+                       (path, d, m, size) + index_record(path))
+            num_read += 1
+        for archive, (m, size) in archives.items():
+            if indexed_archives.get(archive) == {(m, size)}:
+                continue
+            try:
+                for path, buf in iter_members(archive):
+                    db.execute("INSERT OR REPLACE INTO files VALUES (?,?,?,?,?,?,?,?,?,?,?)",
+                               (path, d, m, size) + buf_index_record(buf, find_sauce(buf), path))
+                    num_read += 1
+            except (OSError, EOFError, ValueError) as E:
+                # a broken archive, it's skipped (and looked at again next time)
+                print(f"{archive}: {E}", file=sys.stderr)
+
+        db.execute("INSERT OR REPLACE INTO dirs VALUES (?, ?, ?)",
+                   (d, mtime_ns, "\n".join(subdirs)))
+        stack.extend(subdirs)
+
+    # directories which are gone
+    cond, params = under_dir("path", root)
+    for (d,) in db.execute(f"SELECT path FROM dirs WHERE {cond}", params).fetchall():
+        if d not in seen_dirs:
+            db.execute("DELETE FROM dirs WHERE path = ?", (d,))
+            db.execute("DELETE FROM files WHERE dir = ?", (d,))
+
+    db.commit()
+    return num_read
+
+def parse_index_filter(expr):
+    """
+    parse a --ssaver-filter expression of the form <field><op><value>, e.g.
+        author=somebody     (text fields: case insensitive substring match)
+        width<=cols         (numeric fields; "cols" is the terminal width)
+    returns (field, op, value)
+    """
+    for op in INDEX_FILTER_OPS:
+        field, found, value = expr.partition(op)
+        if found:
             break
+    else:
+        raise ValueError(f"filter must be <field><op><value>, op one of {' '.join(INDEX_FILTER_OPS)}, got {expr}")
+
+    field = field.strip().lower()
+    if field not in INDEX_FILTER_FIELDS:
+        raise ValueError(f"filter field must be one of {', '.join(INDEX_FILTER_FIELDS)}, got {field}")
+    if field in INDEX_NUMERIC_FIELDS:
+        if value == "cols":
+            value = os.get_terminal_size().columns
+        elif value.isdigit():
+            value = int(value)
+        else:
+            raise ValueError(f"{field} must be compared to a number or \"cols\", got {value}")
+    elif op not in ["=", "!="]:
+        raise ValueError(f"{field} can only be compared with = or !=")
+    return (field, op, value)
 
-        if cursor_pos != 0 and did_newline:
-            did_newline = False
-            first_r = False
-            first_n = False
-
-        if (state == State.CONTINUE):
-            # check if this is an escape sequence
-            if (artwork_c == ESC): # starts all escape sequences
-                write(artwork_c)
-                state = State.GET_NEXT_CHAR
-            elif (artwork_c == EOF):
-                EOF_reached = True
-                break;
-            # print characters to screen and advance cursor pos
-            else:
-                if speed > 0:
-                    # slow down output to defined speed
-                    time.sleep(1/speed)
+def load_index(db, root, filters=[]):
+    """
+    returns [(path, width), ...] for the indexed files under root that match
+    all of the filters (see parse_index_filter)
+    """
+    cond, params = under_dir("dir", os.path.abspath(root))
+    conds = [cond]
+    for field, op, value in filters:
+        column = INDEX_FILTER_FIELDS[field]
+        if field in INDEX_NUMERIC_FIELDS:
+            conds.append(f"{column} {op} ?")
+            params.append(value)
+        else:
+            # LIKE is case insensitive (for ascii)
+            conds.append(f"COALESCE({column}, '') {'NOT ' if op == '!=' else ''}LIKE ?")
+            params.append(f"%{value}%")
+    # the members of an archive are indexed in one pass, in the order they're
+    # stored, which rowid keeps (see shuffle_files)
+    return db.execute(
+        f"SELECT path, width FROM files WHERE {' AND '.join(conds)} "
+        f"ORDER BY CASE WHEN instr(path, ?) > 0 THEN substr(path, 1, instr(path, ?) - 1) ELSE path END, rowid",
+        params + [ARCHIVE_SEP, ARCHIVE_SEP]).fetchall()
+
+def shuffle_files(files):
+    """
+    returns the screen saver files ([(path, width)], see load_index) shuffled,
+    except that the members of a tar archive stay together, in the order
+    they're stored, so that it's only read once (see TarStream)
+    """
+    import random
+
+    groups = {}
+    for f in files:
+        archive, member = split_member(f[0])
+        is_tar = member is not None and not archive.upper().endswith(".ZIP")
+        groups.setdefault(archive if is_tar else f[0], []).append(f)
+    groups = list(groups.values())
+    random.shuffle(groups)
+    return [f for group in groups for f in group]
+
+# columns of the records output by --sauce-scan
+SAUCE_SCAN_FIELDS = ["path", "size", "sauce", "title", "author", "group",
+                     "date", "file_size", "data_type", "file_type", "file_type_name",
+                     "t_info_1", "t_info_2", "t_info_3", "t_info_4",
+                     "comments", "comment_lines", "t_flags", "t_info_s", "font", "error"]
+
+def scan_sauce(path):
+    """
+    the --sauce-scan record for path: a dict with SAUCE_SCAN_FIELDS as keys
+    files without SAUCE (or which can't be read) are records too, with "sauce"
+    False (and "error" set)
+    """
+    record = dict.fromkeys(SAUCE_SCAN_FIELDS)
+    record["path"] = path
+    record["sauce"] = False
+    try:
+        with ArtMap(path) as art:
+            record["size"] = len(art.mm)
+            if (art.sauce_offset < 0):
+                return record
+            sauce_record = parse_sauce_record(art.mm, art.sauce_offset)
+    except (OSError, ValueError, ParseError) as E:
+        record["error"] = str(E)
+        return record
+
+    record["sauce"] = True
+    record["title"] = sauce_record.title
+    record["author"] = sauce_record.author
+    record["group"] = sauce_record.group
+    record["date"] = sauce_record.date
+    record["file_size"] = sauce_record.file_size
+    record["data_type"] = sauce_record.data_type_name
+    record["file_type"] = sauce_record.file_type
+    record["file_type_name"] = sauce_record.file_type_name
+    record["t_info_1"] = sauce_record.t_info_1
+    record["t_info_2"] = sauce_record.t_info_2
+    record["t_info_3"] = sauce_record.t_info_3
+    record["t_info_4"] = sauce_record.t_info_4
+    record["comments"] = sauce_record.num_comments
+    record["comment_lines"] = "\n".join(sauce_record.comments)
+    record["t_flags"] = sauce_record.t_flags
+    record["t_info_s"] = sauce_record.t_info_s
+    record["font"] = sauce_record.font
+    return record
+
+def sauce_scan(dirname, out_format="jsonl", jobs=None, out=sys.stdout):
+    """
+    extract the SAUCE of every file under dirname, using a pool of jobs worker
+    processes (default: one per core), and stream them to out as JSON Lines or
+    CSV (out_format), in the order the files are found
+    throughput stats are printed to stderr at the end
+    """
+    import json
+    import csv
+    from concurrent.futures import ProcessPoolExecutor
 
-                if (artwork_c == b"\r" and did_newline and not first_r):
-                    first_r = True
-                    continue
-                if (artwork_c == b"\n" and did_newline and not first_n):
-                    first_n = True
-                    continue
+    paths = (os.path.join(d, f) for d, _, files in os.walk(dirname) for f in files)
 
-                # character needs to be converted to unicode
-                # if > 127, not strict ascii
-                # can just do artwork_c.isascii()
-                if (NO_CONVERT_ASCII and artwork_c > b"\x7f"):
-                    write(b_to_ch(artwork_c))
-                # if encountering the NUL character let it flow through as
-                # a space instead; here's an example file with NULs:
-                # https://github.com/blocktronics/artpacks/blob/master/Detention%20Block%20AA-23/ANSI_Star_Wars_misfit%20-%20ig-88.ans
-                elif (NULL_TO_SPACE and artwork_c == b"\x00"):
-                    write(b" ")
-                else:
-                    write(artwork_c)
+    if out_format == "csv":
+        csv_writer = csv.DictWriter(out, fieldnames=SAUCE_SCAN_FIELDS)
+        csv_writer.writeheader()
+        emit = csv_writer.writerow
+    else:
+        emit = lambda record: out.write(json.dumps(record) + "\n")
+
+    num_files = 0
+    num_sauce = 0
+    num_bytes = 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        for record in pool.map(scan_sauce, paths, chunksize=64):
+            emit(record)
+            num_files += 1
+            num_sauce += record["sauce"]
+            num_bytes += record["size"] or 0
+    elapsed = max(time.perf_counter() - start, 1e-9)
+    out.flush()
+
+    mb = num_bytes / (1024*1024)
+    print(f"{num_files} files ({num_sauce} with SAUCE), {mb:.1f} MB in {elapsed:.2f}s: "
+          f"{num_files/elapsed:.0f} files/s, {mb/elapsed:.1f} MB/s", file=sys.stderr)
+
+# === STATS ===
+
+# with --stats (or collect_stats) rendering is instrumented, to tell where the
+# time goes; when it's not, nothing is counted or timed: write, flush and sleep
+# are only swapped for counting versions while collecting, and elsewhere the
+# counting is behind a check for STATS (or AnsiParser.stats) being set, which
+# is only ever done per chunk or per escape sequence, never per character
+STATS = None
+STATS_FORMATS = ["text", "json"]
+
+class Stats:
+    """
+    counters and timers of the rendering (and writing out) done while collecting
+    (see collect_stats):
+        transitions: Counter of (from State, to State) of the FSM
+        csi: Counter of CSI commands (bytes) seen by the FSM, UNSUPPORTED_CSI too
+        bytes_in, bytes_out: of art read, of output written
+        writes, flushes: write and flush calls on stdout
+        write_time, sleep_time, parse_time: seconds spent writing (and
+            flushing), sleeping in the Throttle, and rendering
+        files: [(path, seconds)] it took to render each file (see load_frame),
+            cache hits included
+        cache_hits: frames found in the cache
+    """
+    def __init__(self):
+        self.transitions = collections.Counter()
+        self.csi = collections.Counter()
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.writes = 0
+        self.flushes = 0
+        self.write_time = 0.0
+        self.sleep_time = 0.0
+        self.parse_time = 0.0
+        self.files = []
+        self.cache_hits = 0
+        self.start = time.perf_counter()
+        self.end = None
+        # what start_stats swapped out, put back by stop_stats
+        self.saved = None
+
+    def counted_write(self, write):
+        def counted(data):
+            start = time.perf_counter()
+            n = write(data)
+            self.write_time += time.perf_counter() - start
+            self.writes += 1
+            self.bytes_out += len(data)
+            return n
+        return counted
+
+    def counted_flush(self, flush):
+        def counted():
+            start = time.perf_counter()
+            flush()
+            self.write_time += time.perf_counter() - start
+            self.flushes += 1
+        return counted
+
+    def counted_sleep(self, sleep):
+        def counted(seconds):
+            start = time.perf_counter()
+            sleep(seconds)
+            self.sleep_time += time.perf_counter() - start
+        return counted
+
+    def as_dict(self):
+        elapsed = (self.end or time.perf_counter()) - self.start
+        return {
+            "elapsed": elapsed,
+            # everything but writing and sleeping, reading the art included
+            "compute_time": max(elapsed - self.write_time - self.sleep_time, 0),
+            "parse_time": self.parse_time,
+            "write_time": self.write_time,
+            "sleep_time": self.sleep_time,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "writes": self.writes,
+            "flushes": self.flushes,
+            "transitions": {f"{a.name}->{b.name}": n for (a, b), n in sorted(
+                self.transitions.items(), key=lambda item: (item[0][0].value, item[0][1].value))},
+            "csi": {cmd.decode(): n for cmd, n in self.csi.most_common()},
+            "unsupported_csi": {cmd.decode(): n for cmd, n in self.csi.most_common() if cmd in UNSUPPORTED_CSI},
+            "cache_hits": self.cache_hits,
+            "files": [{"path": path, "render_time": seconds} for path, seconds in self.files],
+        }
+
+    def json(self):
+        import json
+
+        return json.dumps(self.as_dict())
+
+    def summary(self):
+        stats = self.as_dict()
+        lines = [
+            f"{stats['elapsed']:.3f}s: {stats['compute_time']:.3f}s computing "
+            f"({stats['parse_time']:.3f}s rendering), {stats['write_time']:.3f}s writing, "
+            f"{stats['sleep_time']:.3f}s sleeping",
+            f"{stats['bytes_in']} bytes in, {stats['bytes_out']} bytes out "
+            f"in {stats['writes']} writes and {stats['flushes']} flushes",
+        ]
+        if (stats["transitions"]):
+            lines.append("transitions: " + ", ".join(f"{t} {n}" for t, n in stats["transitions"].items()))
+        if (stats["csi"]):
+            lines.append("csi: " + ", ".join(
+                f"{cmd} {n}" + (" (unsupported)" if cmd in stats["unsupported_csi"] else "")
+                for cmd, n in stats["csi"].items()))
+        if (stats["files"]):
+            times = [f["render_time"] for f in stats["files"]]
+            lines.append(f"{len(times)} files rendered ({stats['cache_hits']} from the cache) in "
+                         f"{sum(times):.3f}s, {max(times):.3f}s at most")
+            lines.extend(f"  {f['render_time']:.3f}s {f['path']}" for f in stats["files"])
+        return "\n".join(lines)
+
+def start_stats(stats=None):
+    """start collecting Stats (stats, or new ones), returns them"""
+    global STATS, write, flush, sleep
+    if stats is None:
+        stats = Stats()
+    stats.saved = STATS, write, flush, sleep
+    STATS = stats
+    write = stats.counted_write(write)
+    flush = stats.counted_flush(flush)
+    sleep = stats.counted_sleep(sleep)
+    return stats
+
+def stop_stats(stats):
+    """stop collecting stats (see start_stats)"""
+    global STATS, write, flush, sleep
+    stats.end = time.perf_counter()
+    STATS, write, flush, sleep = stats.saved
+
+@contextlib.contextmanager
+def collect_stats(stats=None):
+    """
+    collect Stats (stats, or new ones) of everything rendered and written out
+    within the with block, e.g.
 
-                # typically ANSI art has a limit of 80 characters per row
-                # but particularly recently, 160 and other widths are common
-                # in any case we paramatize the width
-                if (cursor_pos < width-1):
-                    cursor_pos += 1
-                else:
-                    if (artwork_c == b"\n"):
-                        write(maybe_reset())
-                    else:
-                        write(maybe_reset_n())
-                        did_newline = True
-                    cursor_pos = 0
+        with collect_stats() as stats:
+            stream_art_file(fname)
+        print(stats.summary())
+    """
+    stats = start_stats(stats)
+    try:
+        yield stats
+    finally:
+        stop_stats(stats)
+
+class Throttle:
+    """
+    paces output to speed bytes of input per second
+
+    rather than sleeping after every character, output is held back and written
+    (and flushed) in batches, one every THROTTLE_TICK, each followed by a sleep
+    until its deadline; deadlines are worked out from a monotonic clock against
+    the start of playback, so oversleeping (timer granularity, slow writes) is
+    made up for by the next, shorter, sleep rather than adding up
+    """
+    def __init__(self, speed, tick=THROTTLE_TICK):
+        self.speed = speed
+        # bytes of input per batch
+        self.batch_size = max(1, round(speed * tick))
+        self.out = []
+        self.batch = 0 # bytes of input in the current batch
+        self.sent = 0 # bytes of input in all of the batches written out
+        self.start = None
+        self.end = None
+
+    def write(self, data):
+        """hold on to data until the current batch is written out"""
+        self.out.append(data)
+
+    def consume(self, n):
+        """account for n bytes of input, writing out the batch once it's full"""
+        if self.start is None:
+            self.start = time.monotonic()
+        self.batch += n
+        if (self.batch >= self.batch_size):
+            self.flush()
+
+    def flush(self):
+        """write out the current batch, then sleep until its deadline"""
+        write(b"".join(self.out))
+        flush()
+        self.out.clear()
+        if self.start is None:
+            self.start = time.monotonic()
+        self.sent += self.batch
+        self.batch = 0
+        delay = self.start + self.sent/self.speed - time.monotonic()
+        if (delay > 0):
+            sleep(delay)
+        self.end = time.monotonic()
+
+    def rate(self):
+        """achieved speed so far, in bytes of input per second"""
+        if self.start is None or self.end is None or self.end <= self.start:
+            return 0
+        return self.sent / (self.end - self.start)
+
+    def report(self):
+        rate = self.rate()
+        return (f"{self.sent} bytes in {(self.end or 0) - (self.start or 0):.2f}s: "
+                f"{rate:.0f} of {self.speed} bytes/s requested "
+                f"({rate*BITS_PER_BYTE:.0f} of {self.speed*BITS_PER_BYTE} baud, "
+                f"{100*rate/self.speed:.1f}%)")
+
+def play_frame(frame, cost, speed=DEFAULT_SPEED):
+    """
+    write out an already rendered frame, e.g. from the cache, made from cost
+    bytes of input; when slowed down, it goes out at the same pace as if those
+    bytes were being rendered, the frame being split up in proportion
 
-                # reset cursor_pos if this is a newline
-                if (artwork_c == b"\n" or artwork_c == b"\r"):
+    returns the Throttle used, if slowed down
+    """
+    if (speed == 0 or cost == 0):
+        write(frame)
+        flush()
+        return None
+
+    throttle = Throttle(speed)
+    for piece, n in frame_pieces(frame, cost, throttle.batch_size):
+        throttle.write(piece)
+        throttle.consume(n)
+    throttle.flush()
+    return throttle
+
+def frame_pieces(frame, cost, batch_size):
+    """
+    split up a frame made from cost bytes of input into pieces made from about
+    batch_size bytes of input each, yields (piece, bytes of input it's made from)
+    """
+    view = memoryview(frame)
+    step = max(1, len(frame) * batch_size // cost)
+    done = 0 # bytes of input accounted for
+    for i in range(0, len(frame), step):
+        # the input "used up" by the end of this piece
+        upto = cost * min(i + step, len(frame)) // len(frame)
+        yield view[i:i+step], upto - done
+        done = upto
+
+class AnsiParser:
+    """
+    incremental version of the FSM: feed it the input in chunks, split at any
+    point (even in the middle of an escape sequence), and it returns the output
+    for each, keeping its state in between; flush at the end of the input
+
+        parser = AnsiParser(width=80)
+        for chunk in chunks:
+            write(parser.feed(chunk))
+            if parser.done:
+                break
+        write(parser.flush())
+
+    nothing is read or written by the parser itself, so it works the same on a
+    file, a live pipe (tail -f), or data from a socket
+
+    SGR sequences are passed through (but for BLACK_TO_DEFAULT), unless there
+    is a palette (see PALETTES) or iCE colors (see attr_colors): then the
+    attribute is tracked and each SGR sequence is replaced by the one setting
+    the new attribute from scratch, looked up in sgr_table
+
+    the FSM goes through these states:
+        CONTINUE: printing characters to screen, until the start of an escape
+            sequence (ESC) or ^Z (EOF), which ends the art
+        GET_NEXT_CHAR: after ESC, passed through, "[" starts a CSI sequence
+        CHECK_IF_CSI: reading a CSI sequence's arguments, until its command
+        PARSE_CSI_SEQ: a CSI command (or ";") was read: the arguments so far
+            are parsed, the cursor moved accordingly, and the sequence written
+            out (this state is gone through without reading another byte)
+
+    in the CONTINUE state, whole runs of plain text (PLAIN_RUN) are decoded at
+    once through CP437_DECODING_TABLE (see CODEC_NAME), split only where they
+    hit the width; only escape sequences and newlines are stepped through byte
+    by byte
+    """
+    def __init__(self, width=DEFAULT_WIDTH, palette=None, ice=False):
+        # typically ANSI art has a limit of 80 characters per row
+        # but particularly recently, 160 and other widths are common
+        # in any case we paramatize the width
+        self.width = width
+        self.state = State.CONTINUE
+        # set once ^Z is read, anything after it is ignored
+        self.done = False
+        # not the same as the byte position in the input
+        # cursor_pos is with respect to column position within a row
+        self.cursor_pos = 0
+        self.saved_cursor = 0
+        # "did_newline" serves as a flag which is enabled when we write out a
+        # newline character because "cursor_pos" is at max width
+        #
+        # the flag is needed because the next character to write out from the
+        # input might itself be a newline character (in which case we'd double
+        # newline)
+        # however, it might not be the *immediate* next character because
+        # some ANSI escape sequence(s) might also precede it
+        #
+        # we also can't rely on cursor_pos == 0 alone because the input may
+        # purposely have several newlines at pos 0 for artistic effect
+        #
+        # "did_newline" should be disabled after cursor moves past position 0
+        self.did_newline = False
+        # "first_r" and "first_n" are flags for the situation when the input
+        # purposefully has multiple newlines in a row
+        # when we write a newline because width is reached we want to ignore
+        # the immediate next printable character if it is also "\r" or "\n",
+        # but any subsequent ones should be let through
+        #
+        # these should be disabled alongside disabling of "did_newline"
+        self.first_r = False
+        self.first_n = False
+        self.cmd_arg_buffer = bytearray() # the CSI argument being read
+        self.cmd_args = [] # the full arguments of the CSI sequence so far
+        self.attr = DEFAULT_ATTR
+        self.sgr_table = None
+        if palette is not None or ice:
+            self.sgr_table = sgr_table(palette or "ansi", ice)
+        # the Stats being collected, if any (see collect_stats)
+        self.stats = STATS
+
+    def feed(self, chunk):
+        """
+        chunk: bytes-like (bytes, memoryview, ...), the next part of the input
+
+        returns the output for it, which may be empty (e.g. the middle of an
+        escape sequence, or anything after ^Z)
+        """
+        if (self.done):
+            return b""
+        stats = self.stats
+        if stats is not None:
+            feed_start = time.perf_counter()
+            stats.bytes_in += len(chunk)
+
+        charmap_decode = codecs.charmap_decode
+        reset_n = maybe_reset_n()
+        width = self.width
+
+        # the state is kept in locals while going through the chunk
+        state = self.state
+        cursor_pos = self.cursor_pos
+        saved_cursor = self.saved_cursor
+        did_newline = self.did_newline
+        first_r = self.first_r
+        first_n = self.first_n
+        cmd_arg_buffer = self.cmd_arg_buffer
+        cmd_args = self.cmd_args
+        attr = self.attr
+        table = self.sgr_table
+
+        out = []
+        i = 0
+        chunk_len = len(chunk)
+        while (i < chunk_len):
+            if cursor_pos != 0 and did_newline:
+                did_newline = False
+                first_r = False
+                first_n = False
+
+            if (state == State.CONTINUE):
+                run = PLAIN_RUN.match(chunk, i)
+                if run is not None:
+                    start, i = run.span()
+                    # write out the run in pieces, each ending either at the
+                    # end of the run or where the cursor reaches the width
+                    while (start < i):
+                        room = max(width - cursor_pos, 1)
+                        stop = min(start + room, i)
+                        out.append(charmap_decode(chunk[start:stop], "strict", CP437_DECODING_TABLE)[0]
+                                   .encode("utf-8", "surrogateescape"))
+                        if (stop - start == room):
+                            # the cursor moved past position 0 before the
+                            # wrap, which is what disables the flags
+                            if (room > 1):
+                                first_r = False
+                                first_n = False
+                            out.append(reset_n)
+                            did_newline = True
+                            cursor_pos = 0
+                        else:
+                            cursor_pos += stop - start
+                        start = stop
+                    continue
+
+                artwork_c = chunk[i:i+1]
+                i += 1
+                # check if this is an escape sequence
+                if (artwork_c == ESC): # starts all escape sequences
+                    out.append(artwork_c)
+                    state = State.GET_NEXT_CHAR
+                    if stats is not None:
+                        stats.transitions[State.CONTINUE, State.GET_NEXT_CHAR] += 1
+                elif (artwork_c == EOF):
+                    self.done = True
+                    break
+                # otherwise it's a "\r" or "\n"
+                else:
+                    if (artwork_c == b"\r" and did_newline and not first_r):
+                        first_r = True
+                        continue
+                    if (artwork_c == b"\n" and did_newline and not first_n):
+                        first_n = True
+                        continue
+
+                    out.append(artwork_c)
+                    if (cursor_pos >= width-1):
+                        if (artwork_c == b"\n"):
+                            out.append(maybe_reset())
+                        else:
+                            out.append(reset_n)
+                            did_newline = True
+                    # reset cursor_pos, this is a newline
                     cursor_pos = 0
-        elif (state == State.GET_NEXT_CHAR):
-            write(artwork_c)
-            if (artwork_c == b"["):
-                state = State.CHECK_IF_CSI
-        elif (state == State.CHECK_IF_CSI):
-            if (artwork_c in CSI or artwork_c == b";"):
-                state = State.PARSE_CSI_SEQ
-                cmd = artwork_c
+                continue
+
+            artwork_c = chunk[i:i+1]
+            i += 1
+            if (state == State.GET_NEXT_CHAR):
+                out.append(artwork_c)
+                if (artwork_c == b"["):
+                    state = State.CHECK_IF_CSI
+                    if stats is not None:
+                        stats.transitions[State.GET_NEXT_CHAR, State.CHECK_IF_CSI] += 1
+                continue
+            # State.CHECK_IF_CSI
             # there are some private sequences of the form CSI ? <some_num> <cmd>
-            # adding "?" to buffer will break the int conversion later on of "cmd_arg_buffer"
-            # later on, and we don't rely on "?" internally anyway, so just let it flow through
-            # nothing about the cursor position needs to change
+            # adding "?" to the argument would break its int conversion later
+            # on, and we don't rely on "?" internally anyway, so just let it
+            # flow through, nothing about the cursor position needs to change
             # this .ANS file shows an example ("\x1b[?33h" at the beginning):
             # https://github.com/blocktronics/artpacks/blob/master/ACiD%20Trip/ziiig-LOL.ANS
-            elif (artwork_c == b"?"):
-                write(artwork_c)
-            else:
-                # chars used in esqcape sequences are all ascii
-                # store them as such
-                cmd_arg_buffer.append(artwork_c.decode("ascii"))
-        elif (state == State.PARSE_CSI_SEQ):
-            # concat the argument parts and convert to int
-            # add to the list of arguments for this CSI command
+            if (artwork_c == b"?"):
+                out.append(artwork_c)
+                continue
+            if (artwork_c not in CSI and artwork_c != b";"):
+                cmd_arg_buffer += artwork_c
+                continue
+
+            # State.PARSE_CSI_SEQ, without reading another byte
+            cmd = artwork_c
+            if stats is not None:
+                stats.transitions[State.CHECK_IF_CSI, State.PARSE_CSI_SEQ] += 1
+                if cmd in CSI:
+                    stats.csi[bytes(cmd)] += 1
+                    stats.transitions[State.PARSE_CSI_SEQ, State.CONTINUE] += 1
+                else:
+                    stats.transitions[State.PARSE_CSI_SEQ, State.CHECK_IF_CSI] += 1
+            # convert the argument to int, and add it to the list of arguments
+            # for this CSI command
             if (len(cmd_arg_buffer) > 0):
-                cmd_args.append( int(''.join(cmd_arg_buffer)) )
-            # reset the buffer for the next arg
-            cmd_arg_buffer = []
+                cmd_args.append(int(cmd_arg_buffer))
+            cmd_arg_buffer = bytearray()
 
             # CSI n (E | F)
             # Cursor Next Line (CNL) or Cursor Previous Line (CPL)
             # move cursor to next (E) or previous (F) line
             if (cmd == b'E' or cmd == b'F'):
                 cursor_pos = 0
-                write(maybe_reset_n())
+                out.append(reset_n)
 
             # CSI n G
             # Cursor Horizontal Absolute (CHA)
@@ -689,16 +1824,14 @@ def stream_ansi(fs, speed=DEFAULT_SPEED, width=DEFAULT_WIDTH):
 
             # CSI n C
             # Cursor Forward (CUF)
-            # move cursor forward
             if (cmd == b'C'):
                 cursor_pos = cursor_pos + (cmd_args[0] if len(cmd_args) > 0 else 1)
                 if (cursor_pos >= width):
-                    write(maybe_reset_n())
+                    out.append(reset_n)
                     cursor_pos = cursor_pos % width
 
             # CSI n D
             # Cursor Backward (CUB)
-            # move cursor back
             if (cmd == b'D'):
                 if (cursor_pos != 0):
                     cursor_pos = cursor_pos - (cmd_args[0] if len(cmd_args) > 0 else 1)
@@ -716,35 +1849,1423 @@ def stream_ansi(fs, speed=DEFAULT_SPEED, width=DEFAULT_WIDTH):
             # CSI char or ; puts us in parsing state but only
             # CSI char ends checking/parsing
             if cmd in CSI:
+                if (cmd == b'm' and table is not None):
+                    attr = apply_sgr_args(attr, tuple(cmd_args))
+                    out.append(table[attr])
+                else:
+                    out.append(csi_passthrough(cmd, tuple(cmd_args)))
+                cmd_args = []
+                state = State.CONTINUE
+            else:
+                state = State.CHECK_IF_CSI
+
+        self.state = state
+        self.cursor_pos = cursor_pos
+        self.saved_cursor = saved_cursor
+        self.did_newline = did_newline
+        self.first_r = first_r
+        self.first_n = first_n
+        self.cmd_arg_buffer = cmd_arg_buffer
+        self.cmd_args = cmd_args
+        self.attr = attr
+        if stats is not None:
+            stats.parse_time += time.perf_counter() - feed_start
+        return b"".join(out)
+
+    def flush(self):
+        """
+        returns the output for the end of the input: the final reset
+
+        a sequence left unfinished by the input is dropped
+        """
+        self.done = True
+        return RESET_N
+
+@functools.lru_cache(maxsize=SEQUENCE_CACHE_SIZE)
+def csi_passthrough(cmd, args):
+    """
+    the arguments (tuple of ints) and command of a CSI sequence, as output
+    since art only uses a handful of different sequences, they're only ever
+    built once each
+    """
+    # this is for SGR mode
+    # instead of setting background black
+    # set it to default
+    # only with "m" else would interfere with other CSI commands
+    # like cursor movements, etc
+    if (BLACK_TO_DEFAULT and cmd == b'm' and 40 in args):
+        args = [ca if ca != 40 else 49 for ca in args]
+    return ';'.join(map(str, args)).encode('utf8') + cmd
+
+def read_chunks(fs, size=CHUNK_SIZE):
+    """
+    generates what's read from fs, up to size bytes at a time
+
+    when fs is buffered (e.g. sys.stdin.buffer) read1 is used, which returns
+    whatever is available rather than waiting for all size bytes, so that
+    output keeps up with a live pipe (e.g. tail -f)
+    """
+    read = getattr(fs, "read1", fs.read)
+    return iter(lambda: read(size), b"")
 
-                # this is for SGR mode
-                # instead of setting background black
-                # set it to default
-                # only with "m" else would interfere with other CSI commands
-                # like cursor movements, etc
-                if (BLACK_TO_DEFAULT and cmd == b'm' and 40 in cmd_args):
-                    cmd_args = [ca if ca != 40 else 49 for ca in cmd_args]
+def stream_ansi(fs, speed=DEFAULT_SPEED, width=DEFAULT_WIDTH, palette=None, ice=False):
+    """
+    fs: filestream is a raw I/O stream
+        e.g. open(fname, "rb") or open(fname, "rb", encoding="utf-8").buffer
+             or sys.stdin.buffer, etc
 
-                cmd_seq = ';'.join(map(lambda num: str(num), cmd_args))
+    the input is run through an AnsiParser (with palette and ice) a chunk at a
+    time; when slowed down each chunk is about what the Throttle writes out per
+    batch
 
-                for ca in cmd_seq:
-                    write(ca.encode('utf8'))
+    returns the Throttle used, if slowed down
+    """
+    if (width == 0):
+        width = find_width(fs)
 
-                write(cmd)
+    if (speed == 0):
+        return stream_ansi_fast(fs, width=width, palette=palette, ice=ice)
+
+    # output is held back by the throttle, and written out in batches
+    throttle = Throttle(speed)
+    parser = AnsiParser(width, palette=palette, ice=ice)
+    for chunk in read_chunks(fs, throttle.batch_size):
+        throttle.write(parser.feed(chunk))
+        # every byte read counts toward the speed, escape sequences
+        # included, as it would over a modem
+        throttle.consume(len(chunk))
+        if (parser.done):
+            break
+    throttle.write(parser.flush())
+    throttle.flush()
+    return throttle
 
-                cmd = None
-                cmd_args = []
-                state = State.CONTINUE
-            else:
-                state = State.CHECK_IF_CSI
-        # end state switch
-        sys.stdout.buffer.flush()
-    # end while loop
-    write(RESET_N)
-    sys.stdout.buffer.flush()
+def stream_ansi_fast(fs, width=DEFAULT_WIDTH, palette=None, ice=False):
+    """
+    throughput version of stream_ansi, used when there is no slowdown (speed 0)
+
+    fs: filestream is a raw I/O stream
+        e.g. open(fname, "rb") or open(fname, "rb", encoding="utf-8").buffer
+             or sys.stdin.buffer, etc
+    """
+    if (width == 0):
+        width = find_width(fs)
+    render_chunks(read_chunks(fs), width=width, palette=palette, ice=ice)
+
+def stream_art_file(fname, speed=DEFAULT_SPEED, width=DEFAULT_WIDTH, grid=False, palette=None, ice=None,
+                    fit=None, fit_width=DEFAULT_WIDTH):
+    """
+    render the art file fname
+
+    with no slowdown (speed 0) the file is memory mapped (see ArtMap) and
+    rendered straight out of a memoryview of the art region, CHUNK_SIZE bytes
+    at a time, otherwise it's streamed through stream_ansi
+
+    with grid, the art is instead interpreted into a ScreenBuffer, which is then
+    written out as one frame (see play_frame), as is binary text (see
+    binary_screen), which has no stream to pass through, and art wider than
+    fit_width, with fit (see fit_screen)
+
+    ice None means iCE colors if the SAUCE says so
+
+    returns the Throttle used, if slowed down
+    """
+    with ArtMap(fname) as art:
+        if (width == 0 or art.format != "ansi"):
+            width = art.width()
+        ice = art.ice(ice)
+        grid = grid or art.format != "ansi" or (fit is not None and width > fit_width)
+        if (grid):
+            frame = render_art(art.art, width=width, grid=grid, palette=palette, ice=ice,
+                               art_format=art.format, fit=fit, fit_width=fit_width)
+            art_size = len(art.art)
+        elif (speed == 0):
+            chunks = (art.art[i:i+CHUNK_SIZE] for i in range(0, len(art.art), CHUNK_SIZE))
+            render_chunks(chunks, width=width, palette=palette, ice=ice)
+            return None
+
+        # an archive member has been decompressed into memory already
+        member = art.mm if art.fs is None else None
+
+    if (grid):
+        return play_frame(frame, art_size, speed=speed)
+    with (io.BytesIO(member) if member is not None else open_art(fname)) as fs:
+        return stream_ansi(fs, speed=speed, width=width, palette=palette, ice=ice)
+
+def render_chunks(chunks, width=DEFAULT_WIDTH, palette=None, ice=False):
+    """
+    write out the translation of chunks (see translate_chunks), a chunk at a time
+    """
+    for data in translate_chunks(chunks, width=width, palette=palette, ice=ice):
+        write(data)
+        flush()
+
+def translate_chunks(chunks, width=DEFAULT_WIDTH, palette=None, ice=False):
+    """
+    chunks: iterable of bytes-like objects (bytes, memoryview, ...) which
+        together make up the input, split at arbitrary points
+
+    generates the output for each chunk in turn (see AnsiParser), then the final
+    reset
+    """
+    parser = AnsiParser(width, palette=palette, ice=ice)
+    for chunk in chunks:
+        yield parser.feed(chunk)
+        if (parser.done):
+            break
+    yield parser.flush()
+
+def frame_cache_key(buf, width, grid=False, palette=None, ice=False, art_format="ansi",
+                    fit=None, fit_width=DEFAULT_WIDTH):
+    """
+    the cache key for the art in buf (bytes-like) rendered at width: a hash of
+    its content along with everything else that changes the output, which for
+    fit includes the width it's fit to, so each terminal width has its own
+    """
+    import hashlib
+
+    # the palette by name: "ansi" maps to no colors, but still rewrites SGRs
+    options = (width, grid, palette, ice,
+               NO_CONVERT_ASCII, NULL_TO_SPACE, BLACK_TO_DEFAULT, RESET_ON_NL, art_format,
+               fit and (fit, fit_width))
+    key = hashlib.sha256(buf)
+    key.update(repr(options).encode())
+    return key.hexdigest()
+
+def evict_frames(cache_dir=FRAME_CACHE_DIR, max_size=FRAME_CACHE_SIZE):
+    """remove the least recently used frames until the cache is under max_size"""
+    frames = []
+    with os.scandir(cache_dir) as entries:
+        for entry in entries:
+            st = entry.stat()
+            frames.append((st.st_mtime_ns, st.st_size, entry.path))
+    total = sum(size for _, size, _ in frames)
+    for _, size, path in sorted(frames):
+        if (total <= max_size):
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            # another process got to it first
+            pass
+        total -= size
+
+def render_art(buf, width=DEFAULT_WIDTH, grid=False, palette=None, ice=False, art_format="ansi",
+               fit=None, fit_width=DEFAULT_WIDTH):
+    """
+    returns the complete rendered output (at speed 0) of the art in buf, of
+    art_format (see art_format), binary text always going through the grid, as
+    does art wider than fit_width, with fit (see fit_screen)
+    """
+    if (art_format == "ansi" and not grid and not (fit is not None and width > fit_width)):
+        # timed by the AnsiParser itself
+        chunks = (buf[i:i+CHUNK_SIZE] for i in range(0, len(buf), CHUNK_SIZE))
+        return b"".join(translate_chunks(chunks, width=width, palette=palette, ice=ice))
+
+    start = time.perf_counter()
+    if (art_format != "ansi"):
+        screen, colors = binary_screen(buf, width, art_format)
+        # an XBin's own palette stands in for a palette of colors (not "ansi")
+        if colors is not None and palette is not None and PALETTES[palette] is not None:
+            palette = colors
+    else:
+        screen = ScreenBuffer(width)
+        screen.feed(buf)
+    frame = fit_frame(screen, fit, fit_width, palette, ice)
+    if STATS is not None:
+        STATS.bytes_in += len(buf)
+        STATS.parse_time += time.perf_counter() - start
+    return frame
+
+def cached_frame(fname, width=DEFAULT_WIDTH, grid=False, palette=None, ice=None, fit=None, fit_width=DEFAULT_WIDTH,
+                 cache_dir=FRAME_CACHE_DIR):
+    """
+    returns the complete rendered output (at speed 0) of the art file fname,
+    from the cache if it's been rendered before, otherwise rendering it and
+    adding it to the cache, along with the size of the art it's made from
+
+    frames are content addressed (see frame_cache_key), so a file that changes
+    just gets a new frame, and the old one eventually ages out; a frame's mtime
+    is its last use, which is what evict_frames goes by
+    """
+    with ArtMap(fname) as art:
+        if (width == 0 or art.format != "ansi"):
+            width = art.width()
+        ice = art.ice(ice)
+        art_size = len(art.art)
+        path = os.path.join(cache_dir, frame_cache_key(art.mm, width, grid, palette, ice, art.format,
+                                                       fit, fit_width))
+        try:
+            with open(path, "rb") as f:
+                frame = f.read()
+            os.utime(path)
+            if STATS is not None:
+                STATS.cache_hits += 1
+            return frame, art_size
+        except OSError:
+            # not cached yet, or no usable cache at all
+            pass
+
+        frame = render_art(art.art, width=width, grid=grid, palette=palette, ice=ice, art_format=art.format,
+                           fit=fit, fit_width=fit_width)
+
+    # write to a temporary name first, so no other process sees half a frame;
+    # a cache that can't be written to (read-only, full) just isn't used, the
+    # frame is rendered and good to go either way
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(tmp_path, "wb") as f:
+            f.write(frame)
+        os.replace(tmp_path, path)
+        evict_frames(cache_dir)
+    except OSError:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+    return frame, art_size
+
+def load_frame(fname, width=DEFAULT_WIDTH, grid=False, palette=None, ice=None, fit=None, fit_width=DEFAULT_WIDTH,
+               use_cache=CACHE_FRAMES):
+    """
+    returns the complete rendered output (at speed 0) of the art file fname,
+    along with the size of the art it's made from, through the cache with
+    use_cache (see cached_frame)
+    """
+    start = time.perf_counter()
+    if (use_cache):
+        loaded = cached_frame(fname, width=width, grid=grid, palette=palette, ice=ice, fit=fit, fit_width=fit_width)
+    else:
+        with ArtMap(fname) as art:
+            if (width == 0 or art.format != "ansi"):
+                width = art.width()
+            frame = render_art(art.art, width=width, grid=grid, palette=palette, ice=art.ice(ice),
+                               art_format=art.format, fit=fit, fit_width=fit_width)
+            loaded = frame, len(art.art)
+    if STATS is not None:
+        STATS.files.append((fname, time.perf_counter() - start))
+    return loaded
+
+class Prefetcher:
+    """
+    reads and renders files ([(path, width)], see load_index) in a background
+    thread, up to count of them ahead of the one being iterated over, and as
+    long as their frames fit in max_size (one always does), so that the next
+    piece is ready to go as soon as the last one is done, even on a slow (e.g.
+    network) filesystem
+
+        for path, loaded, error in Prefetcher(files, load):
+            frame, art_size = loaded # what load(path, width) returned
+
+    error is the exception load raised, if it failed (loaded being None)
+    """
+    def __init__(self, files, load, count=SSAVER_PREFETCH, max_size=SSAVER_PREFETCH_SIZE):
+        self.files = files
+        self.load = load
+        self.count = max(count, 1)
+        self.max_size = max_size
+        self.ready = collections.deque()
+        self.size = 0 # total size of the frames in ready
+        self.done = False
+        self.cond = threading.Condition()
+        # daemon, so that it doesn't hold up exiting, e.g. on ^C
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        try:
+            for path, width in self.files:
+                loaded = None
+                error = None
+                try:
+                    loaded = self.load(path, width)
+                except Exception as E:
+                    # anything, e.g. a KeyError or BadZipFile out of a broken
+                    # archive, is that piece's error, not the end of the thread
+                    error = E
+                size = len(loaded[0]) if loaded else 0
+                with self.cond:
+                    self.cond.wait_for(lambda: len(self.ready) < self.count and
+                                       (not self.ready or self.size + size <= self.max_size))
+                    self.ready.append((path, loaded, error))
+                    self.size += size
+                    self.cond.notify_all()
+        finally:
+            # whatever happens, the iterating side is woken up to see it's over
+            with self.cond:
+                self.done = True
+                self.cond.notify_all()
+
+    def __iter__(self):
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self.ready or self.done)
+                if not self.ready:
+                    return
+                path, loaded, error = self.ready.popleft()
+                self.size -= len(loaded[0]) if loaded else 0
+                self.cond.notify_all()
+            yield path, loaded, error
+
+# === TOKENIZER ===
+
+# tokenize_ansi splits art up into events, each a tuple (kind, data, cmd):
+#   TEXT: data is a memoryview of a run of glyphs (any bytes other than the
+#       controls below, CP437 not yet translated)
+#   SGR: data is the parameter bytes (eg b"1;40"), cmd is b"m"
+#   CURSOR: a cursor movement, cmd is one of CURSOR_CMDS
+#   ERASE: a screen or line erase, cmd is one of ERASE_CMDS
+#   PRIVATE: a private sequence, data starting with one of b"?=<>", eg CSI ? 7 h
+#   CSI: any other CSI sequence
+#   CONTROL: data is the control character: carriage return, newline, tab, or
+#       a lone ESC (one that doesn't start a CSI sequence)
+#   EOF: ^Z, the end of the art, after which nothing more is generated
+Token = Enum("Token", ["TEXT", "SGR", "CURSOR", "ERASE", "PRIVATE", "CSI", "CONTROL", "EOF"])
+
+CURSOR_CMDS = [b"A", b"B", b"C", b"D", b"E", b"F", b"G", b"H", b"f", b"s", b"u"]
+ERASE_CMDS = [b"J", b"K"]
+PRIVATE_PREFIXES = b"?=<>"
+
+ANSI_TOKEN = re.compile(
+    # 1: plain text
+    rb"([^\r\n\t\x1a\x1b]+)"
+    # 2, 3: CSI parameter bytes and command (intermediate bytes are skipped)
+    rb"|\x1b\[([\x30-\x3f]*)[\x20-\x2f]*([\x40-\x7e])"
+    # 4: control character or lone ESC
+    rb"|(.)",
+    re.DOTALL)
+
+@functools.lru_cache(maxsize=SEQUENCE_CACHE_SIZE)
+def csi_kind(params, cmd):
+    """the Token kind of the CSI sequence with params and cmd"""
+    if (params[:1] and params[:1] in PRIVATE_PREFIXES):
+        return Token.PRIVATE
+    if (cmd == b"m"):
+        return Token.SGR
+    if cmd in CURSOR_CMDS:
+        return Token.CURSOR
+    if cmd in ERASE_CMDS:
+        return Token.ERASE
+    return Token.CSI
+
+@functools.lru_cache(maxsize=SEQUENCE_CACHE_SIZE)
+def csi_args(params):
+    """
+    the numeric arguments in params (bytes, eg b"1;40"), a missing one being 0;
+    raises ValueError if they're not numbers (eg b"1:2")
+    """
+    return tuple(int(a) if a else 0 for a in params.split(b";"))
+
+def tokenize_ansi(buf):
+    """
+    generates the events (see Token) in the art in buf (bytes-like), up to ^Z
+    if there is one
+
+    text is never copied, each TEXT event is a slice of a memoryview of buf;
+    nothing is interpreted either (eg no BLACK_TO_DEFAULT), that's up to the
+    consumer
+    """
+    view = memoryview(buf)
+    for token in ANSI_TOKEN.finditer(view):
+        text, params, cmd, control = token.groups()
+        if text is not None:
+            start, end = token.span()
+            yield Token.TEXT, view[start:end], None
+        elif cmd is not None:
+            yield csi_kind(params, cmd), params, cmd
+        elif control == EOF:
+            yield Token.EOF, control, None
+            return
+        else:
+            yield Token.CONTROL, control, None
+
+# === VIRTUAL SCREEN ===
+
+# rather than passing sequences through to the terminal, they can be interpreted
+# into a virtual screen (see ScreenBuffer), which is then written out as a frame
+# with only the sequences needed to reproduce it
+
+# attributes of each cell are kept VGA style, packed into an int:
+#   bits 0-2: foreground color (in SGR order, ie 30-37)
+#   bit 3: bold (bright foreground)
+#   bits 4-6: background color (in SGR order, ie 40-47)
+#   bit 7: blink
+#   bit 8: inverse (reverse video)
+ATTR_FG = 0x007
+ATTR_BOLD = 0x008
+ATTR_BG = 0x070
+ATTR_BLINK = 0x080
+ATTR_INVERSE = 0x100
+# SGR 0 (reset/normal) is white on black without any styles
+DEFAULT_ATTR = 0x007
+
+# the 16 colors of the VGA text mode palette, the 8 in SGR order and then
+# their bright (bold) versions, so a foreground is the attribute's bits 0-3
+VGA_PALETTE = ["#000000", "#aa0000", "#00aa00", "#aa5500", "#0000aa", "#aa00aa", "#00aaaa", "#aaaaaa",
+               "#555555", "#ff5555", "#55ff55", "#ffff55", "#5555ff", "#ff55ff", "#55ffff", "#ffffff"]
+
+# colors can be remapped (--palette) to a palette: either "ansi", the 16
+# standard colors of the terminal (whatever it makes of them), or a list of 16
+# "#rrggbb" colors in VGA_PALETTE order, output as 24-bit (true color) SGR
+PALETTES = {
+    "ansi": None,
+    "vga": VGA_PALETTE,
+}
+
+# in the grid every byte is a glyph, control characters included, since only
+# the sequences interpreted by ScreenBuffer should move the cursor
+GRID_DECODING_TABLE = "".join(
+    " " if (NULL_TO_SPACE and i == 0x00) else c
+    for i, c in enumerate(CP437_CODEPOINTS))
+# cells at the end of a row that are blank and can be left off
+BLANK_CHARS = b" \x00\xff"
+
+@functools.lru_cache(maxsize=SEQUENCE_CACHE_SIZE)
+def apply_sgr(attr, params):
+    """
+    returns the attribute attr becomes after SGR with params (bytes, eg b"1;40")
+    SGR codes which can't be shown in the VGA style attribute are ignored
+    """
+    return apply_sgr_args(attr, csi_args(params))
+
+@functools.lru_cache(maxsize=SEQUENCE_CACHE_SIZE)
+def apply_sgr_args(attr, args):
+    """same as apply_sgr, but with args already numbers (tuple of ints)"""
+    # no arguments at all is the same as 0
+    for p in args or (0,):
+        if p == 0:
+            attr = DEFAULT_ATTR
+        elif p == 1:
+            attr |= ATTR_BOLD
+        elif p == 5 or p == 6:
+            attr |= ATTR_BLINK
+        elif p == 7:
+            attr |= ATTR_INVERSE
+        elif p == 22:
+            attr &= ~ATTR_BOLD
+        elif p == 25:
+            attr &= ~ATTR_BLINK
+        elif p == 27:
+            attr &= ~ATTR_INVERSE
+        elif 30 <= p <= 37:
+            attr = (attr & ~ATTR_FG) | (p - 30)
+        elif p == 39:
+            attr = (attr & ~ATTR_FG) | (DEFAULT_ATTR & ATTR_FG)
+        elif 40 <= p <= 47:
+            attr = (attr & ~ATTR_BG) | ((p - 40) << 4)
+        elif p == 49:
+            attr = (attr & ~ATTR_BG) | (DEFAULT_ATTR & ATTR_BG)
+        # the "bright" colors are the bold/blink ones on VGA
+        elif 90 <= p <= 97:
+            attr = (attr & ~ATTR_FG) | (p - 90) | ATTR_BOLD
+        elif 100 <= p <= 107:
+            attr = (attr & ~ATTR_BG) | ((p - 100) << 4) | ATTR_BLINK
+    return attr
+
+def sgr_params(prev, new):
+    """SGR parameters switching what differs between attributes prev and new"""
+    params = []
+    if (prev & ATTR_BOLD and not new & ATTR_BOLD):
+        params.append(b"22")
+    if (prev & ATTR_BLINK and not new & ATTR_BLINK):
+        params.append(b"25")
+    if (prev & ATTR_INVERSE and not new & ATTR_INVERSE):
+        params.append(b"27")
+    if (new & ATTR_BOLD and not prev & ATTR_BOLD):
+        params.append(b"1")
+    if (new & ATTR_BLINK and not prev & ATTR_BLINK):
+        params.append(b"5")
+    if (new & ATTR_INVERSE and not prev & ATTR_INVERSE):
+        params.append(b"7")
+    if (new & ATTR_FG != prev & ATTR_FG):
+        params.append(str(30 + (new & ATTR_FG)).encode())
+    if (new & ATTR_BG != prev & ATTR_BG):
+        bg = (new & ATTR_BG) >> 4
+        params.append(b"49" if (BLACK_TO_DEFAULT and bg == 0) else str(40 + bg).encode())
+    return params
+
+@functools.lru_cache(maxsize=None)
+def attr_colors(attr, ice=False):
+    """
+    the (foreground, background) VGA_PALETTE indices of attribute attr
+
+    with iCE colors (see sauce_flags) blink instead makes the background bright,
+    giving 16 background colors (this is how the art was drawn, e.g. in PabloDraw)
+    """
+    fg = attr & (ATTR_FG | ATTR_BOLD)
+    bg = (attr & ATTR_BG) >> 4
+    if (ice and attr & ATTR_BLINK):
+        bg |= 0x8
+    if (attr & ATTR_INVERSE):
+        fg, bg = bg | (attr & ATTR_BOLD), fg & ATTR_FG
+    return fg, bg
+
+def attr_sgr(attr, palette="ansi", ice=False):
+    """
+    the SGR parameters (and command) setting the terminal to attribute attr
+    from scratch, with the colors remapped to palette (see PALETTES), or a
+    tuple of colors like those in it (e.g. an XBin's own, see xbin_palette)
+    """
+    fg, bg = attr_colors(attr, ice)
+    colors = PALETTES[palette] if type(palette) == str else palette
+    params = [b"0"]
+    if colors is None:
+        if (fg & 0x8):
+            params.append(b"1")
+        if (fg & 0x7 != DEFAULT_ATTR & ATTR_FG):
+            params.append(str(30 + (fg & 0x7)).encode())
+    elif (fg != DEFAULT_ATTR & ATTR_FG):
+        r, g, b = bytes.fromhex(colors[fg][1:])
+        params.append(f"38;2;{r};{g};{b}".encode())
+    if (attr & ATTR_BLINK and not ice):
+        params.append(b"5")
+    if (bg == 0):
+        # the terminal's own default background, unless black is wanted
+        if not BLACK_TO_DEFAULT:
+            params.append(b"40")
+    elif colors is None:
+        # bright backgrounds (iCE colors) are the aixterm ones
+        params.append(str(40 + bg if bg < 8 else 100 + bg - 8).encode())
+    else:
+        r, g, b = bytes.fromhex(colors[bg][1:])
+        params.append(f"48;2;{r};{g};{b}".encode())
+    return b";".join(params) + b"m"
+
+@functools.lru_cache(maxsize=None)
+def sgr_table(palette="ansi", ice=False):
+    """
+    attr_sgr of every attribute, precomputed, so that setting an attribute is
+    a lookup by attribute (there are only 2^9 of them)
+    """
+    return tuple(attr_sgr(attr, palette, ice) for attr in range(ATTR_INVERSE << 1))
+
+@functools.lru_cache(maxsize=SEQUENCE_CACHE_SIZE)
+def sgr_transition(prev, new, palette=None, ice=False):
+    """
+    the shortest SGR sequence taking the terminal from attribute prev to new,
+    either switching only what changed, or resetting and starting from scratch
+
+    with a palette, or iCE colors, it's always from scratch (see sgr_table)
+    """
+    if (prev == new):
+        return b""
+    if palette is not None or ice:
+        return ESC + b"[" + sgr_table(palette or "ansi", ice)[new]
+    params = min(sgr_params(prev, new),
+                 [b"0"] + sgr_params(DEFAULT_ATTR, new),
+                 key=lambda params: len(b";".join(params)))
+    return ESC + b"[" + b";".join(params) + b"m"
+
+class ScreenBuffer:
+    """
+    a virtual screen the art's sequences are interpreted into: width columns
+    and as many rows as the art needs
+
+    cells are stored row major in two flat arrays, chars (the CP437 byte of
+    each) and attrs (see DEFAULT_ATTR), so a row, or part of it, is a slice
+
+    the cursor is moved by H/f, A/B/C/D, E/F/G, s/u, carriage return, newline
+    and tab; J/K erase, m sets the attribute; other sequences are ignored, as
+    are moves below SCREEN_MAX_ROWS, and anything put past it is dropped
+    """
+    def __init__(self, width=DEFAULT_WIDTH):
+        self.width = width
+        self.num_rows = 0
+        self.chars = bytearray()
+        self.attrs = array.array("H")
+        self.x = 0
+        self.y = 0
+        self.saved = (0, 0)
+        self.attr = DEFAULT_ATTR
+
+    def grow(self, num_rows):
+        if (num_rows > self.num_rows):
+            num_cells = (num_rows - self.num_rows) * self.width
+            self.chars += b" " * num_cells
+            self.attrs.extend(array.array("H", [DEFAULT_ATTR]) * num_cells)
+            self.num_rows = num_rows
+
+    def put(self, text):
+        """write out the cells in text at the cursor, wrapping at the width"""
+        pos = 0
+        while (pos < len(text)):
+            # the cursor stays past the last column until something is put
+            if (self.x >= self.width):
+                self.x = 0
+                self.y += 1
+            if (self.y >= SCREEN_MAX_ROWS):
+                return
+            n = min(self.width - self.x, len(text) - pos)
+            self.grow(self.y + 1)
+            i = self.y * self.width + self.x
+            self.chars[i:i+n] = text[pos:pos+n]
+            self.attrs[i:i+n] = array.array("H", [self.attr]) * n
+            self.x += n
+            pos += n
+
+    def load(self, chars, attrs):
+        """
+        replace the screen with the cells in chars (bytes-like) and attrs (an
+        array like self.attrs), row by row, the last row padded out if short
+        """
+        pad = -len(chars) % self.width
+        self.chars = bytearray(chars) + b" " * pad
+        self.attrs = attrs
+        self.attrs.extend(array.array("H", [DEFAULT_ATTR]) * pad)
+        self.num_rows = len(self.chars) // self.width
+        self.x = 0
+        self.y = self.num_rows
+
+    def crop(self, x, width):
+        """a ScreenBuffer of the (up to) width columns of this one from column x on"""
+        width = min(width, self.width - x)
+        screen = ScreenBuffer(width)
+        rows = range(x, x + self.num_rows * self.width, self.width)
+        screen.chars = bytearray().join(self.chars[i:i+width] for i in rows)
+        for i in rows:
+            screen.attrs.extend(self.attrs[i:i+width])
+        screen.num_rows = self.num_rows
+        screen.y = self.num_rows
+        return screen
+
+    def erase(self, start, stop):
+        """blank out the cells from start to stop (flat indices)"""
+        stop = min(stop, len(self.chars))
+        if (start >= stop):
+            return
+        # erased cells keep the current background
+        attr = (self.attr & ATTR_BG) | (DEFAULT_ATTR & ATTR_FG)
+        self.chars[start:stop] = b" " * (stop - start)
+        self.attrs[start:stop] = array.array("H", [attr]) * (stop - start)
+
+    def csi(self, params, cmd):
+        """carry out a CURSOR or ERASE sequence (see Token)"""
+        args = csi_args(params)
+        # most commands take a count which defaults to 1
+        n = max(args[0], 1)
+        width = self.width
+        if (cmd == b"H" or cmd == b"f"):
+            if (n > SCREEN_MAX_ROWS):
+                return
+            self.y = n - 1
+            self.x = min(max(args[1], 1) if len(args) > 1 else 1, width) - 1
+        elif (cmd == b"A"):
+            self.y = max(self.y - n, 0)
+        elif (cmd == b"B"):
+            if (self.y + n >= SCREEN_MAX_ROWS):
+                return
+            self.y += n
+        elif (cmd == b"C"):
+            self.x = min(self.x + n, width - 1)
+        elif (cmd == b"D"):
+            self.x = max(min(self.x, width - 1) - n, 0)
+        elif (cmd == b"E"):
+            if (self.y + n >= SCREEN_MAX_ROWS):
+                return
+            self.y += n
+            self.x = 0
+        elif (cmd == b"F"):
+            self.y = max(self.y - n, 0)
+            self.x = 0
+        elif (cmd == b"G"):
+            self.x = min(n, width) - 1
+        elif (cmd == b"s"):
+            self.saved = (self.x, self.y)
+        elif (cmd == b"u"):
+            self.x, self.y = self.saved
+        elif (cmd == b"J"):
+            cursor = self.y * width + min(self.x, width - 1)
+            if (args[0] == 0):
+                self.erase(cursor, len(self.chars))
+            elif (args[0] == 1):
+                self.erase(0, cursor + 1)
+            elif (args[0] == 2):
+                # clear screen, and (as ANSI.SYS does) move to the top left
+                self.num_rows = 0
+                self.chars = bytearray()
+                self.attrs = array.array("H")
+                self.x = 0
+                self.y = 0
+        elif (cmd == b"K"):
+            if (self.y >= SCREEN_MAX_ROWS):
+                return
+            self.grow(self.y + 1)
+            row = self.y * width
+            cursor = row + min(self.x, width - 1)
+            if (args[0] == 0):
+                self.erase(cursor, row + width)
+            elif (args[0] == 1):
+                self.erase(row, cursor + 1)
+            elif (args[0] == 2):
+                self.erase(row, row + width)
+
+    def feed(self, buf):
+        """interpret buf (bytes-like), up to ^Z if there is one"""
+        TEXT, SGR, CONTROL = Token.TEXT, Token.SGR, Token.CONTROL
+        for kind, data, cmd in tokenize_ansi(buf):
+            if kind is TEXT:
+                self.put(data)
+                continue
+            try:
+                if kind is SGR:
+                    self.attr = apply_sgr(self.attr, data)
+                elif kind is Token.CURSOR or kind is Token.ERASE:
+                    self.csi(data, cmd)
+                elif kind is CONTROL:
+                    if (data == b"\r"):
+                        self.x = 0
+                    elif (data == b"\n"):
+                        self.x = 0
+                        self.y += 1
+                    elif (data == b"\t"):
+                        self.x = min((self.x // 8 + 1) * 8, self.width - 1)
+                    # a lone ESC is dropped
+            except ValueError:
+                # not numbers, eg CSI 1:2 m
+                pass
+            # private and other sequences don't concern the screen
+
+    def row_runs(self, y, ice=False):
+        """
+        generates the runs of cells with the same attribute in row y, as
+        (attr, chars), with blank cells at the end of the row left off (when
+        black is the default bg, and blink isn't a bright bg with ice)
+        """
+        chars = self.chars
+        attrs = self.attrs
+        row = y * self.width
+        end = row + self.width
+        shows_bg = ATTR_BG | ATTR_INVERSE | (ATTR_BLINK if ice else 0)
+        if (BLACK_TO_DEFAULT):
+            while (end > row and chars[end-1] in BLANK_CHARS and
+                   attrs[end-1] & shows_bg == 0):
+                end -= 1
+        pos = row
+        for attr, run in itertools.groupby(attrs[row:end]):
+            run_len = sum(1 for _ in run)
+            yield attr, chars[pos:pos+run_len]
+            pos += run_len
+
+    def render(self, palette=None, ice=False):
+        """
+        returns the frame: the rows of the screen, with runs of cells with the
+        same attribute merged, the shortest SGR transition between them (see
+        sgr_transition for palette and ice), and blank cells at the end of rows
+        left off (when black is the default bg)
+        """
+        out = []
+        charmap_decode = codecs.charmap_decode
+        attr = DEFAULT_ATTR
+        for y in range(self.num_rows):
+            for run_attr, cells in self.row_runs(y, ice):
+                out.append(sgr_transition(attr, run_attr, palette, ice))
+                attr = run_attr
+                out.append(charmap_decode(cells, "strict", GRID_DECODING_TABLE)[0].encode("utf-8"))
+            if (attr != DEFAULT_ATTR):
+                out.append(RESET)
+                attr = DEFAULT_ATTR
+            out.append(b"\n")
+        return b"".join(out)
+
+def render_grid(buf, width=DEFAULT_WIDTH, palette=None, ice=False):
+    """interpret the art in buf (bytes-like) into a ScreenBuffer, return its frame"""
+    screen = ScreenBuffer(width)
+    screen.feed(buf)
+    return screen.render(palette, ice)
+
+# === BINARY TEXT ===
+
+# binary text (.BIN) is a straight dump of VGA text mode memory: a (CP437 char,
+# attribute) byte pair for each cell, row after row, without any line breaks,
+# so how wide it is has to come from the SAUCE (see bin_width), or else it's
+# BIN_WIDTH; XBin (.XB) adds a header with the size, and optionally a palette,
+# a font and run length compression of the cells
+#
+# either is decoded straight into a ScreenBuffer, a whole buffer at a time with
+# slicing and bytes.translate, rather than cell by cell
+BIN_WIDTH = 160
+
+# XBin header: "XBIN" ^Z, width and height (uint16 LE), font height (uint8),
+# flags (uint8); followed by the palette (16 6-bit RGB triplets), if any, the
+# font (256, or 512, glyphs of font height bytes), if any, then the cells
+XBIN_ID = b"XBIN\x1A"
+XBIN_HEADER = struct.Struct("<5sHHBB")
+XBIN_PALETTE = 0x01
+XBIN_FONT = 0x02
+XBIN_COMPRESS = 0x04
+XBIN_NON_BLINK = 0x08 # iCE colors
+XBIN_512_CHARS = 0x10 # attribute bit 3 selects the font, not bright
+
+def vga_to_attr(vga_attr, bright=True):
+    """
+    the attribute (see ATTR_FG) for VGA attribute byte vga_attr, whose colors
+    are in VGA order (blue, green, red) rather than SGR order (red, green, blue)
+    """
+    swap = lambda c: ((c & 0x1) << 2) | (c & 0x2) | ((c & 0x4) >> 2)
+    attr = swap(vga_attr & 0x7) | (swap((vga_attr >> 4) & 0x7) << 4) | (vga_attr & ATTR_BLINK)
+    if (bright):
+        attr |= vga_attr & ATTR_BOLD
+    return attr
+
+# every attribute fits in a byte (there's no inverse in VGA), so the attribute
+# bytes of the art are translated with bytes.translate
+VGA_TO_ATTR = bytes(vga_to_attr(i) for i in range(256))
+# without bright, for XBin with 512 chars
+VGA_TO_ATTR_DIM = bytes(vga_to_attr(i, bright=False) for i in range(256))
+
+def cells_to_screen(chars, vga_attrs, width, bright=True):
+    """
+    a ScreenBuffer, width cells wide, of the cells with the CP437 chars in chars
+    and the VGA attributes in vga_attrs (bytes-like, one byte per cell)
+    """
+    num_cells = min(len(chars), len(vga_attrs))
+    attrs = bytes(vga_attrs[:num_cells]).translate(VGA_TO_ATTR if bright else VGA_TO_ATTR_DIM)
+    # widen the attribute bytes to the array's uint16 by slotting them in as
+    # the low byte of each, all at once
+    wide = bytearray(2 * num_cells)
+    wide[(0 if sys.byteorder == "little" else 1)::2] = attrs
+    screen_attrs = array.array("H")
+    screen_attrs.frombytes(wide)
+    screen = ScreenBuffer(width)
+    screen.load(chars[:num_cells], screen_attrs)
+    return screen
+
+def bin_screen(buf, width=BIN_WIDTH):
+    """interpret the binary text in buf (bytes-like) into a ScreenBuffer"""
+    buf = memoryview(buf)
+    # every other byte is a char, every other an attribute
+    return cells_to_screen(bytes(buf[0::2]), buf[1::2], width)
+
+def xbin_header(buf):
+    """the (width, height, font height, flags) of the XBin in buf"""
+    if (len(buf) < XBIN_HEADER.size):
+        raise ParseError("XBin header is cut short")
+    xbin_id, width, height, font_height, flags = XBIN_HEADER.unpack_from(buf)
+    if (xbin_id != XBIN_ID):
+        raise ParseError("Not an XBin, no XBIN header")
+    if (width == 0):
+        raise ParseError("XBin has a width of 0")
+    return width, height, font_height, flags
+
+def xbin_palette(data):
+    """
+    the 16 "#rrggbb" colors (in VGA_PALETTE order) of the XBin palette data:
+    16 RGB triplets of 6-bit values in VGA order (see vga_to_attr)
+    """
+    vga_colors = [
+        "#" + "".join(f"{v * 255 // 63:02x}" for v in data[i:i+3]) for i in range(0, 48, 3)]
+    # as with attributes, SGR order is VGA order with blue and red swapped
+    return tuple(vga_colors[vga_to_attr(i) & (ATTR_FG | ATTR_BOLD)] for i in range(16))
+
+def xbin_decompress(data, num_cells):
+    """
+    the (chars, attributes) of num_cells cells of the compressed XBin cells in
+    data, a run at a time; each run is a byte of its kind (the top 2 bits) and
+    length (the other 6, plus 1), followed by:
+        0: the run's (char, attr) pairs
+        1: the char of every cell of the run, then the run's attributes
+        2: the attribute of every cell of the run, then the run's chars
+        3: the (char, attr) of every cell of the run
+    """
+    data = bytes(data)
+    chars = bytearray()
+    attrs = bytearray()
+    pos = 0
+    while (len(chars) < num_cells and pos < len(data)):
+        kind = data[pos] >> 6
+        n = (data[pos] & 0x3F) + 1
+        pos += 1
+        if (kind == 0):
+            run = data[pos:pos+2*n]
+            chars += run[0::2]
+            attrs += run[1::2]
+            pos += 2*n
+        elif (kind == 1):
+            chars += data[pos:pos+1] * n
+            attrs += data[pos+1:pos+1+n]
+            pos += 1 + n
+        elif (kind == 2):
+            attrs += data[pos:pos+1] * n
+            chars += data[pos+1:pos+1+n]
+            pos += 1 + n
+        else:
+            chars += data[pos:pos+1] * n
+            attrs += data[pos+1:pos+2] * n
+            pos += 2
+    return chars[:num_cells], attrs[:num_cells]
+
+def xbin_screen(buf):
+    """
+    interpret the XBin in buf (bytes-like) into a ScreenBuffer, returns it along
+    with the XBin's palette (see xbin_palette), None if it has none
+
+    the font can't be shown on a terminal, so it's skipped, as are the glyphs
+    of the second font of 512 char XBins (their chars show as the first's)
+    """
+    buf = memoryview(buf)
+    width, height, font_height, flags = xbin_header(buf)
+    pos = XBIN_HEADER.size
+    colors = None
+    if (flags & XBIN_PALETTE):
+        colors = xbin_palette(buf[pos:pos+48])
+        pos += 48
+    if (flags & XBIN_FONT):
+        pos += font_height * (512 if flags & XBIN_512_CHARS else 256)
+    num_cells = width * height
+    bright = not flags & XBIN_512_CHARS
+    if (flags & XBIN_COMPRESS):
+        chars, attrs = xbin_decompress(buf[pos:], num_cells)
+        return cells_to_screen(chars, attrs, width, bright), colors
+    cells = buf[pos:pos+2*num_cells]
+    return cells_to_screen(bytes(cells[0::2]), cells[1::2], width, bright), colors
+
+def binary_screen(buf, width, art_format):
+    """
+    the ScreenBuffer of the binary text in buf, of art_format "bin" or "xbin"
+    (whose width is its own), along with the art's palette (None if it has none)
+    """
+    if (art_format == "xbin"):
+        return xbin_screen(buf)
+    return bin_screen(buf, width or BIN_WIDTH), None
+
+# === FIT ===
+
+# art wider than the terminal wraps into garbage, so instead (--fit) it can be
+# fit to the terminal's width, in the grid:
+#   crop: only the columns that fit are shown, the rest is cut off
+#   pan: the art is shown a terminal wide strip at a time, left to right, each
+#       scrolling by in turn, so all of it is seen
+#   scale: the art is scaled down (see scale_screen) to fit
+FIT_MODES = ["crop", "pan", "scale"]
+
+# CP437 half block glyphs, the upper one is what a scaled down cell is drawn with
+UPPER_HALF = 0xDF
+LOWER_HALF = 0xDC
+# for scaling down, each cell is two pixels, top and bottom, their colors the
+# foreground or background, according to how much of each half is ink in the
+# glyph; only blocks (and shades which are mostly ink) count, other glyphs
+# (text, line drawing, ...) are too thin and show as the background
+GLYPH_FG = 0x3 # both pixels are the foreground
+GLYPH_TOP = 0x1 # the top pixel is the foreground
+GLYPH_BOTTOM = 0x2 # the bottom pixel is the foreground
+GLYPH_PIXELS = bytes(
+    GLYPH_FG if i in (0xDB, 0xB2, 0xB1, 0xDD, 0xDE) else
+    GLYPH_TOP if i == UPPER_HALF else
+    GLYPH_BOTTOM if i == LOWER_HALF else 0
+    for i in range(256))
+
+@functools.lru_cache(maxsize=None)
+def attr_colors_table(ice=False):
+    """attr_colors of every attribute, precomputed (see sgr_table)"""
+    return tuple(attr_colors(attr, ice) for attr in range(ATTR_INVERSE << 1))
+
+def pixel_attr(top, bottom):
+    """
+    the (char, attribute) of the cell with pixels of the VGA_PALETTE indices top
+    and bottom; the background is bright with blink, so needs iCE colors
+    """
+    bg = ((bottom & 0x7) << 4) | (ATTR_BLINK if bottom & 0x8 else 0)
+    if (top == bottom):
+        return 0x20, bg | DEFAULT_ATTR
+    return UPPER_HALF, bg | top
+
+def scale_screen(screen, width, ice=False):
+    """
+    a ScreenBuffer of screen scaled down to (at most) width columns, each of
+    its cells a half block (see UPPER_HALF) of two pixels sampled from screen
+    (see GLYPH_PIXELS), so its colors come out with iCE colors (see pixel_attr)
+
+    a cell is twice as tall as it's wide, so the pixels are square, and
+    scaling by the same (whole) factor both ways keeps the aspect ratio
+    """
+    factor = -(-screen.width // width)
+    src_chars = screen.chars
+    src_attrs = screen.attrs
+    colors = attr_colors_table(ice)
+    num_pixel_rows = 2 * screen.num_rows
+    scaled = ScreenBuffer(-(-screen.width // factor))
+    chars = bytearray()
+    attrs = array.array("H")
+    for py in range(0, num_pixel_rows, 2 * factor):
+        # the source cells of the top and bottom pixels of the row, and their
+        # half (0 top, 1 bottom)
+        pixel_rows = []
+        for p in (py, py + factor):
+            y, half = divmod(p, 2)
+            pixel_rows.append((y * screen.width, GLYPH_TOP if half == 0 else GLYPH_BOTTOM,
+                               y < screen.num_rows))
+        for x in range(0, screen.width, factor):
+            pixels = []
+            for row, half, in_screen in pixel_rows:
+                if not in_screen:
+                    pixels.append(0)
+                    continue
+                fg, bg = colors[src_attrs[row + x]]
+                pixels.append(fg if GLYPH_PIXELS[src_chars[row + x]] & half else bg)
+            char, attr = pixel_attr(*pixels)
+            chars.append(char)
+            attrs.append(attr)
+    scaled.load(chars, attrs)
+    return scaled
+
+def fit_screen(screen, fit, width, ice=False):
+    """
+    screen fit (see FIT_MODES) to width columns, as a list of ScreenBuffers
+    shown one after the other, and whether they're in iCE colors; screen as is
+    if it already fits, or fit is None
+    """
+    if (fit is None or screen.width <= width):
+        return [screen], ice
+    if (fit == "crop"):
+        return [screen.crop(0, width)], ice
+    if (fit == "pan"):
+        return [screen.crop(x, width) for x in range(0, screen.width, width)], ice
+    return [scale_screen(screen, width, ice)], True
+
+def fit_frame(screen, fit, width, palette=None, ice=False):
+    """the frame of screen fit (see fit_screen) to width columns"""
+    screens, ice = fit_screen(screen, fit, width, ice)
+    return b"".join(s.render(palette, ice) for s in screens)
+
+def terminal_width():
+    """columns of the terminal, DEFAULT_WIDTH if that can't be told (e.g. not a tty)"""
+    import shutil
+
+    return shutil.get_terminal_size((DEFAULT_WIDTH, 0)).columns
+
+# === EXPORT ===
+
+# art can also be exported (see export_art) to HTML, as a <pre> with runs of
+# cells with the same attribute merged into <span>s, or to SVG, with a <tspan>
+# per run
+EXPORT_FORMATS = ["html", "svg"]
+
+# size of a cell in px in SVG, that of the VGA 8x16 font
+CELL_WIDTH = 8
+CELL_HEIGHT = 16
+# how much taller than wide the VGA's pixels were on a 4:3 CRT (720x400 shown
+# as 640x480), for art with a "stretch" aspect ratio (see sauce_flags)
+STRETCH_ASPECT = 1.35
+EXPORT_FONT = "'Perfect DOS VGA 437', 'Px437 IBM VGA 8x16', monospace"
+
+HTML_HEAD = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+pre.ansi {{ background: {bg}; color: {fg}; font-family: {font}; line-height: 1;{extra} }}
+{classes}
+.k {{ animation: k 1s step-end infinite; }}
+@keyframes k {{ 50% {{ color: transparent; }} }}
+</style>
+</head>
+<body>
+<pre class="ansi">
+"""
+HTML_TAIL = "</pre>\n</body>\n</html>\n"
+
+@functools.lru_cache(maxsize=None)
+def html_span(attr, ice=False):
+    """the opening <span> for cells with attribute attr, or "" if it needs none"""
+    fg, bg = attr_colors(attr, ice)
+    classes = []
+    if (fg != DEFAULT_ATTR & ATTR_FG):
+        classes.append(f"f{fg}")
+    if (bg != 0):
+        classes.append(f"b{bg}")
+    if (attr & ATTR_BLINK and not ice):
+        classes.append("k")
+    return f'<span class="{" ".join(classes)}">' if classes else ""
+
+def export_html(screen, title="", ice=False, letter_spacing=None, aspect_ratio=None):
+    """
+    returns the ScreenBuffer screen as an HTML document (str)
+    ice, letter_spacing and aspect_ratio are as in sauce_flags
+    """
+    import html
+
+    charmap_decode = codecs.charmap_decode
+    classes = "\n".join([f".f{i} {{ color: {c}; }}" for i, c in enumerate(VGA_PALETTE)] +
+                        [f".b{i} {{ background: {c}; }}" for i, c in enumerate(VGA_PALETTE)])
+    extra = ""
+    if (letter_spacing == 9):
+        extra += " letter-spacing: 1px;"
+    if (aspect_ratio == "stretch"):
+        extra += f" transform: scaleY({STRETCH_ASPECT}); transform-origin: top left;"
+    out = [HTML_HEAD.format(title=html.escape(title), fg=VGA_PALETTE[DEFAULT_ATTR & ATTR_FG],
+                            bg=VGA_PALETTE[0], font=EXPORT_FONT, extra=extra, classes=classes)]
+    for y in range(screen.num_rows):
+        for attr, cells in screen.row_runs(y, ice):
+            text = html.escape(charmap_decode(cells, "strict", GRID_DECODING_TABLE)[0], quote=False)
+            span = html_span(attr, ice)
+            out.append(f"{span}{text}</span>" if span else text)
+        out.append("\n")
+    out.append(HTML_TAIL)
+    return "".join(out)
+
+def export_svg(screen, title="", ice=False, letter_spacing=None, aspect_ratio=None):
+    """
+    returns the ScreenBuffer screen as an SVG document (str): a rect for each
+    run with a background, and a tspan for each run of text, stretched to fit
+    its cells exactly, whatever the font
+    ice, letter_spacing and aspect_ratio are as in sauce_flags, the cells being
+    9 px wide with a 9 pixel font, and the picture stretched with "stretch"
+    """
+    import html
+
+    charmap_decode = codecs.charmap_decode
+    cell_width = letter_spacing or CELL_WIDTH
+    width = screen.width * cell_width
+    height = screen.num_rows * CELL_HEIGHT
+    shown_height = round(height * STRETCH_ASPECT) if aspect_ratio == "stretch" else height
+    out = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{shown_height}" '
+           f'viewBox="0 0 {width} {height}" preserveAspectRatio="none">\n',
+           f"<title>{html.escape(title)}</title>\n",
+           f"<style>text {{ font-family: {EXPORT_FONT}; font-size: {CELL_HEIGHT}px; white-space: pre; }}</style>\n",
+           f'<rect width="100%" height="100%" fill="{VGA_PALETTE[0]}"/>\n']
+    for y in range(screen.num_rows):
+        top = y * CELL_HEIGHT
+        rects = []
+        spans = []
+        x = 0
+        for attr, cells in screen.row_runs(y, ice):
+            fg, bg = attr_colors(attr, ice)
+            run_width = len(cells) * cell_width
+            if (bg != 0):
+                rects.append(f'<rect x="{x}" y="{top}" width="{run_width}" height="{CELL_HEIGHT}" '
+                             f'fill="{VGA_PALETTE[bg]}"/>\n')
+            text = charmap_decode(cells, "strict", GRID_DECODING_TABLE)[0]
+            if not text.isspace():
+                spans.append(f'<tspan x="{x}" textLength="{run_width}" lengthAdjust="spacingAndGlyphs" '
+                             f'fill="{VGA_PALETTE[fg]}">{html.escape(text, quote=False)}</tspan>')
+            x += run_width
+        out.extend(rects)
+        if (spans):
+            # the baseline, a bit above the bottom of the cell for descenders
+            out.append(f'<text y="{top + CELL_HEIGHT * 3 // 4}">{"".join(spans)}</text>\n')
+    out.append("</svg>\n")
+    return "".join(out)
+
+def export_art(fname, out_format="html", width=None, ice=None):
+    """
+    returns the art file fname exported to out_format (see EXPORT_FORMATS), its
+    title being the one in its SAUCE, or else the file name, and its iCE colors
+    (unless ice isn't None), letter spacing and aspect ratio those in its SAUCE
+
+    width: None (or 0) for the width in its SAUCE, DEFAULT_WIDTH if it has
+    none, otherwise the width to render at; binary text always has its own
+    """
+    with ArtMap(fname) as art:
+        if (width is None and art.format == "ansi" and art.sauce_offset < 0):
+            width = DEFAULT_WIDTH
+        elif (not width or art.format != "ansi"):
+            width = art.width()
+        ice = art.ice(ice)
+        letter_spacing, aspect_ratio = art.flags()[1:]
+        title = os.path.basename(fname)
+        if (art.sauce_offset >= 0):
+            title = parse_sauce_record(art.mm, art.sauce_offset).title or title
+        if (art.format != "ansi"):
+            screen = binary_screen(art.art, width, art.format)[0]
+        else:
+            screen = ScreenBuffer(width)
+            screen.feed(art.art)
+    export = export_svg if out_format == "svg" else export_html
+    return export(screen, title, ice=ice, letter_spacing=letter_spacing, aspect_ratio=aspect_ratio)
+
+def export_file(job):
+    """
+    job: (source path, destination path, out_format, width, ice)
+    exports one file for export_dir, returns (source path, error or None)
+    """
+    src, dst, out_format, width, ice = job
+    try:
+        doc = export_art(src, out_format, width, ice)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        # write to a temporary name first, so no one sees half a document
+        tmp_path = f"{dst}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(doc)
+        os.replace(tmp_path, dst)
+    except (OSError, ValueError, ParseError) as E:
+        return src, str(E)
+    return src, None
+
+def export_dir(src_dir, out_dir, out_format="html", width=None, ice=None, jobs=None):
+    """
+    export every art file under src_dir to out_dir (mirroring the directory
+    structure, e.g. src_dir/a/b.ans to out_dir/a/b.ans.html), using a pool of
+    jobs worker processes (default: one per core), each file on its own; files
+    whose export is newer than them are skipped
+    stats are printed to stderr at the end, returns the number of failures
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    def exports():
+        for d, _, files in os.walk(src_dir):
+            for f in files:
+                if FILTER_EXT and not valid_ext(os.path.splitext(f)[-1]):
+                    continue
+                src = os.path.join(d, f)
+                dst = os.path.join(out_dir, os.path.relpath(src, src_dir)) + f".{out_format}"
+                try:
+                    if (os.stat(dst).st_mtime_ns >= os.stat(src).st_mtime_ns):
+                        skipped[0] += 1
+                        continue
+                except FileNotFoundError:
+                    pass
+                yield src, dst, out_format, width, ice
+
+    skipped = [0]
+    num_files = 0
+    num_failed = 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        for src, error in pool.map(export_file, exports(), chunksize=16):
+            num_files += 1
+            if error is not None:
+                num_failed += 1
+                print(f"{src}: {error}", file=sys.stderr)
+    elapsed = max(time.perf_counter() - start, 1e-9)
+
+    print(f"{num_files - num_failed} files exported to {out_format}, {skipped[0]} up to date, "
+          f"{num_failed} failed in {elapsed:.2f}s: {num_files/elapsed:.0f} files/s", file=sys.stderr)
+    return num_failed
+
+# === SERVER ===
+
+# with --serve the art is played to everyone who connects over (raw) TCP, e.g.
+#   telnet localhost 2323
+# a client can ask for its own speed by sending a line with just the baud rate
+# right after connecting (within SERVE_BAUD_TIMEOUT seconds), e.g.
+#   (echo 2400; cat) | nc localhost 2323
+# otherwise it gets the speed pyfansi was started with
+
+SERVE_HOST = "127.0.0.1"
+SERVE_BAUD_TIMEOUT = 1.0
+# bytes queued up for a client before it's waited on, so a slow client only
+# ever holds this much (plus the shared frame) and doesn't hold up the others
+SERVE_BUFFER_SIZE = 64 * 1024
+
+class ArtServer:
+    """
+    plays files ([(path, width)], see load_index) to any number of clients,
+    each at its own speed, over and over with loop
+
+    each artwork is rendered once, by the first client to get to it, and the
+    frame is then shared by every client playing it, only being dropped once
+    none are; the rendering is done in a thread so it doesn't hold up clients
+    already playing
+    """
+    def __init__(self, files, speed=DEFAULT_SPEED, width=DEFAULT_WIDTH, grid=False, palette=None, ice=None,
+                 use_cache=CACHE_FRAMES, loop=False, show_rate=False):
+        self.files = files
+        self.speed = speed
+        self.width = width
+        self.grid = grid
+        self.palette = palette
+        self.ice = ice
+        self.use_cache = use_cache
+        self.loop = loop
+        self.show_rate = show_rate
+        self.frames = {} # (path, width) -> future of (frame, art size)
+        self.playing = {} # (path, width) -> number of clients playing it
+        self.clients = 0
+
+    def render(self, fname, width):
+        return load_frame(fname, width=width, grid=self.grid, palette=self.palette, ice=self.ice,
+                          use_cache=self.use_cache)
+
+    async def frame(self, key):
+        """the (shared) frame of the art file, rendering it if need be"""
+        if key not in self.frames:
+            self.frames[key] = asyncio.get_running_loop().run_in_executor(None, self.render, *key)
+        return await self.frames[key]
+
+    async def read_speed(self, reader):
+        """the speed asked for by the client, if any"""
+        try:
+            line = await asyncio.wait_for(reader.readline(), SERVE_BAUD_TIMEOUT)
+        except (asyncio.TimeoutError, ValueError):
+            return self.speed
+        match = re.search(rb"\d+", line)
+        if match is None:
+            return self.speed
+        baud = int(match.group())
+        # a rate under a byte a second is as slow as it gets, not unthrottled
+        return baud and max(baud // BITS_PER_BYTE, 1)
+
+    async def send(self, writer, frame, cost, speed):
+        """
+        send a frame, paced like play_frame but without sleeping the thread;
+        returns the achieved speed, in bytes of input per second
+        """
+        if (speed == 0 or cost == 0):
+            for piece, _ in frame_pieces(frame, len(frame), SERVE_BUFFER_SIZE):
+                writer.write(piece)
+                await writer.drain()
+            return 0
+
+        clock = asyncio.get_running_loop().time
+        start = clock()
+        sent = 0
+        for piece, n in frame_pieces(frame, cost, max(1, round(speed * THROTTLE_TICK))):
+            writer.write(piece)
+            await writer.drain()
+            sent += n
+            # sleep until the deadline of everything sent so far, see Throttle
+            delay = start + sent/speed - clock()
+            if (delay > 0):
+                await asyncio.sleep(delay)
+        return sent / max(clock() - start, 1e-9)
+
+    async def play(self, writer, speed):
+        while True:
+            for fname, index_width in self.files:
+                width = self.width if self.width != 0 else (index_width or 0)
+                key = (fname, width)
+                self.playing[key] = self.playing.get(key, 0) + 1
+                try:
+                    try:
+                        frame, art_size = await self.frame(key)
+                    except (OSError, ParseError) as E:
+                        print(f"{fname}: {E}", file=sys.stderr)
+                        continue
+                    rate = await self.send(writer, frame, art_size, speed)
+                finally:
+                    self.playing[key] -= 1
+                    if (self.playing[key] == 0):
+                        del self.playing[key]
+                        del self.frames[key]
+                if self.show_rate and speed > 0:
+                    print(f"{fname}: {rate:.0f} of {speed} bytes/s requested", file=sys.stderr)
+            if not self.loop:
+                break
+
+    async def handle(self, reader, writer):
+        peer = writer.get_extra_info("peername")
+        writer.transport.set_write_buffer_limits(high=SERVE_BUFFER_SIZE)
+        self.clients += 1
+        try:
+            speed = await self.read_speed(reader)
+            print(f"{peer}: connected at {speed * BITS_PER_BYTE} baud, {self.clients} client(s)", file=sys.stderr)
+            await self.play(writer, speed)
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self.clients -= 1
+            print(f"{peer}: disconnected, {self.clients} client(s)", file=sys.stderr)
+            writer.close()
+
+    async def serve(self, port, host=SERVE_HOST):
+        server = await asyncio.start_server(self.handle, host, port)
+        print(f"serving {len(self.files)} file(s) on {host}:{port}", file=sys.stderr)
+        async with server:
+            await server.serve_forever()
 
 if __name__ == "__main__":
-    import os
     import select
     import argparse
 
@@ -764,13 +3285,59 @@ if __name__ == "__main__":
 
     parser.add_argument("--speed", nargs=1, metavar="value", type=int, default=DEFAULT_SPEED,
                         help=f"Set rendering speed. Default is {DEFAULT_SPEED}.\nDecrease it to slow down the output.\nSet to 0 for no slowdown.")
+    parser.add_argument("--baud", nargs=1, metavar="rate", type=int,
+                        help=f"Set rendering speed as a modem baud rate, e.g. 2400, 9600, 14400, 28800 ({BITS_PER_BYTE} bits per byte). Overrides --speed.")
+    parser.add_argument("--show-rate", action="store_true", help="Print the achieved vs requested speed to stderr after rendering.")
     parser.add_argument("-s", "--ssaver", nargs=1, metavar="dirname", help="Screen Saver mode.")
+    parser.add_argument("--ssaver-filter", action="append", default=[], metavar="field=value",
+                        help=f"Only show art whose SAUCE matches, can be repeated. Fields: {', '.join(INDEX_FILTER_FIELDS)}. "
+                             f"Ops: {' '.join(INDEX_FILTER_OPS)}; width/lines can be compared to \"cols\", e.g. width<=cols.")
+    parser.add_argument("--ssaver-interval", type=float, default=0, metavar="seconds",
+                        help="With --ssaver, how long to leave each piece up once it's shown, default is 0.")
+    parser.add_argument("--prefetch", type=int, default=SSAVER_PREFETCH, metavar="n",
+                        help=f"With --ssaver, how many pieces to read and render ahead, default is {SSAVER_PREFETCH}.")
+    parser.add_argument("--stats", action="store_true",
+                        help="When done, print where the time went (rendering, writing, sleeping), bytes in and out, "
+                             "FSM state transitions and CSI commands, and with --ssaver the render time of each file, "
+                             "to stderr.")
+    parser.add_argument("--stats-format", choices=STATS_FORMATS, default="text",
+                        help="Output format of --stats, default is text.")
+    parser.add_argument("--no-cache", action="store_true",
+                        help=f"With --ssaver, don't use (or fill) the cache of rendered art in {FRAME_CACHE_DIR}.")
+    parser.add_argument("--reindex", action="store_true",
+                        help=f"With --ssaver, re-check every file rather than only those in changed directories. Index is kept in {INDEX_PATH}.")
+    parser.add_argument("--serve", nargs=1, metavar="port", type=int,
+                        help=f"Play the file (once) or screen saver directory (over and over) to any number of clients connecting over TCP to {SERVE_HOST}:port. "
+                             "A client can ask for a speed by sending its baud rate on a line right after connecting.")
     parser.add_argument("--sauce", nargs=1, metavar="filename", help="Print SAUCE metadata for file.")
-    parser.add_argument("--width", nargs=1, metavar="int >= 80", type=int, default=DEFAULT_WIDTH,
-                        help=f"Terminal width expected, default is {DEFAULT_WIDTH}. Use 0 for auto (assumes SAUCE).")
+    parser.add_argument("--sauce-scan", nargs=1, metavar="dirname",
+                        help="Print SAUCE metadata for every file in directory (recursively), one record per file.")
+    parser.add_argument("--scan-format", choices=["jsonl", "csv"], default="jsonl",
+                        help="Output format of --sauce-scan, default is jsonl.")
+    parser.add_argument("--jobs", nargs=1, metavar="n", type=int, default=None,
+                        help="Number of worker processes for --sauce-scan and --export-dir, default is one per core.")
+    parser.add_argument("--export", choices=EXPORT_FORMATS,
+                        help="Print the file as an HTML or SVG document rather than rendering it, or the format of --export-dir.")
+    parser.add_argument("--export-dir", nargs=2, metavar=("dirname", "outdir"),
+                        help="Export every art file in directory (recursively) into outdir, in the format of --export (default html). "
+                             "Files already exported since they last changed are skipped.")
+    parser.add_argument("--width", nargs=1, metavar="int >= 80", type=int,
+                        help=f"Terminal width expected, default is {DEFAULT_WIDTH}. Use 0 for auto (assumes SAUCE). "
+                             "--export and --export-dir default to the width in the SAUCE.")
+    parser.add_argument("--palette", choices=list(PALETTES),
+                        help="Remap the colors to a palette: ansi (the terminal's 16 colors) or vga (24-bit colors of the real VGA palette). "
+                             "Default is to pass colors through as they are.")
+    parser.add_argument("--ice", choices=["auto", "on", "off"], default="auto",
+                        help="iCE colors: blink makes the background bright instead. Default is auto, from the SAUCE of the file.")
+    parser.add_argument("--fit", choices=FIT_MODES,
+                        help="Fit art wider than the terminal to its width: crop it, pan across it a strip at a time, "
+                             "or scale it down with half blocks. Implies --grid for such art. Default is to wrap it.")
+    parser.add_argument("--grid", action="store_true",
+                        help="Interpret the art into a virtual screen and output it as one optimized frame, rather than passing sequences through.")
     parser.add_argument("--cp437", action="store_true", help="Print Code Page 437 table as UTF-8 characters.")
     parser.add_argument("--cp437-long", action="store_true", help="Print info on each character in Code Page 437.")
-    parser.add_argument("filename", nargs="?")
+    parser.add_argument("--cp437-verify", action="store_true", help="Check the Code Page 437 translation table against utf8_encode.")
+    parser.add_argument("filename", nargs="?", help=f"Art file, or a member of a zip/tar archive as archive{ARCHIVE_SEP}member.")
 
     args = parser.parse_args()
 
@@ -779,10 +3346,30 @@ if __name__ == "__main__":
         args.ssaver = args.ssaver[0]
     if args.sauce is not None:
         args.sauce = args.sauce[0]
+    if args.sauce_scan is not None:
+        args.sauce_scan = args.sauce_scan[0]
+    if args.jobs is not None:
+        args.jobs = args.jobs[0]
+    if args.serve is not None:
+        args.serve = args.serve[0]
     if type(args.speed) == list:
         args.speed = args.speed[0]
+    if args.baud is not None:
+        if args.baud[0] < 0:
+            exit_err(f"baud must be non-negative, got {args.baud[0]}")
+        # less than a byte a second would round down to speed 0, unthrottled
+        if 0 < args.baud[0] < BITS_PER_BYTE:
+            exit_err(f"baud must be 0 (unthrottled) or at least {BITS_PER_BYTE}, got {args.baud[0]}")
+        args.speed = args.baud[0] // BITS_PER_BYTE
     if type(args.width) == list:
         args.width = args.width[0]
+    # exports go by the SAUCE width unless given one
+    export_width = args.width
+    if args.width is None:
+        args.width = DEFAULT_WIDTH
+    # None is auto, i.e. as the SAUCE says
+    args.ice = {"auto": None, "on": True, "off": False}[args.ice]
+    fit_width = terminal_width() if args.fit is not None else DEFAULT_WIDTH
 
     # determine if stdin is available for reading
     # this is just the select syscall; man select
@@ -800,95 +3387,190 @@ if __name__ == "__main__":
         num_sources += 1
     if args.sauce is not None:
         num_sources += 1
+    if args.sauce_scan is not None:
+        num_sources += 1
+    if args.export_dir is not None:
+        num_sources += 1
 
-    print_info = args.cp437 or args.cp437_long
+    print_info = args.cp437 or args.cp437_long or args.cp437_verify
 
     if num_sources != 1 and not print_info:
-        exit_err("provide exactly one of: a dirname with --ssaver, a fileanme with --sauce, or just a filename, or provide stdin")
+        exit_err("provide exactly one of: a dirname with --ssaver, a fileanme with --sauce, a dirname with --sauce-scan or --export-dir, or just a filename, or provide stdin")
     if num_sources >= 1 and print_info:
-        exit_err("--cp437[-long] should not have file/dir/stdin")
-    if args.filename is not None and not os.path.isfile(args.filename):
-        exit_err(f"{args.filename} is not a file")
-    if args.sauce is not None and not os.path.isfile(args.sauce):
+        exit_err("--cp437[-long|-verify] should not have file/dir/stdin")
+    if args.filename is not None and not is_art_file(args.filename):
+        exit_err(f"{args.filename} is not a file (or a member of an archive, as archive{ARCHIVE_SEP}member)")
+    if args.sauce is not None and not is_art_file(args.sauce):
         exit_err(f"{args.sauce} is not a file")
     if args.ssaver is not None and not os.path.isdir(args.ssaver):
         exit_err(f"{args.ssaver} is not a directory")
+    if args.sauce_scan is not None and not os.path.isdir(args.sauce_scan):
+        exit_err(f"{args.sauce_scan} is not a directory")
+    if args.export_dir is not None and not os.path.isdir(args.export_dir[0]):
+        exit_err(f"{args.export_dir[0]} is not a directory")
+    if args.export is not None and args.filename is None and args.export_dir is None:
+        exit_err("--export needs a filename or --export-dir")
+    if args.serve is not None and args.ssaver is None and args.filename is None:
+        exit_err("--serve needs a dirname with --ssaver or a filename")
+    if args.serve is not None and args.fit is not None:
+        exit_err("--fit can't be used with --serve, the terminal of a client is unknown")
+    if args.serve is not None and not 0 < args.serve < 65536:
+        exit_err(f"port must be between 1 and 65535, got {args.serve}")
+    if args.jobs is not None and args.jobs < 1:
+        exit_err(f"jobs must be positive, got {args.jobs}")
     if args.speed < 0:
         exit_err(f"speed must be non-negative, got {args.speed}")
+    if args.ssaver_interval < 0:
+        exit_err(f"ssaver-interval must be non-negative, got {args.ssaver_interval}")
+    if args.prefetch < 1:
+        exit_err(f"prefetch must be positive, got {args.prefetch}")
     if args.width < 0:
         exit_err(f"width must be non-negative, got {args.width}")
 
     if FILTER_EXT and args.filename is not None:
-        ext = os.path.splitext(args.filename)[-1]
+        ext = os.path.splitext(split_member(args.filename)[-1] or args.filename)[-1]
         if not valid_ext(ext):
             exit_err(f"filename must have {', '.join(EXTS).lower()} as extension, got {args.filename} ({ext})")
 
     ssaver_files = []
     if args.ssaver is not None:
-        from pathlib import Path
+        try:
+            ssaver_filters = [parse_index_filter(f) for f in args.ssaver_filter]
+        except ValueError as E:
+            exit_err(str(E))
 
-        file_gen = Path(args.ssaver).rglob('*.*')
+        index_db = open_index()
+        update_index(index_db, args.ssaver, full=args.reindex)
+        ssaver_files = load_index(index_db, args.ssaver, ssaver_filters)
+        index_db.close()
 
         if SHUFFLE_SSAVER:
-            import random
-            file_gen = list(file_gen)
-            random.shuffle(file_gen)
-
-        for f in file_gen:
-            ext = os.path.splitext(f)[-1]
-            if FILTER_EXT and valid_ext(ext):
-                ssaver_files.append(f)
-            elif not FILTER_EXT:
-                ssaver_files.append(f)
+            ssaver_files = shuffle_files(ssaver_files)
 
         if (len(ssaver_files) == 0):
             exit_err(f"No ANSI Art files found in directory {args.ssaver}")
 
+    if args.stats and not print_info:
+        import atexit
+
+        stats = start_stats()
+        def print_stats():
+            stop_stats(stats)
+            print(stats.json() if args.stats_format == "json" else stats.summary(), file=sys.stderr)
+        # most modes exit() when done
+        atexit.register(print_stats)
+
     if print_info:
         if args.cp437_long:
             print_codepoint_names()
         if args.cp437:
             print_cp437()
+        if args.cp437_verify:
+            mismatches = verify_cp437_table()
+            for m in mismatches:
+                print(f"{CODEC_NAME}: {m}", file=sys.stderr)
+            if (mismatches):
+                exit(1)
+            print(f"{CODEC_NAME}: all 256 bytes match utf8_encode")
+            exit(0)
     elif args.sauce:
-        f_stream = open(args.sauce, "rb")
         print(args.sauce)
-        print_sauce(f_stream)
-        f_stream.close()
+        with ArtMap(args.sauce) as art:
+            try:
+                print_sauce(art.mm)
+            except ParseError as E:
+                exit_err(str(E))
+        exit(0)
+    elif args.sauce_scan:
+        try:
+            sauce_scan(args.sauce_scan, out_format=args.scan_format, jobs=args.jobs)
+        except KeyboardInterrupt:
+            exit(1)
         exit(0)
+    elif args.export_dir:
+        try:
+            num_failed = export_dir(*args.export_dir, out_format=args.export or EXPORT_FORMATS[0],
+                                    width=export_width, ice=args.ice, jobs=args.jobs)
+        except KeyboardInterrupt:
+            exit(1)
+        exit(1 if num_failed else 0)
+    elif args.export:
+        try:
+            sys.stdout.write(export_art(args.filename, out_format=args.export, width=export_width, ice=args.ice))
+        except (OSError, ValueError, ParseError) as E:
+            exit_err(str(E))
+        exit(0)
+    elif args.serve is not None:
+        files = ssaver_files if args.ssaver is not None else [(args.filename, None)]
+        server = ArtServer(files, speed=args.speed, width=args.width, grid=args.grid, palette=args.palette, ice=args.ice,
+                           use_cache=CACHE_FRAMES and not args.no_cache,
+                           loop=args.ssaver is not None, show_rate=args.show_rate)
+        try:
+            asyncio.run(server.serve(args.serve))
+        except KeyboardInterrupt:
+            exit(0)
+        except OSError as E:
+            exit_err(str(E))
     elif args.ssaver is not None:
-        for f in ssaver_files:
+        use_cache = CACHE_FRAMES and not args.no_cache
+
+        def load_ssaver_frame(f, index_width):
+            # the width is already known from the index, unless it's not
+            # in the SAUCE, in which case leave it to auto detection
+            width = args.width if args.width != 0 else (index_width or 0)
+            return load_frame(f, width=width, grid=args.grid, palette=args.palette, ice=args.ice,
+                              fit=args.fit, fit_width=fit_width, use_cache=use_cache)
+
+        # the next pieces are read and rendered while the current one plays
+        for f, loaded, error in Prefetcher(ssaver_files, load_ssaver_frame, count=args.prefetch):
             PRINT_BEFORE and print(f"vvv {f} vvv")
-            f_stream = open(f, "rb")
             try:
-                stream_ansi(f_stream, speed=args.speed, width=args.width)
+                if error is not None:
+                    print(error)
+                else:
+                    throttle = play_frame(*loaded, speed=args.speed)
+                    if args.show_rate and throttle is not None:
+                        print(f"{f}: {throttle.report()}", file=sys.stderr)
+                    # leave the piece up for a while
+                    time.sleep(args.ssaver_interval)
             except KeyboardInterrupt:
-                f_stream.close()
                 write(RESET_N)
                 print(f)
                 exit(1)
-            except ParseError as E:
-                f_stream.close()
-                print(E)
             PRINT_AFTER and print(f"^^^ {f} ^^^")
-            f_stream.close()
     elif args.filename is not None:
         PRINT_BEFORE and print(f"vvv {args.filename} vvv")
-        f_stream = open(args.filename, "rb")
         try:
-            stream_ansi(f_stream, speed=args.speed, width=args.width)
+            throttle = stream_art_file(args.filename, speed=args.speed, width=args.width, grid=args.grid,
+                                       palette=args.palette, ice=args.ice, fit=args.fit, fit_width=fit_width)
+            if args.show_rate and throttle is not None:
+                print(throttle.report(), file=sys.stderr)
         except KeyboardInterrupt:
-            f_stream.close()
             write(RESET_N)
             print(args.filename)
             exit(1)
-        f_stream.close()
         PRINT_AFTER and print(f"^^^ {args.filename} ^^^")
         exit(0)
     elif rlist:
         # don't want utf-8, want raw bytes
         f_stream = rlist[0].buffer if type(rlist[0]) == io.TextIOWrapper else rlist[0]
         try:
-            stream_ansi(f_stream, speed=args.speed, width=args.width)
+            if args.grid or args.fit is not None:
+                # the whole art is needed for the frame anyway
+                buf = f_stream.read()
+                sauce_offset = find_sauce(buf)
+                width = args.width if args.width != 0 else sauce_width(buf, sauce_offset)
+                ice = args.ice if args.ice is not None else sauce_flags(buf, sauce_offset)[0]
+                art = memoryview(buf)[:find_art_end(buf, sauce_offset)]
+                frame = render_art(art, width=width, grid=True, palette=args.palette, ice=ice,
+                                   fit=args.fit, fit_width=fit_width)
+                throttle = play_frame(frame, len(art), speed=args.speed)
+            else:
+                # the SAUCE is only at the end, too late to know about iCE colors
+                throttle = stream_ansi(f_stream, speed=args.speed, width=args.width,
+                                       palette=args.palette, ice=bool(args.ice))
+            if args.show_rate and throttle is not None:
+                print(throttle.report(), file=sys.stderr)
         except KeyboardInterrupt:
             write(RESET_N)
             exit(1)
@@ -0,0 +1,344 @@
+#!python3
+
+"""
+Benchmarks for pyfansi
+
+Generates synthetic ANSI art (seeded, so every run sees the same bytes) and
+measures:
+    - rendering throughput (stream_ansi with no slowdown, and render_grid)
+      in bytes of art per second, with the output going nowhere, and that of
+      tokenize_ansi on its own
+    - parse_sauce_record and find_width latency
+    - CP437 translation with utf8_encode (one char at a time) vs bulk decoding
+    - peak memory while rendering (tracemalloc)
+
+Results are written as JSON, which a later run can be compared against:
+    pyfansi_bench.py -o before.json
+    (change things)
+    pyfansi_bench.py -o after.json --compare before.json
+"""
+
+import os
+import sys
+import io
+import json
+import time
+import random
+import platform
+import tempfile
+import tracemalloc
+import statistics
+import subprocess
+import collections
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import pyfansi
+
+# === PARAMETERS ===
+
+DEFAULT_SEED = 437
+# bytes of art in each generated corpus
+DEFAULT_SIZE = 256 * 1024
+# times each measurement is repeated, the best (fastest) run is kept
+DEFAULT_REPEAT = 5
+# a result this much slower (as a fraction) than the one compared against is
+# reported as a regression
+DEFAULT_THRESHOLD = 0.10
+
+# the kinds of art generated, see gen_art
+KINDS = ["sgr", "plain", "cursor"]
+WIDTHS = [80, 160]
+
+SGR_CODES = [b"0", b"1", b"5", b"0;1;40", b"1;33;40", b"5;37;44", b"31", b"0;40;37", b"36;1", b""]
+
+# === CORPUS ===
+
+def gen_glyphs(rng, n):
+    """n bytes of printable CP437 (no control characters or ESC)"""
+    return bytes(rng.choice(range(32, 256)) if rng.random() < 0.9 else 0xDB for _ in range(n))
+
+def gen_art(kind, width, size, seed, sauce=False):
+    """
+    returns about size bytes of art of a kind:
+        sgr: dense SGR churn, a color change every couple of characters
+        plain: long runs of plain characters with the odd color change
+        cursor: heavy cursor movement (forward/back/up, save/restore, absolute)
+
+    rows are width characters wide, so the art wraps like the real thing would
+    """
+    rng = random.Random(f"{seed}-{kind}-{width}")
+    art = bytearray()
+    col = 0
+    while len(art) < size:
+        if (kind == "sgr"):
+            art += b"\x1b[" + rng.choice(SGR_CODES) + b"m"
+            n = rng.randint(1, 3)
+        elif (kind == "plain"):
+            if (rng.random() < 0.05):
+                art += b"\x1b[" + rng.choice(SGR_CODES) + b"m"
+            n = rng.randint(20, width)
+        else:
+            r = rng.random()
+            if (r < 0.5):
+                art += b"\x1b[" + str(rng.randint(1, 20)).encode() + b"C"
+            elif (r < 0.7):
+                art += b"\x1b[" + str(rng.randint(1, 10)).encode() + b"D"
+            elif (r < 0.8):
+                art += rng.choice([b"\x1b[s", b"\x1b[u"])
+            elif (r < 0.9):
+                art += b"\x1b[" + str(rng.randint(1, 3)).encode() + b"A"
+            else:
+                art += b"\x1b[" + str(rng.randint(1, width)).encode() + b"G"
+            n = rng.randint(1, 8)
+        n = min(n, width - col)
+        art += gen_glyphs(rng, n)
+        col += n
+        if (col >= width):
+            art += b"\r\n"
+            col = 0
+    if (sauce):
+        art += pyfansi.EOF + gen_sauce(len(art), width)
+    return bytes(art)
+
+def gen_sauce(file_size, width):
+    """a SAUCE record for a CP437 ANSi file of width columns"""
+    record = bytearray(pyfansi.SAUCE_ID)
+    record += b"Benchmark".ljust(35) + b"pyfansi".ljust(20) + b"bench".ljust(20) + b"19960412"
+    record += file_size.to_bytes(4, "little")
+    record += bytes([1, 1]) # character, ANSi
+    record += width.to_bytes(2, "little") + (25).to_bytes(2, "little") + bytes(4)
+    record += bytes([0, 1]) # no comments, iCE colors
+    record += b"IBM VGA".ljust(22, b"\x00")
+    assert len(record) == pyfansi.SAUCE_SIZE
+    return bytes(record)
+
+def gen_corpus(size, seed):
+    """returns {name: art} for every kind and width, with and without SAUCE"""
+    corpus = {}
+    for kind in KINDS:
+        for width in WIDTHS:
+            for sauce in (False, True):
+                name = f"{kind}-{width}{'-sauce' if sauce else ''}"
+                corpus[name] = gen_art(kind, width, size, seed, sauce=sauce)
+    return corpus
+
+# === MEASUREMENT ===
+
+class NullStdout:
+    """stands in for sys.stdout while rendering, so output goes nowhere"""
+    class buffer:
+        @staticmethod
+        def write(data):
+            return len(data)
+        @staticmethod
+        def flush():
+            pass
+
+def best_time(func, repeat):
+    """the fastest of repeat runs of func, in seconds, and the median"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times), statistics.median(times)
+
+def null_output(func):
+    """run func with pyfansi's output going nowhere"""
+    def wrapped():
+        saved = pyfansi.write, pyfansi.flush, sys.stdout
+        pyfansi.write, pyfansi.flush, sys.stdout = NullStdout.buffer.write, NullStdout.buffer.flush, NullStdout
+        try:
+            return func()
+        finally:
+            pyfansi.write, pyfansi.flush, sys.stdout = saved
+    return wrapped
+
+def throughput(func, size, repeat):
+    best, median = best_time(func, repeat)
+    return {"bytes": size, "best_s": best, "median_s": median, "bytes_per_s": size / best}
+
+def latency(func, repeat, inner=1000):
+    """per call latency of func, called inner times per run"""
+    def run():
+        for _ in range(inner):
+            func()
+    best, median = best_time(run, repeat)
+    return {"best_us": best / inner * 1e6, "median_us": median / inner * 1e6}
+
+def peak_memory(func):
+    """peak memory allocated while running func, in bytes"""
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+def bench_render(corpus, repeat):
+    results = {}
+    for name, art in corpus.items():
+        width = 0 if name.endswith("-sauce") else int(name.split("-")[1])
+        stream = null_output(lambda: pyfansi.stream_ansi(io.BytesIO(art), speed=0, width=width))
+        results[f"stream_ansi/{name}"] = throughput(stream, len(art), repeat)
+        tokenize = lambda: collections.deque(pyfansi.tokenize_ansi(art), maxlen=0)
+        results[f"tokenize_ansi/{name}"] = throughput(tokenize, len(art), repeat)
+        grid_width = width or pyfansi.sauce_width(art, pyfansi.find_sauce(art))
+        grid = lambda: pyfansi.render_grid(art, width=grid_width)
+        results[f"render_grid/{name}"] = throughput(grid, len(art), repeat)
+    return results
+
+def bench_sauce(corpus, tmp_dir, repeat):
+    results = {}
+    for name, art in corpus.items():
+        if not name.endswith("-sauce"):
+            continue
+        results[f"parse_sauce_record/{name}"] = latency(lambda: pyfansi.parse_sauce_record(art), repeat)
+        path = os.path.join(tmp_dir, f"{name}.ans")
+        with open(path, "wb") as f:
+            f.write(art)
+        def find_width():
+            with open(path, "rb") as fs:
+                pyfansi.find_width(fs)
+        results[f"find_width/{name}"] = latency(find_width, repeat, inner=100)
+    return results
+
+def bench_translate(size, seed, repeat):
+    """CP437 -> UTF-8 of size bytes (every byte value), one char at a time vs in bulk"""
+    rng = random.Random(f"{seed}-translate")
+    data = bytes(rng.randrange(256) for _ in range(size))
+    codepoints = pyfansi.CP437_CODEPOINTS
+    table = pyfansi.CP437_UTF8
+    return {
+        "translate/utf8_encode": throughput(
+            lambda: b"".join(pyfansi.utf8_encode(codepoints[b]) for b in data), size, repeat),
+        "translate/table": throughput(
+            lambda: b"".join([table[b] for b in data]), size, repeat),
+        "translate/codec": throughput(
+            lambda: data.decode(pyfansi.CODEC_NAME).encode("utf-8", "surrogateescape"), size, repeat),
+    }
+
+def bench_memory(corpus):
+    results = {}
+    for name in (f"{KINDS[0]}-{WIDTHS[-1]}-sauce", f"{KINDS[1]}-{WIDTHS[0]}"):
+        art = corpus[name]
+        width = 0 if name.endswith("-sauce") else int(name.split("-")[1])
+        stream = null_output(lambda: pyfansi.stream_ansi(io.BytesIO(art), speed=0, width=width))
+        grid_width = width or pyfansi.sauce_width(art, pyfansi.find_sauce(art))
+        results[f"peak_memory/stream_ansi/{name}"] = {"bytes": len(art), "peak_bytes": peak_memory(stream)}
+        results[f"peak_memory/render_grid/{name}"] = {
+            "bytes": len(art), "peak_bytes": peak_memory(lambda: pyfansi.render_grid(art, width=grid_width))}
+    return results
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def run(size=DEFAULT_SIZE, seed=DEFAULT_SEED, repeat=DEFAULT_REPEAT, only=None):
+    corpus = gen_corpus(size, seed)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for group, bench in [("render", lambda: bench_render(corpus, repeat)),
+                             ("sauce", lambda: bench_sauce(corpus, tmp_dir, repeat)),
+                             ("translate", lambda: bench_translate(size // 8, seed, repeat)),
+                             ("memory", lambda: bench_memory(corpus))]:
+            if only and group not in only:
+                continue
+            print(f"running {group}...", file=sys.stderr)
+            results.update(bench())
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "seed": seed,
+            "size": size,
+            "repeat": repeat,
+        },
+        "results": results,
+    }
+
+# === COMPARISON ===
+
+# for each kind of result, the value compared and whether higher is better
+METRICS = [("bytes_per_s", True), ("best_us", False), ("peak_bytes", False)]
+
+def compare(base, new, threshold=DEFAULT_THRESHOLD, out=sys.stdout):
+    """print how each result in new compares to base, returns the number of regressions"""
+    if (base["meta"].get("size"), base["meta"].get("seed")) != (new["meta"]["size"], new["meta"]["seed"]):
+        print("warning: runs used different corpora (size/seed), numbers aren't comparable", file=out)
+    regressions = 0
+    print(f"{'benchmark':<42} {'base':>14} {'new':>14} {'change':>8}", file=out)
+    for name, result in new["results"].items():
+        old = base["results"].get(name)
+        if old is None:
+            continue
+        for metric, higher_better in METRICS:
+            if metric in result and metric in old:
+                break
+        else:
+            continue
+        a, b = old[metric], result[metric]
+        # nothing to take a relative change against (e.g. an empty corpus)
+        if (a == 0):
+            print(f"{name:<42} {a:>14.1f} {b:>14.1f} {'n/a':>8}", file=out)
+            continue
+        # positive change is an improvement, negative a regression
+        change = (b - a) / a if higher_better else (a - b) / a
+        mark = ""
+        if (change < -threshold):
+            mark = " REGRESSION"
+            regressions += 1
+        print(f"{name:<42} {a:>14.1f} {b:>14.1f} {change:>+8.1%}{mark}", file=out)
+    return regressions
+
+def print_results(results, out=sys.stdout):
+    for name, result in results["results"].items():
+        if "bytes_per_s" in result:
+            print(f"{name:<42} {result['bytes_per_s'] / 1e6:>10.2f} MB/s", file=out)
+        elif "best_us" in result:
+            print(f"{name:<42} {result['best_us']:>10.2f} us", file=out)
+        else:
+            print(f"{name:<42} {result['peak_bytes'] / 1024:>10.0f} KiB peak", file=out)
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="pyfansi_bench", description="Benchmarks for pyfansi.")
+    parser.add_argument("-o", "--output", metavar="file.json", help="Write the results as JSON to file.")
+    parser.add_argument("--compare", metavar="file.json", help="Compare the results against an earlier run.")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help=f"Slowdown (fraction) reported as a regression, default is {DEFAULT_THRESHOLD}.")
+    parser.add_argument("--size", type=int, default=DEFAULT_SIZE,
+                        help=f"Bytes of art in each generated corpus, default is {DEFAULT_SIZE}.")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help=f"Seed of the generated art, default is {DEFAULT_SEED}.")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT,
+                        help=f"Times each measurement is repeated (best is kept), default is {DEFAULT_REPEAT}.")
+    parser.add_argument("--only", action="append", choices=["render", "sauce", "translate", "memory"],
+                        help="Only run these benchmarks, can be repeated.")
+    args = parser.parse_args()
+
+    if args.size < 1 or args.repeat < 1:
+        print("size and repeat must be positive", file=sys.stderr)
+        exit(1)
+
+    base = None
+    if args.compare is not None:
+        with open(args.compare) as f:
+            base = json.load(f)
+
+    results = run(size=args.size, seed=args.seed, repeat=args.repeat, only=args.only)
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if base is not None:
+        exit(1 if compare(base, results, threshold=args.threshold) else 0)
+    print_results(results)